@@ -1,18 +1,52 @@
 # app.py
+import time
+_import_started = time.perf_counter()
 import os
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from model_utils import load_model, predict
-from db import SessionLocal, init_db, Detection
+from model_utils import postprocess
+from tta import augment, tta_result, top_labels, calibrate
+from imaging import decode_upload
+from registry import ModelRegistry, MODEL_MANIFEST
+from workers import BoundedExecutor, PoolSaturated, DETECT_RETRY_AFTER
+from cache import ResultCache, content_hash, cache_key
+from db import SessionLocal, AsyncSessionLocal, async_engine, init_db, Detection
+from db_writer import DetectionWriter
+from history import fetch_history, fetch_history_async, InvalidCursor
+from rollups import fetch_stats, fetch_stats_async, InvalidStatsQuery
+from storage import ImageStore, CachedStaticFiles, thumbnail_path
+from jobs import (
+    JobRunner, JobTooLarge, create_job, job_status, job_results, cancel_job,
+    JOB_MAX_UPLOAD_SIZE, TERMINAL as JOB_TERMINAL,
+)
+from sync import (
+    EdgeSync, InvalidChunk, SyncGap, import_chunk, high_water_mark, SYNC_TOKEN, SYNC_MAX_UPLOAD_SIZE,
+)
+from crops import CropTable, recommendation_text
+from fertilizer import FertilizerRecommender
+import metrics
+from metrics import MetricsMiddleware, UPLOAD_SIZE, timed_call, timed_stage
+import profiling
+from uploads import (
+    BodyLimitMiddleware, BufferPool, read_image_upload, check_image,
+    MAX_UPLOAD_SIZE, BATCH_MAX_UPLOAD_SIZE, BATCH_MAX_UNZIPPED_SIZE, MULTIPART_OVERHEAD, IMAGE_EXTENSIONS,
+)
 import shutil
 from datetime import datetime
+from typing import List, Optional
 from PIL import Image
 import io
 import uuid
+import asyncio
+import zipfile
+import zlib
+from contextlib import asynccontextmanager
 import pickle
+import hmac
+import json
 import numpy as np
 
 # Pydantic models for new features
@@ -25,6 +59,10 @@ class CropRecommendation(BaseModel):
     ph: float
     rainfall: float
 
+class CropRecommendationBatch(BaseModel):
+    samples: List[CropRecommendation]
+    top_k: int = 3
+
 class FertilizerRecommendation(BaseModel):
     cropType: str
     soilType: str
@@ -33,159 +71,469 @@ class FertilizerRecommendation(BaseModel):
     potassium: int
     ph: float
 
-app = FastAPI(title="FarmGuard API")
+class FertilizerRecommendationBatch(BaseModel):
+    plots: List[FertilizerRecommendation]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    detection_writer.start()
+    job_runner.start()
+    edge_sync.start()  # only with SYNC_URL set (edge mode)
+    # load + warm the model off the request path; /ready flips once it is done
+    if MODEL_MANIFEST:
+        registry.watch(MODEL_MANIFEST)
+    else:
+        registry.load_async(MODEL_PATH, MODEL_VERSION)
+    yield
+    # drain queued work before the worker exits; unfinished job items stay queued
+    job_runner.stop()
+    edge_sync.stop()
+    detection_writer.stop()
+    registry.stop()
+    executor.shutdown()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+app = FastAPI(title="FarmGuard API", lifespan=lifespan)
+# oversized bodies are refused before multipart parsing spools them
+app.add_middleware(BodyLimitMiddleware, limits={
+    "/detect": MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD,
+    "/detect/batch": BATCH_MAX_UPLOAD_SIZE,
+    "/jobs": JOB_MAX_UPLOAD_SIZE,
+    "/sync/chunks": SYNC_MAX_UPLOAD_SIZE,
+})
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# opt-in (PROFILE_SAMPLE_RATE / PROFILE_SLOW_MS); not installed at all otherwise
+if profiling.enabled():
+    app.add_middleware(profiling.ProfilingMiddleware)
+# outermost, so every route (and the 413/503 shortcuts) is counted
+app.add_middleware(MetricsMiddleware)
 
-# Mount static files for image access
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: PoolSaturated):
+    return JSONResponse(
+        {"detail": "Server busy, retry later"},
+        status_code=503,
+        headers={"Retry-After": str(DETECT_RETRY_AFTER)},
+    )
 
 # Config
 MODEL_PATH = os.getenv("MODEL_PATH", "./model/saved_model")
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-# Load model (at startup)
-model = load_model(MODEL_PATH)
-init_db()
-
-# Crop recommendation data (simplified version - you can enhance this)
-crop_recommendations = {
-    "rice": {"min_temp": 20, "max_temp": 35, "min_rainfall": 100, "optimal_ph": 6.5},
-    "maize": {"min_temp": 18, "max_temp": 32, "min_rainfall": 80, "optimal_ph": 6.0},
-    "wheat": {"min_temp": 15, "max_temp": 25, "min_rainfall": 60, "optimal_ph": 6.5},
-    "cotton": {"min_temp": 25, "max_temp": 40, "min_rainfall": 70, "optimal_ph": 6.0},
-    "tomato": {"min_temp": 20, "max_temp": 30, "min_rainfall": 50, "optimal_ph": 6.5},
-    "potato": {"min_temp": 15, "max_temp": 25, "min_rainfall": 60, "optimal_ph": 5.5},
-    "sugarcane": {"min_temp": 25, "max_temp": 38, "min_rainfall": 120, "optimal_ph": 6.5},
-    "coffee": {"min_temp": 18, "max_temp": 28, "min_rainfall": 100, "optimal_ph": 6.0}
-}
-
-# Fertilizer recommendations (simplified version - you can enhance this)
-fertilizer_recommendations = {
-    "rice": {"npk": "20-20-20", "deficiency": "Balanced NPK", "application": "Apply 250kg/ha at planting"},
-    "maize": {"npk": "15-15-15", "deficiency": "Balanced NPK", "application": "Apply 200kg/ha at planting"},
-    "wheat": {"npk": "18-18-18", "deficiency": "Balanced NPK", "application": "Apply 180kg/ha at planting"},
-    "cotton": {"npk": "25-15-15", "deficiency": "High Nitrogen", "application": "Apply 300kg/ha at planting"},
-    "tomato": {"npk": "20-20-20", "deficiency": "Balanced NPK", "application": "Apply 150kg/ha at planting"},
-    "potato": {"npk": "15-15-15", "deficiency": "Balanced NPK", "application": "Apply 200kg/ha at planting"},
-    "sugarcane": {"npk": "25-15-15", "deficiency": "High Nitrogen", "application": "Apply 400kg/ha at planting"},
-    "coffee": {"npk": "20-20-20", "deficiency": "Balanced NPK", "application": "Apply 250kg/ha at planting"}
-}
-
-def save_image(bytes_, filename):
-    # compress & save as JPEG
-    img = Image.open(io.BytesIO(bytes_)).convert("RGB")
-    path = os.path.join(UPLOAD_DIR, filename)
-    img.save(path, format="JPEG", quality=70, optimize=True)
-    return path
-
-def save_detection_to_db(image_path, label, confidence, advice, source="web"):
-    db = SessionLocal()
-    det = Detection(image_path=image_path, label=label, confidence=confidence, advice=advice, source=source)
-    db.add(det)
-    db.commit()
-    db.refresh(det)
-    db.close()
-    return det.id
-
-def get_crop_recommendation(data: CropRecommendation):
-    """Simple crop recommendation logic - you can enhance this with ML models"""
-    best_crops = []
-    
-    for crop, requirements in crop_recommendations.items():
-        score = 0
-        
-        # Temperature check
-        if requirements["min_temp"] <= data.temperature <= requirements["max_temp"]:
-            score += 3
-        elif abs(data.temperature - (requirements["min_temp"] + requirements["max_temp"])/2) <= 5:
-            score += 2
-        else:
-            score += 1
-            
-        # Rainfall check
-        if data.rainfall >= requirements["min_rainfall"]:
-            score += 2
-            
-        # pH check
-        if abs(data.ph - requirements["optimal_ph"]) <= 1:
-            score += 2
-        elif abs(data.ph - requirements["optimal_ph"]) <= 2:
-            score += 1
-            
-        # N-P-K balance check
-        if data.N >= 50 and data.P >= 30 and data.K >= 30:
-            score += 2
-            
-        best_crops.append((crop, score))
-    
-    # Sort by score and return top recommendation
-    best_crops.sort(key=lambda x: x[1], reverse=True)
-    top_crop = best_crops[0][0].title()
-    
-    return f"{top_crop} is the best crop to be cultivated with your current soil and climate conditions."
+image_store = ImageStore(UPLOAD_DIR)
+
+# Mount static files for image access (content-addressed, so cacheable for a long time)
+app.mount("/uploads", CachedStaticFiles(directory=UPLOAD_DIR), name="uploads")
+CROP_BATCH_MAX_SAMPLES = int(os.getenv("CROP_BATCH_MAX_SAMPLES", 10000))
+FERTILIZER_BATCH_MAX_PLOTS = int(os.getenv("FERTILIZER_BATCH_MAX_PLOTS", 10000))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 100))   # images per /detect/batch call (zip members included)
+
+MODEL_VERSION = os.getenv("MODEL_VERSION")  # default: model dir name + mtime (registry.default_model_version)
+
+# Models are loaded by the lifespan startup, not at import, and can be swapped without a restart (registry.py)
+registry = ModelRegistry()
+model_status = registry.status
+executor = BoundedExecutor()
+# one reusable read buffer per detect slot instead of a fresh allocation per upload
+upload_buffers = BufferPool(executor.max_workers + executor.max_pending, MAX_UPLOAD_SIZE)
+result_cache = ResultCache()
+detection_writer = DetectionWriter()
+edge_sync = EdgeSync()
+
+# queue depths / lag sampled at scrape time
+metrics.gauge("farmguard_inference_queue_depth", "Tensors waiting for the batch scheduler", fn=registry.queue_depth)
+metrics.gauge("farmguard_executor_in_flight", "Jobs running or queued on the detect pool", fn=lambda: executor.stats()["in_flight"])
+metrics.gauge("farmguard_db_write_queue_depth", "Detection rows waiting to be written", fn=lambda: detection_writer.stats()["queue_depth"])
+metrics.gauge("farmguard_db_write_lag_seconds", "Age of the oldest unwritten detection row", fn=lambda: detection_writer.stats()["lag_seconds"])
+metrics.gauge("farmguard_result_cache_hit_ratio", "Result cache hit ratio", fn=lambda: result_cache.stats()["hit_ratio"])
+
+def require_model():
+    if not registry.ready:
+        raise HTTPException(status_code=503, detail=f"Model {model_status['state']}", headers={"Retry-After": "5"})
+
+# Crop requirements table (data/crops.csv, or CROP_TABLE_PATH)
+crop_table = CropTable.from_csv()
+
+# Fertilizer rules (data/fertilizer_rules.csv, or FERTILIZER_RULES_PATH), compiled into an O(1) index
+fertilizer_recommender = FertilizerRecommender.from_csv()
+
+def save_image(decoded, digest):
+    # image + thumbnail come already encoded from imaging.decode_upload; stored under UPLOAD_DIR/ab/cd/
+    return image_store.save(digest, decoded.jpeg_bytes, decoded.thumb_bytes)
+
+def save_detection_to_db(image_path, label, confidence, advice, source="web", model_version=None):
+    # queued; the writer thread bulk-inserts rows on a size/time threshold
+    detection_writer.enqueue(image_path, label, confidence, advice, source=source, model_version=model_version)
+
+CROP_FIELDS = ("N", "P", "K", "temperature", "humidity", "ph", "rainfall")
+
+def crop_samples(samples):
+    """Pydantic samples -> dict of NumPy columns for CropTable"""
+    n = len(samples)
+    return {f: np.fromiter((getattr(x, f) for x in samples), dtype=np.float64, count=n) for f in CROP_FIELDS}
+
+def get_crop_recommendations(samples, top_k=3):
+    """Top-k crops with scores for each sample, scored in one vectorized pass"""
+    return crop_table.recommend(crop_samples(samples), top_k)
+
+def get_crop_recommendation(data: CropRecommendation, top_k=3):
+    """Best crop sentence plus the top-k crops with their scores"""
+    top_crops = get_crop_recommendations([data], top_k)[0]
+    return recommendation_text(top_crops[0]["crop"]), top_crops
 
 def get_fertilizer_recommendation(data: FertilizerRecommendation):
-    """Simple fertilizer recommendation logic - you can enhance this with ML models"""
-    crop_lower = data.cropType.lower()
-    
-    if crop_lower in fertilizer_recommendations:
-        rec = fertilizer_recommendations[crop_lower]
-        return {
-            "fertilizer": rec["npk"],
-            "deficiency": rec["deficiency"],
-            "application": rec["application"]
-        }
-    else:
-        return {
-            "fertilizer": "20-20-20 (Balanced NPK)",
-            "deficiency": "General purpose fertilizer",
-            "application": "Apply 200kg/ha at planting"
-        }
+    """Fertilizer for a crop / soil type / binned N-P-K and pH (memoized lookup)"""
+    return fertilizer_recommender.recommend(
+        data.cropType, data.soilType, data.nitrogen, data.phosphorus, data.potassium, data.ph
+    )
 
 @app.get("/health")
 def health():
     return {"status":"ok", "time": datetime.utcnow().isoformat()}
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: OK only once the model is loaded and warmed up"""
+    body = {"status": model_status["state"], "import_seconds": IMPORT_SECONDS, **model_status}
+    del body["state"]
+    return JSONResponse(body, status_code=200 if registry.ready else 503)
+
+def detection_result(probs, tta=False, top_k=None):
+    """Model output -> result dict; TTA gets averaged, temperature-calibrated probabilities.
+
+    Whenever top_k is returned, `confidence` comes from the same calibrated
+    distribution, so the top label never shows two different numbers.
+    """
+    if tta:
+        return tta_result(probs, top_k or 3)
+    result = postprocess(probs)
+    if top_k:
+        top = top_labels(calibrate(probs), top_k)
+        result.update(confidence=top[0]["confidence"], top_k=top)
+    return result
+
+def submit_inference(slot, decoded, tta):
+    # all images enter the slot's scheduler together so they share forward passes
+    return [
+        None if isinstance(d, Exception) else
+        slot.scheduler.submit_many(augment(d.pixels)) if tta else slot.scheduler.submit(d.pixels)
+        for d in decoded
+    ]
+
+async def run_detections(blobs, tta=False, top_k=None):
+    """Cache lookup -> decode -> batched predict -> store image for each upload.
+
+    With `tta` each image is scored as len(tta.VIEWS) augmented views in one
+    scheduler submission. The whole call uses one model version, picked by the
+    registry (active, or the A/B candidate). Returns one (result, image_path)
+    tuple or Exception per blob, in order.
+    """
+    with registry.use() as slot:
+        if slot is None:
+            require_model()
+        return await detect_with(slot, blobs, tta, top_k)
+
+async def detect_with(slot, blobs, tta, top_k):
+    profiling.annotate(model_version=slot.version, images=len(blobs), tta=tta)
+    out = [None] * len(blobs)
+    todo = []
+    variant = f"{slot.version}:tta={int(tta)}:k={top_k or 0}"
+    for i, contents in enumerate(blobs):
+        # same bytes + same model (+ same options) -> reuse the earlier result and stored image
+        digest = content_hash(contents)
+        key = cache_key(digest, variant)
+        cached = result_cache.get(key)
+        if cached is not None and os.path.exists(cached["image_path"]):
+            out[i] = ({**cached["result"], "model_version": slot.version}, cached["image_path"])
+        else:
+            todo.append((i, digest, key))
+
+    # decode once (off the event loop) into model tensor + stored JPEG, in parallel
+    # without taking more than our share of the pool
+    limit = asyncio.Semaphore(executor.max_workers)
+
+    async def decode(i):
+        async with limit:
+            return await executor.run(timed_call, "decode", decode_upload, blobs[i])
+
+    decoded = await asyncio.gather(*(decode(i) for i, _, _ in todo), return_exceptions=True)
+    futures = submit_inference(slot, decoded, tta)
+    for (i, digest, key), d, fut in zip(todo, decoded, futures):
+        if fut is None:
+            out[i] = d
+            continue
+        try:
+            with timed_stage("inference", shared="batch-scheduler"):  # queue wait + batched forward pass
+                result = detection_result(await asyncio.wrap_future(fut), tta, top_k)
+            result["model_version"] = slot.version
+            # save image, named by content so repeats never add files
+            image_path = await executor.run(timed_call, "save_image", save_image, d, digest)
+        except Exception as e:
+            out[i] = e
+            continue
+        result_cache.put(key, {"result": result, "image_path": image_path})
+        out[i] = (result, image_path)
+    return out
+
+async def run_detection(contents, tta=False, top_k=None):
+    outcome = (await run_detections([contents], tta, top_k))[0]
+    if isinstance(outcome, Exception):
+        raise outcome
+    return outcome
+
 @app.post("/detect")
-async def detect(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
-    # basic checks
-    if file.content_type not in ("image/jpeg","image/png"):
-        raise HTTPException(status_code=400, detail="Only jpeg/png allowed")
-    contents = await file.read()
-    if len(contents) > int(os.getenv("MAX_UPLOAD_SIZE", 3145728)):
-        raise HTTPException(status_code=413, detail="File too large")
-    # predict
-    result = predict(model, contents)
-    # save image in background
-    filename = f"{uuid.uuid4().hex}.jpg"
-    image_path = save_image(contents, filename)
-    background_tasks.add_task(save_detection_to_db, image_path, result["label"], result["confidence"], result["advice"])
+async def detect(file: UploadFile = File(...), tta: bool = False, top_k: Optional[int] = None):
+    """Classify one image; tta=true averages augmented views, top_k adds the k most likely labels"""
+    require_model()
+    buf = upload_buffers.acquire()
+    if buf is None:
+        raise PoolSaturated("no free upload buffer")
+    try:
+        # chunked read: magic bytes / dimensions checked first, aborts once over MAX_UPLOAD_SIZE
+        with timed_stage("upload_read"):
+            contents, _ = await read_image_upload(file, MAX_UPLOAD_SIZE, buf)
+        UPLOAD_SIZE.observe(len(contents))
+        result, image_path = await run_detection(contents, tta, top_k)
+    finally:
+        upload_buffers.release(buf)
+    save_detection_to_db(image_path, result["label"], result["confidence"], result["advice"],
+                         model_version=result["model_version"])
     return JSONResponse({
         "status":"ok",
         "result": result,
         "image_url": image_path,
+        "thumbnail_url": thumbnail_path(image_path),
         "timestamp": datetime.utcnow().isoformat()
     })
 
+def process_job_batch(blobs, tta=False, top_k=None):
+    """Synchronous detect pipeline for job runner threads; inference shares the model schedulers"""
+    decoded = []
+    for contents in blobs:
+        try:
+            decoded.append(decode_upload(contents))
+        except Exception as e:
+            decoded.append(e)
+    out = []
+    with registry.use() as slot:
+        if slot is None:
+            raise RuntimeError("Model not loaded")
+        futures = submit_inference(slot, decoded, tta)
+        for contents, d, fut in zip(blobs, decoded, futures):
+            if fut is None:
+                out.append(d)
+                continue
+            try:
+                result = detection_result(fut.result(), tta, top_k)
+                result["model_version"] = slot.version
+                out.append((result, save_image(d, content_hash(contents))))
+            except Exception as e:
+                out.append(e)
+    return out
+
+def interactive_idle():
+    # job runners only feed the model while /detect leaves spare capacity
+    return registry.ready and registry.queue_depth() == 0 and \
+        executor.stats()["in_flight"] < executor.max_workers
+
+job_runner = JobRunner(process_job_batch, gate=interactive_idle)
+
+# what one bad member can raise: corrupt deflate stream, encrypted, unsupported compression, truncated
+ZIP_MEMBER_ERRORS = (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError, EOFError, OSError)
+
+def expand_zip(contents, max_files=BATCH_MAX_FILES, max_bytes=BATCH_MAX_UNZIPPED_SIZE):
+    """Yield (name, bytes or None, error or None) for the image members of a zip, one member at a time.
+
+    Member count and total declared size are checked against the central directory
+    before anything is inflated; each member then gets the same type and dimension
+    checks as a direct upload.
+    """
+    with zipfile.ZipFile(io.BytesIO(contents)) as zf:
+        members = [
+            info for info in zf.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+            and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if len(members) > max_files:
+            raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_FILES} images per batch")
+        if sum(info.file_size for info in members if info.file_size <= MAX_UPLOAD_SIZE) > max_bytes:
+            raise HTTPException(status_code=413, detail="Zip contents too large")
+        for info in members:
+            if info.file_size > MAX_UPLOAD_SIZE:
+                yield info.filename, None, "File too large"
+                continue
+            try:
+                data = zf.read(info)  # never more than the declared (already checked) size
+            except ZIP_MEMBER_ERRORS as e:
+                yield info.filename, None, f"Could not read zip member: {e}"
+                continue
+            try:
+                check_image(data)
+            except HTTPException as e:
+                yield info.filename, None, e.detail
+            except Exception:
+                yield info.filename, None, "Corrupt or truncated image"
+            else:
+                yield info.filename, data, None
+
+async def collect_batch_files(files):
+    """Flatten uploads (images and zips) into (name, bytes or None, error or None)"""
+    items = []
+    unzipped = 0
+    for f in files:
+        try:
+            contents, content_type = await read_image_upload(f, MAX_UPLOAD_SIZE, zip_limit=BATCH_MAX_UPLOAD_SIZE)
+        except HTTPException as e:
+            items.append((f.filename, None, e.detail))
+            continue
+        if content_type == "application/zip":
+            # limits are what this request has left, so one zip can't use up what another already took
+            members = expand_zip(contents, BATCH_MAX_FILES - len(items), BATCH_MAX_UNZIPPED_SIZE - unzipped)
+            try:
+                members = await executor.run(list, members)
+            except ZIP_MEMBER_ERRORS:
+                items.append((f.filename, None, "Invalid zip archive"))
+                continue
+            for name, data, error in members:
+                items.append((f"{f.filename}/{name}", data, error))
+                unzipped += len(data) if data is not None else 0
+        else:
+            items.append((f.filename, contents, None))
+            UPLOAD_SIZE.observe(len(contents))
+        if len(items) > BATCH_MAX_FILES:
+            raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_FILES} images per batch")
+    return items
+
+@app.post("/detect/batch")
+async def detect_batch(files: List[UploadFile] = File(...), tta: bool = False, top_k: Optional[int] = None):
+    """Detect many images (or zips of images) in one call; each file gets its own result or error"""
+    require_model()
+    items = await collect_batch_files(files)
+    outcomes = iter(await run_detections([data for _, data, error in items if error is None], tta, top_k))
+    results, rows = [], []
+    for name, data, error in items:
+        if error is None:
+            outcome = next(outcomes)
+            if isinstance(outcome, PoolSaturated):
+                error = "Server busy, retry later"
+            elif isinstance(outcome, Exception):
+                error = f"Could not process image: {outcome}"
+            else:
+                result, image_path = outcome
+                results.append({"filename": name, "status": "ok", "result": result, "image_url": image_path,
+                                "thumbnail_url": thumbnail_path(image_path)})
+                rows.append((image_path, result))
+                continue
+        results.append({"filename": name, "status": "error", "error": error})
+    # one bulk insert for the whole batch
+    now = datetime.utcnow()
+    detection_writer.enqueue_rows([
+        {"timestamp": now, "image_path": path, "label": r["label"], "confidence": r["confidence"],
+         "advice": r["advice"], "source": "batch", "model_version": r["model_version"]}
+        for path, r in rows
+    ])
+    return JSONResponse({
+        "status": "ok",
+        "count": len(results),
+        "succeeded": len(rows),
+        "results": results,
+        "timestamp": now.isoformat()
+    })
+
+@app.post("/jobs", status_code=202)
+async def submit_job(files: List[UploadFile] = File(...), tta: bool = False, top_k: Optional[int] = None):
+    """Queue a large detection job (images and/or zips); poll /jobs/{id} or stream /jobs/{id}/events"""
+    options = {"tta": tta, "top_k": top_k}
+    try:
+        return await run_in_threadpool(create_job, [(f.filename, f.file) for f in files], options)
+    except JobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+def with_db(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    status = await run_in_threadpool(with_db, job_status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, interval: float = 1.0):
+    """Server-sent events: a `progress` event whenever the job changes, until it finishes"""
+    if await run_in_threadpool(with_db, job_status, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    interval = min(max(interval, 0.2), 30.0)
+
+    async def stream():
+        last = None
+        while True:
+            status = await run_in_threadpool(with_db, job_status, job_id)
+            if status != last:
+                yield f"event: progress\ndata: {json.dumps(status)}\n\n"
+                last = status
+            if status is None or status["status"] in JOB_TERMINAL:
+                return
+            await asyncio.sleep(interval)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, after: int = 0, limit: int = 100):
+    """Finished items in submission order; pass next_after back as `after` for the next page"""
+    if await run_in_threadpool(with_db, job_status, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await run_in_threadpool(with_db, job_results, job_id, after, min(max(limit, 1), 1000))
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """Cancel the job's pending items (finished results are kept)"""
+    job = await run_in_threadpool(with_db, cancel_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.post("/crop-recommend")
-async def crop_recommend(data: CropRecommendation):
+async def crop_recommend(data: CropRecommendation, top_k: int = 3):
     """Get crop recommendation based on soil and climate data"""
     try:
-        recommendation = get_crop_recommendation(data)
+        recommendation, top_crops = get_crop_recommendation(data, top_k)
         return JSONResponse({
             "status": "ok",
             "recommendation": recommendation,
+            "top_crops": top_crops,
             "timestamp": datetime.utcnow().isoformat()
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting crop recommendation: {str(e)}")
 
+@app.post("/crop-recommend/batch")
+def crop_recommend_batch(data: CropRecommendationBatch):
+    """Score many soil samples in one call (e.g. regional soil-survey imports)"""
+    if len(data.samples) > CROP_BATCH_MAX_SAMPLES:
+        raise HTTPException(status_code=413, detail=f"At most {CROP_BATCH_MAX_SAMPLES} samples per batch")
+    try:
+        results = get_crop_recommendations(data.samples, data.top_k) if data.samples else []
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting crop recommendation: {str(e)}")
+    return {
+        "status": "ok",
+        "count": len(results),
+        "results": [{"recommendation": top[0]["crop"], "top_crops": top} for top in results],
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 @app.post("/fertilizer-recommend")
 async def fertilizer_recommend(data: FertilizerRecommendation):
     """Get fertilizer recommendation based on crop and soil data"""
@@ -196,21 +544,136 @@ async def fertilizer_recommend(data: FertilizerRecommendation):
             "fertilizer": recommendation["fertilizer"],
             "deficiency": recommendation["deficiency"],
             "application": recommendation["application"],
+            "levels": recommendation["levels"],
             "timestamp": datetime.utcnow().isoformat()
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting fertilizer recommendation: {str(e)}")
 
+@app.post("/fertilizer-recommend/batch")
+def fertilizer_recommend_batch(data: FertilizerRecommendationBatch):
+    """Fertilizer recommendations for many plots in one call"""
+    if len(data.plots) > FERTILIZER_BATCH_MAX_PLOTS:
+        raise HTTPException(status_code=413, detail=f"At most {FERTILIZER_BATCH_MAX_PLOTS} plots per batch")
+    try:
+        results = [get_fertilizer_recommendation(plot) for plot in data.plots]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting fertilizer recommendation: {str(e)}")
+    return {
+        "status": "ok",
+        "count": len(results),
+        "results": results,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+def history_sync(*args):
+    db = SessionLocal()
+    try:
+        return fetch_history(db, *args)
+    finally:
+        db.close()
+
 @app.get("/history")
-def history(limit: int = 20):
+async def history(
+    limit: int = 20,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    label: Optional[str] = None,
+    source: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    model_version: Optional[str] = None,
+):
+    """Newest-first detection history; page with the returned next_cursor/prev_cursor"""
+    args = (limit, before, after, label, source, since, until, model_version)
+    try:
+        if AsyncSessionLocal is None:
+            return await run_in_threadpool(history_sync, *args)
+        # async driver: reads don't hold a threadpool slot the detect pipeline needs
+        async with AsyncSessionLocal() as db:
+            return await fetch_history_async(db, *args)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text format; scrape with any local Prometheus/agent"""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+def stats_sync(*args):
     db = SessionLocal()
-    items = db.query(Detection).order_by(Detection.timestamp.desc()).limit(limit).all()
-    out = []
-    for it in items:
-        out.append({
-            "id": it.id, "timestamp": it.timestamp.isoformat(), "label": it.label,
-            "confidence": it.confidence, "advice": it.advice, "image_path": it.image_path
-        })
-    db.close()
-    return {"items": out}
+    try:
+        return fetch_stats(db, *args)
+    finally:
+        db.close()
+
+@app.get("/stats")
+async def stats(
+    bucket: str = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    label: Optional[str] = None,
+    source: Optional[str] = None,
+    group_by: str = "label",
+    model_version: Optional[str] = None,
+):
+    """Detection counts and average confidence per hour/day/week/month (UTC), from the rollup tables"""
+    args = (bucket, since, until, label, source, group_by, model_version)
+    try:
+        if AsyncSessionLocal is None:
+            return await run_in_threadpool(stats_sync, *args)
+        async with AsyncSessionLocal() as db:
+            return await fetch_stats_async(db, *args)
+    except InvalidStatsQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/models")
+def models():
+    """Loaded model versions, A/B split and per-version inference counters"""
+    return registry.stats()
+
+def require_sync_token(request: Request):
+    # fail closed: an instance without SYNC_TOKEN accepts no synced rows at all
+    if not SYNC_TOKEN:
+        raise HTTPException(status_code=403, detail="Sync is disabled on this instance (no SYNC_TOKEN)")
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {SYNC_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid sync token")
+
+@app.get("/sync/origins/{origin}")
+async def sync_origin(origin: str, request: Request):
+    """High-water mark for an edge site: the last of its detection ids held here"""
+    require_sync_token(request)
+    return {"origin": origin, "last_id": await run_in_threadpool(with_db, high_water_mark, origin)}
+
+@app.post("/sync/chunks")
+async def sync_chunk(request: Request):
+    """Import one chunk pushed by an edge site (sync.py push); re-sending a chunk is a no-op"""
+    require_sync_token(request)
+    data = await request.body()
+    try:
+        return await run_in_threadpool(with_db, import_chunk, data, image_store)
+    except InvalidChunk as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SyncGap as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/internal/profile")
+def internal_profile(route: Optional[str] = None, since: Optional[float] = None, top: int = 10):
+    """Summary of the request profiles in PROFILE_PATH (this host's workers)"""
+    return profiling.summary(route=route, since=since, top=min(max(top, 1), 100))
+
+@app.get("/internal/stats")
+def internal_stats():
+    """Runtime counters for tuning (batch scheduler etc.)"""
+    return {
+        "models": registry.stats(),
+        "executor": executor.stats(),
+        "upload_buffers": upload_buffers.stats(),
+        "fertilizer_cache": fertilizer_recommender.stats(),
+        "result_cache": result_cache.stats(),
+        "detection_writer": detection_writer.stats(),
+        "jobs": job_runner.stats(),
+        "sync": edge_sync.stats(),
+    }
 
+IMPORT_SECONDS = time.perf_counter() - _import_started
@@ -0,0 +1,360 @@
+# artifacts.py
+import os
+import json
+import time
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, fine for a single dev process
+    fcntl = None
+
+# Versioned local cache for downloaded model archives:
+#   ARTIFACT_CACHE_DIR/<name>/<version>/<archive>      verified download
+#   ARTIFACT_CACHE_DIR/<name>/<version>/model/         extracted contents (plays the role of ./model)
+#   ARTIFACT_CACHE_DIR/<name>/current                  version the app loads when MODEL_URL is unset
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "./artifacts")
+MODEL_URL = os.getenv("MODEL_URL", "")                  # empty = never download at startup
+MODEL_SHA256 = os.getenv("MODEL_SHA256", "")            # expected archive digest; empty = record, don't check
+MODEL_ARTIFACT_VERSION = os.getenv("MODEL_ARTIFACT_VERSION", "")  # default: archive name from MODEL_URL
+MODEL_DIR = "./model"                                   # what MODEL_PATH is relative to inside an archive
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 4))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 8 * 1024 * 1024))   # bytes per Range request
+DOWNLOAD_BUFFER_SIZE = int(os.getenv("DOWNLOAD_BUFFER_SIZE", 1024 * 1024))     # read / write / hash buffer
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", 3))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 30))
+
+MODEL_ARTIFACT = "model"
+MANIFEST = "manifest.json"
+EXTRACTED = "model"
+
+class ArtifactError(Exception):
+    pass
+
+def sha256_file(path, buffer_size=DOWNLOAD_BUFFER_SIZE):
+    h = hashlib.sha256()
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+def _probe(url, timeout=DOWNLOAD_TIMEOUT):
+    """(size, etag, ranges supported) from a HEAD request; size is None when unknown"""
+    try:
+        r = requests.head(url, allow_redirects=True, timeout=timeout)
+        r.raise_for_status()
+    except requests.RequestException:
+        return None, None, False
+    size = r.headers.get("content-length")
+    ranges = r.headers.get("accept-ranges", "").lower() == "bytes"
+    return (int(size) if size else None), r.headers.get("etag"), ranges
+
+class _Progress:
+    def __init__(self, total, done=0, quiet=False):
+        self.total, self.done, self.quiet = total, done, quiet
+        self._lock = threading.Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.done += n
+            if not self.quiet and self.total:
+                print(f"\rProgress: {self.done / self.total * 100:.1f}%", end="", flush=True)
+
+class Download:
+    """One URL -> file download with Range resume and parallel chunks.
+
+    The file is written as <dest>.part; finished chunks are recorded in <dest>.part.json
+    so an interrupted download (killed container build, dropped connection) only fetches
+    the missing chunks next time. Servers without Range support get one sequential stream.
+    """
+
+    def __init__(self, url, dest, sha256=None, workers=DOWNLOAD_WORKERS, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                 buffer_size=DOWNLOAD_BUFFER_SIZE, retries=DOWNLOAD_RETRIES, timeout=DOWNLOAD_TIMEOUT, quiet=False):
+        self.url, self.dest, self.sha256 = url, dest, (sha256 or "").lower() or None
+        self.workers, self.chunk_size, self.buffer_size = max(1, workers), chunk_size, buffer_size
+        self.retries, self.timeout, self.quiet = retries, timeout, quiet
+        self.part = dest + ".part"
+        self.state_path = self.part + ".json"
+        self._state_lock = threading.Lock()
+
+    def run(self):
+        """Download (or finish downloading) and verify; returns the SHA-256 of the file"""
+        size, etag, ranges = _probe(self.url, self.timeout)
+        if ranges and size:
+            self._parallel(size, etag)
+        else:
+            self._sequential()
+        digest = sha256_file(self.part, self.buffer_size)
+        if self.sha256 and digest != self.sha256:
+            self._discard()
+            raise ArtifactError(f"SHA-256 mismatch for {self.url}: expected {self.sha256}, got {digest}")
+        os.replace(self.part, self.dest)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return digest
+
+    def _discard(self):
+        for path in (self.part, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _load_state(self, size, etag):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        fresh = {"url": self.url, "size": size, "etag": etag, "chunk_size": self.chunk_size, "done": []}
+        if (state is None or not os.path.exists(self.part) or os.path.getsize(self.part) != size
+                or any(state.get(k) != fresh[k] for k in ("url", "size", "etag", "chunk_size"))):
+            # nothing usable to resume from (or the remote file changed): start over
+            with open(self.part, "wb") as f:
+                f.truncate(size)
+            state = fresh
+            self._save_state(state)
+        return state
+
+    def _save_state(self, state):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def _parallel(self, size, etag):
+        state = self._load_state(size, etag)
+        done = set(state["done"])
+        chunks = [(i, start, min(start + self.chunk_size, size) - 1)
+                  for i, start in enumerate(range(0, size, self.chunk_size)) if i not in done]
+        progress = _Progress(size, size - sum(end - start + 1 for _, start, end in chunks), self.quiet)
+
+        def fetch(chunk):
+            index, start, end = chunk
+            for attempt in range(1, self.retries + 1):
+                try:
+                    self._fetch_range(start, end, etag, progress)
+                    break
+                except (requests.RequestException, ArtifactError):
+                    if attempt == self.retries:
+                        raise
+                    time.sleep(min(2 ** attempt, 10))
+            with self._state_lock:
+                state["done"].append(index)
+                self._save_state(state)
+
+        if chunks:
+            with ThreadPoolExecutor(min(self.workers, len(chunks)), thread_name_prefix="download") as pool:
+                list(pool.map(fetch, chunks))
+        if not self.quiet:
+            print()
+
+    def _fetch_range(self, start, end, etag, progress):
+        headers = {"Range": f"bytes={start}-{end}"}
+        if etag:
+            headers["If-Range"] = etag  # a changed file comes back as 200, not a mismatched slice
+        with requests.get(self.url, headers=headers, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise ArtifactError(f"{self.url} ignored the Range request (HTTP {r.status_code})")
+            written = 0
+            with open(self.part, "r+b", buffering=self.buffer_size) as f:
+                f.seek(start)
+                for block in r.iter_content(chunk_size=self.buffer_size):
+                    f.write(block)
+                    written += len(block)
+                    progress.add(len(block))
+        if written != end - start + 1:
+            progress.add(-written)
+            raise ArtifactError(f"short read for bytes {start}-{end} of {self.url}")
+
+    def _sequential(self):
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)  # chunk state is useless without Range support
+        with requests.get(self.url, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            total = int(r.headers.get("content-length", 0))
+            progress = _Progress(total, quiet=self.quiet)
+            with open(self.part, "wb", buffering=self.buffer_size) as f:
+                for block in r.iter_content(chunk_size=self.buffer_size):
+                    f.write(block)
+                    progress.add(len(block))
+        if not self.quiet:
+            print()
+
+def download(url, dest, sha256=None, **kwargs):
+    return Download(url, dest, sha256, **kwargs).run()
+
+def _safe_target(root, name):
+    target = os.path.realpath(os.path.join(root, name))
+    if target != os.path.realpath(root) and not target.startswith(os.path.realpath(root) + os.sep):
+        raise ArtifactError(f"archive member escapes the extraction directory: {name}")
+    return target
+
+def extract(archive, dest, buffer_size=DOWNLOAD_BUFFER_SIZE):
+    """Extract a .zip or .tar(.gz/.bz2/.xz) into `dest`, one member at a time.
+
+    Members are streamed straight to disk (never read whole into memory), into a
+    temporary directory that replaces `dest` only once extraction has finished.
+    """
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as zf:
+                for info in zf.infolist():
+                    target = _safe_target(tmp, info.filename)
+                    if info.is_dir():
+                        os.makedirs(target, exist_ok=True)
+                        continue
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with zf.open(info) as src, open(target, "wb") as out:
+                        shutil.copyfileobj(src, out, buffer_size)
+        elif tarfile.is_tarfile(archive):
+            with tarfile.open(archive, "r|*") as tf:  # stream mode: a single pass over the archive
+                for member in tf:
+                    target = _safe_target(tmp, member.name)
+                    if member.isdir():
+                        os.makedirs(target, exist_ok=True)
+                    elif member.isfile():
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        with tf.extractfile(member) as src, open(target, "wb") as out:
+                            shutil.copyfileobj(src, out, buffer_size)
+                    # links and devices are skipped: a model archive has no business containing them
+        else:
+            raise ArtifactError(f"{archive} is not a zip or tar archive")
+        shutil.rmtree(dest, ignore_errors=True)
+        os.replace(tmp, dest)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return dest
+
+def version_for_url(url):
+    name = os.path.basename(url.split("?", 1)[0].rstrip("/")) or "artifact"
+    for ext in (".zip", ".tar.gz", ".tgz", ".tar"):
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+class _DirLock:
+    """Exclusive lock so gunicorn workers starting together download an artifact once"""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, ".lock")
+
+    def __enter__(self):
+        self._f = open(self.path, "w")
+        if fcntl:
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+
+class ArtifactCache:
+    """Downloaded, verified and extracted artifacts under root/<name>/<version>/"""
+
+    def __init__(self, root=ARTIFACT_CACHE_DIR):
+        self.root = root
+
+    def version_dir(self, name, version):
+        return os.path.join(self.root, name, version)
+
+    def manifest(self, name, version):
+        try:
+            with open(os.path.join(self.version_dir(name, version), MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def lookup(self, name, version, sha256=None):
+        """Extracted directory of a complete cached version (matching sha256 if given), else None"""
+        manifest = self.manifest(name, version)
+        if not manifest or (sha256 and manifest.get("sha256") != sha256.lower()):
+            return None
+        path = os.path.join(self.version_dir(name, version), EXTRACTED)
+        return path if os.path.isdir(path) else None
+
+    def current(self, name):
+        """Extracted directory of the version last marked current, else None"""
+        try:
+            with open(os.path.join(self.root, name, "current")) as f:
+                version = f.read().strip()
+        except OSError:
+            return None
+        return self.lookup(name, version) if version else None
+
+    def set_current(self, name, version):
+        path = os.path.join(self.root, name, "current")
+        with open(path + ".tmp", "w") as f:
+            f.write(version)
+        os.replace(path + ".tmp", path)
+
+    def fetch(self, url, version=None, sha256=None, name=MODEL_ARTIFACT, keep_archive=True, **download_kwargs):
+        """Extracted directory for `url`, downloading and extracting only if it is not cached yet"""
+        version = version or version_for_url(url)
+        cached = self.lookup(name, version, sha256)
+        if cached:
+            return cached
+        vdir = self.version_dir(name, version)
+        os.makedirs(vdir, exist_ok=True)
+        with _DirLock(vdir):
+            cached = self.lookup(name, version, sha256)  # another process may have finished meanwhile
+            if cached:
+                return cached
+            archive = os.path.join(vdir, os.path.basename(url.split("?", 1)[0].rstrip("/")) or "archive")
+            digest = sha256_file(archive) if os.path.exists(archive) else None  # extraction didn't finish last time
+            if digest is None or (sha256 and digest != sha256.lower()):
+                started = time.perf_counter()
+                print(f"Downloading {url} ...")
+                digest = download(url, archive, sha256, **download_kwargs)
+                print(f"✅ Downloaded {os.path.getsize(archive) / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s")
+            extract(archive, os.path.join(vdir, EXTRACTED))
+            if not keep_archive:
+                os.remove(archive)
+            manifest = {"url": url, "version": version, "sha256": digest, "fetched_at": time.time()}
+            with open(os.path.join(vdir, MANIFEST + ".tmp"), "w") as f:
+                json.dump(manifest, f)
+            os.replace(os.path.join(vdir, MANIFEST + ".tmp"), os.path.join(vdir, MANIFEST))  # marks it complete
+        return os.path.join(vdir, EXTRACTED)
+
+def _path_in_artifact(model_path, extracted):
+    # MODEL_PATH is written relative to ./model (where download_model.py used to unzip)
+    rel = os.path.relpath(os.path.normpath(model_path), os.path.normpath(MODEL_DIR))
+    if rel.startswith(os.pardir):
+        rel = os.path.basename(os.path.normpath(model_path))
+    return os.path.normpath(os.path.join(extracted, rel))
+
+def resolve_model_path(model_path, url=MODEL_URL, version=MODEL_ARTIFACT_VERSION, sha256=MODEL_SHA256, cache=None):
+    """Where to load MODEL_PATH from: the path itself if it exists, else the artifact cache.
+
+    With MODEL_URL set the archive is downloaded into the cache first (once; later
+    starts reuse it). Without it, the version download_model.py marked current is used.
+    """
+    if os.path.exists(model_path):
+        return model_path
+    cache = cache or ArtifactCache()
+    if url:
+        try:
+            extracted = cache.fetch(url, version or None, sha256 or None)
+        except Exception as e:
+            print(f"❌ Could not fetch model artifact: {e}")
+            return model_path  # load_model falls back as if the model were missing
+    else:
+        extracted = cache.current(MODEL_ARTIFACT)
+    if extracted is None:
+        return model_path
+    return _path_in_artifact(model_path, extracted)
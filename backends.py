@@ -0,0 +1,216 @@
+# backends.py
+import os
+import time
+import threading
+import numpy as np
+from model_utils import IMG_SIZE, load_keras_model, create_fallback_model
+
+# Inference backend: keras | savedmodel | tflite | onnx | remote (empty = pick from MODEL_PATH extension)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "")
+INFERENCE_CONNECT_TIMEOUT = float(os.getenv("INFERENCE_CONNECT_TIMEOUT", 120))  # seconds to wait for the server
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", os.cpu_count() or 1))  # TFLite/XNNPACK and ONNX Runtime
+# keras/savedmodel: take uint8 pixels and do the /255 inside a traced graph in front of the model
+MODEL_INPUT_UINT8 = os.getenv("MODEL_INPUT_UINT8", "0").lower() in ("1", "true", "yes")
+
+def backend_for_path(path):
+    ext = os.path.splitext(path.rstrip("/"))[1].lower()
+    if ext == ".tflite":
+        return "tflite"
+    if ext == ".onnx":
+        return "onnx"
+    return "keras"
+
+def _uint8_graph(fn):
+    """tf.function taking a uint8 (N, H, W, 3) batch, normalizing it in-graph and calling fn on the float32 result"""
+    import tensorflow as tf
+    spec = tf.TensorSpec([None, *IMG_SIZE, 3], tf.uint8)
+    return tf.function(lambda x: fn(tf.cast(x, tf.float32) / 255.0), input_signature=[spec])
+
+class KerasBackend:
+    """In-memory tf.keras model; calls the model directly to skip model.predict's per-call setup"""
+    name = "keras"
+
+    def __init__(self, model, uint8_input=MODEL_INPUT_UINT8):
+        self.model = model
+        self.input_dtype = np.uint8 if uint8_input else np.float32
+        if uint8_input:
+            self._uint8_fn = _uint8_graph(lambda x: model(x, training=False))
+
+    def predict(self, batch):
+        if batch.dtype == np.uint8 and self.input_dtype == np.uint8:
+            return self._uint8_fn(batch).numpy()
+        return np.asarray(self.model(batch, training=False))
+
+class SavedModelBackend:
+    """TF SavedModel served through its serving_default signature"""
+    name = "savedmodel"
+
+    def __init__(self, path, uint8_input=MODEL_INPUT_UINT8):
+        import tensorflow as tf
+        self._tf = tf
+        self._loaded = tf.saved_model.load(path)
+        self._fn = self._loaded.signatures["serving_default"]
+        self._input_name = next(iter(self._fn.structured_input_signature[1]))
+        self._output_name = sorted(self._fn.structured_outputs)[0]
+        self.input_dtype = np.uint8 if uint8_input else np.float32
+        if uint8_input:
+            self._uint8_fn = _uint8_graph(lambda x: self._fn(**{self._input_name: x})[self._output_name])
+
+    def predict(self, batch):
+        if batch.dtype == np.uint8 and self.input_dtype == np.uint8:
+            return self._uint8_fn(batch).numpy()
+        out = self._fn(**{self._input_name: self._tf.constant(batch, dtype=self._tf.float32)})
+        return out[self._output_name].numpy()
+
+def _tflite_interpreter_class():
+    # tflite-runtime / LiteRT are much smaller than TensorFlow; fall back to the copy bundled with TF
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+class TFLiteBackend:
+    """TFLite interpreter (XNNPACK on CPU); handles float, float16 and int8-quantized models"""
+    name = "tflite"
+
+    def __init__(self, path, num_threads=INFERENCE_THREADS):
+        Interpreter = _tflite_interpreter_class()
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch = int(self._input["shape"][0])
+        # a uint8 input quantized as pixel / 255 takes raw pixels, no requantizing on our side
+        scale, zero_point = self._input["quantization"]
+        pixel_input = self._input["dtype"] == np.uint8 and zero_point == 0 and abs(scale * 255.0 - 1.0) < 1e-6
+        self.input_dtype = np.uint8 if pixel_input else np.float32
+
+    def _resize(self, n):
+        if n != self._batch:
+            self.interpreter.resize_tensor_input(self._input["index"], [n, *self._input["shape"][1:]])
+            self.interpreter.allocate_tensors()
+            self._input = self.interpreter.get_input_details()[0]
+            self._output = self.interpreter.get_output_details()[0]
+            self._batch = n
+
+    def predict(self, batch):
+        self._resize(len(batch))
+        dtype = self._input["dtype"]
+        if dtype in (np.int8, np.uint8) and not (batch.dtype == np.uint8 and self.input_dtype == np.uint8):
+            scale, zero_point = self._input["quantization"]
+            batch = np.clip(np.round(batch / scale + zero_point), np.iinfo(dtype).min, np.iinfo(dtype).max)
+        self.interpreter.set_tensor(self._input["index"], batch.astype(dtype, copy=False))
+        self.interpreter.invoke()
+        out = self.interpreter.get_tensor(self._output["index"])
+        if self._output["dtype"] in (np.int8, np.uint8):
+            scale, zero_point = self._output["quantization"]
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+class OnnxBackend:
+    """ONNX Runtime CPU session"""
+    name = "onnx"
+
+    def __init__(self, path, num_threads=INFERENCE_THREADS):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = num_threads
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        return self.session.run(None, {self._input_name: batch.astype(np.float32, copy=False)})[0]
+
+class RemoteBackend:
+    """Sends batches to inference_server.py over a Unix socket; this process never loads the model"""
+    name = "remote"
+    input_dtype = np.uint8  # pixels go over the socket (4x smaller); the server's scheduler normalizes them
+
+    def __init__(self, socket_path=None, connect_timeout=INFERENCE_CONNECT_TIMEOUT):
+        from inference_server import INFERENCE_SOCKET
+        self.socket_path = socket_path or INFERENCE_SOCKET
+        self._local = threading.local()  # one connection (and receive buffer) per calling thread
+        # block until the server is up so /ready only flips once inference works
+        deadline = time.monotonic() + connect_timeout
+        while True:
+            try:
+                self._conn()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+    def _conn(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            from inference_server import connect
+            sock = self._local.sock = connect(self.socket_path)
+            self._local.buf = None
+        return sock
+
+    def predict(self, batch):
+        from inference_server import send_array, recv_array, RemoteInferenceError
+        for attempt in (1, 2):
+            sock = self._conn()
+            try:
+                send_array(sock, batch)
+                probs, self._local.buf = recv_array(sock, self._local.buf)
+                return probs.copy()  # the receive buffer is reused by the next call
+            except RemoteInferenceError:
+                raise
+            except OSError:
+                # server restarted: reconnect once
+                sock.close()
+                self._local.sock = None
+                if attempt == 2:
+                    raise
+
+def load_backend(path, kind=None, fallback=True):
+    """Load MODEL_PATH with the requested backend; every backend exposes predict(batch) -> probs.
+
+    With `fallback` a missing or unloadable model becomes the untrained fallback CNN
+    (first boot, so the API still answers); without it the error is raised.
+    """
+    kind = (kind or MODEL_BACKEND or backend_for_path(path)).lower()
+    if kind == "remote":
+        print("Using remote inference server")
+        return RemoteBackend()
+    from artifacts import resolve_model_path
+    path = resolve_model_path(path)  # not on disk: use (or download into) the artifact cache
+    if kind in ("tflite", "onnx"):
+        if not os.path.exists(path):
+            print(f"Model not found at {path}")
+            if not fallback:
+                raise FileNotFoundError(path)
+            print("Creating fallback model...")
+            return KerasBackend(create_fallback_model())
+        print(f"Loading {kind} model from {path}")
+        return TFLiteBackend(path) if kind == "tflite" else OnnxBackend(path)
+    if kind not in ("keras", "savedmodel"):
+        raise ValueError(f"Unknown MODEL_BACKEND: {kind}")
+
+    if os.path.isfile(os.path.join(path, "saved_model.pb")):
+        if kind == "keras":
+            try:
+                return KerasBackend(load_keras_model(path, fallback=False))
+            except Exception as e:
+                print(f"Keras could not load {path} ({e}), using its serving signature")
+        try:
+            return SavedModelBackend(path)
+        except Exception as e:
+            print(f"Error loading SavedModel: {e}")
+            if not fallback:
+                raise
+            print("Creating fallback model...")
+            return KerasBackend(create_fallback_model())
+    return KerasBackend(load_keras_model(path, fallback=fallback))
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+FarmGuard benchmark / load test
+
+    python benchmark.py                                        # in-process (TestClient), default backend
+    python benchmark.py --mode http --concurrency 1,8,32       # against a local uvicorn it starts
+    python benchmark.py --url http://127.0.0.1:8000            # against a server that is already running
+    python benchmark.py --backends keras,tflite:./model/model_int8.tflite --out bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.2  # exit 1 on regressions
+
+Runs /detect (and /detect/batch), /crop-recommend, /fertilizer-recommend and /history
+at every concurrency level x batch size, plus raw model.predict per backend, and
+reports p50/p95/p99 latency and throughput. Images come from the real JPEGs in
+test_images/; other payloads use a fixed seed, so runs are comparable. Each backend
+gets a fresh process, a throwaway database and upload dir, and the result cache
+is off (the corpus is small and would otherwise be served from cache).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+SCENARIOS = ("predict", "detect", "crop", "fertilizer", "history")
+FERTILIZER_CROPS = ("rice", "wheat", "maize", "cotton", "tomato", "potato", "sugarcane", "coffee", "barley")
+FERTILIZER_SOILS = ("clay", "sandy", "loamy", "black", "red")
+
+def load_corpus(image_dir="./test_images"):
+    """Bytes of every real JPEG in image_dir (files that only carry a .jpg name are skipped)"""
+    blobs = []
+    for path in sorted(Path(image_dir).glob("*")):
+        if path.suffix.lower() in (".jpg", ".jpeg"):
+            data = path.read_bytes()
+            if data.startswith(JPEG_MAGIC):
+                blobs.append(data)
+    return blobs
+
+def summarize(latencies, elapsed, errors=0, rejected=0, items=None):
+    """Latency percentiles (ms) and throughput for one run"""
+    lat = np.asarray(latencies, dtype=np.float64) * 1000.0
+    n = len(lat)
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if n else (0.0, 0.0, 0.0)
+    return {
+        "requests": n,
+        "errors": errors,
+        "rejected": rejected,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(lat.mean()), 3) if n else 0.0,
+        "max_ms": round(float(lat.max()), 3) if n else 0.0,
+        "throughput_rps": round(n / elapsed, 3) if elapsed else 0.0,
+        "items_per_s": round((items if items is not None else n) / elapsed, 3) if elapsed else 0.0,
+    }
+
+def run_load(call, total, concurrency):
+    """call(i) -> HTTP status, `total` times from `concurrency` threads"""
+    latencies, statuses = [0.0] * total, [0] * total
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            statuses[i] = call(i)
+        except Exception:
+            statuses[i] = -1
+        latencies[i] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    rejected = statuses.count(503)
+    errors = sum(s != 200 for s in statuses) - rejected
+    return summarize(latencies, elapsed, errors, rejected)
+
+def bench_predict(model, corpus, batch_sizes=(1,), rounds=20):
+    """Raw backend forward passes (no HTTP, no scheduler) per batch size"""
+    from model_utils import preprocess_image_bytes
+    tensors = [preprocess_image_bytes(b) for b in corpus]
+    results = []
+    for bs in batch_sizes:
+        batch = np.concatenate([tensors[i % len(tensors)] for i in range(bs)])
+        model.predict(batch)  # first call per shape builds/resizes the graph
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(rounds):
+            t = time.perf_counter()
+            model.predict(batch)
+            latencies.append(time.perf_counter() - t)
+        results.append({"batch_size": bs, **summarize(latencies, time.perf_counter() - started, items=rounds * bs)})
+    return results
+
+# --- clients ---
+
+class HttpClient:
+    """requests.Session per thread against base_url"""
+
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def get(self, path, **kwargs):
+        return self._session().get(self.base_url + path, timeout=self.timeout, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self._session().post(self.base_url + path, timeout=self.timeout, **kwargs)
+
+def wait_ready(client, timeout, proc=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            if client.get("/ready").status_code == 200:
+                return
+        except Exception:
+            pass  # not listening yet
+        time.sleep(0.25)
+    raise RuntimeError(f"server not ready after {timeout}s")
+
+# --- scenarios ---
+
+def crop_payload(rng):
+    return {
+        "N": rng.randint(0, 140), "P": rng.randint(5, 145), "K": rng.randint(5, 205),
+        "temperature": round(rng.uniform(8, 44), 1), "humidity": round(rng.uniform(14, 100), 1),
+        "ph": round(rng.uniform(3.5, 9.9), 2), "rainfall": round(rng.uniform(20, 300), 1),
+    }
+
+def fertilizer_payload(rng):
+    return {
+        "cropType": rng.choice(FERTILIZER_CROPS), "soilType": rng.choice(FERTILIZER_SOILS),
+        "nitrogen": rng.randint(0, 150), "phosphorus": rng.randint(0, 80),
+        "potassium": rng.randint(0, 80), "ph": round(rng.uniform(4.0, 9.0), 2),
+    }
+
+def scenario_call(client, scenario, batch_size, corpus, rng):
+    """Build call(i) for one scenario; returns None if the combination doesn't apply"""
+    if scenario == "detect":
+        if batch_size == 1:
+            return lambda i: client.post(
+                "/detect", files={"file": (f"{i}.jpg", corpus[i % len(corpus)], "image/jpeg")}).status_code
+        return lambda i: client.post("/detect/batch", files=[
+            ("files", (f"{i}-{j}.jpg", corpus[(i * batch_size + j) % len(corpus)], "image/jpeg"))
+            for j in range(batch_size)
+        ]).status_code
+    if scenario in ("crop", "fertilizer"):
+        make = crop_payload if scenario == "crop" else fertilizer_payload
+        payloads = [make(rng) for _ in range(256 * batch_size)]
+        if batch_size == 1:
+            path = "/crop-recommend" if scenario == "crop" else "/fertilizer-recommend"
+            return lambda i: client.post(path, json=payloads[i % len(payloads)]).status_code
+        path, key = ("/crop-recommend/batch", "samples") if scenario == "crop" else ("/fertilizer-recommend/batch", "plots")
+        return lambda i: client.post(path, json={key: [
+            payloads[(i * batch_size + j) % len(payloads)] for j in range(batch_size)
+        ]}).status_code
+    if scenario == "history" and batch_size == 1:
+        return lambda i: client.get("/history", params={"limit": 20}).status_code
+    return None
+
+def run_scenarios(client, args, backend, mode, corpus, model=None):
+    rng = random.Random(args.seed)
+    results = []
+    for scenario in args.scenarios:
+        if scenario == "predict":
+            if model is not None:
+                for r in bench_predict(model, corpus, args.batch_sizes, args.predict_rounds):
+                    results.append({"backend": backend, "mode": mode, "scenario": "predict", "concurrency": 1, **r})
+                    report(results[-1])
+            continue
+        for batch_size in args.batch_sizes:
+            call = scenario_call(client, scenario, batch_size, corpus, rng)
+            if call is None:
+                continue
+            for concurrency in args.concurrency:
+                total = max(concurrency, args.requests // batch_size)
+                if args.warmup:
+                    run_load(call, args.warmup, concurrency)
+                r = run_load(call, total, concurrency)
+                r["items_per_s"] = round(r["throughput_rps"] * batch_size, 3)
+                results.append({"backend": backend, "mode": mode, "scenario": scenario,
+                                "concurrency": concurrency, "batch_size": batch_size, **r})
+                report(results[-1])
+    return results
+
+def report(r):
+    print(f"   {r['backend']:<12} {r['scenario']:<10} c={r['concurrency']:<3} b={r['batch_size']:<3} "
+          f"p50 {r['p50_ms']:8.2f}ms  p95 {r['p95_ms']:8.2f}ms  p99 {r['p99_ms']:8.2f}ms  "
+          f"{r['throughput_rps']:8.1f} req/s  {r['items_per_s']:8.1f} items/s"
+          + (f"  errors {r['errors']}" if r["errors"] else "") + (f"  503s {r['rejected']}" if r["rejected"] else ""))
+    sys.stdout.flush()
+
+# --- per-backend runs ---
+
+def backend_env(spec, workdir, cache):
+    """Environment for one backend spec ("kind" or "kind:model_path")"""
+    kind, _, path = spec.partition(":")
+    env = {
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    }
+    if kind and kind != "default":
+        env["MODEL_BACKEND"] = kind
+    if path:
+        env["MODEL_PATH"] = path
+    if not cache:
+        env.update(RESULT_CACHE_SIZE="0", RESULT_CACHE_DIR="")
+    return env
+
+def run_inprocess(spec, args, corpus):
+    """Benchmark one backend inside this process (app reads its config at import)"""
+    workdir = tempfile.mkdtemp(prefix="farmguard-bench-")
+    os.environ.update(backend_env(spec, workdir, args.cache))
+    from fastapi.testclient import TestClient
+    import app as farmguard
+    with TestClient(farmguard.app) as client:
+        wait_ready(client, args.ready_timeout)
+        return run_scenarios(client, args, spec, "inprocess", corpus, farmguard.registry.active.model)
+
+def run_http(spec, args, corpus):
+    """Benchmark one backend over a uvicorn server started for it"""
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    workdir = tempfile.mkdtemp(prefix="farmguard-bench-")
+    env = {**os.environ, **backend_env(spec, workdir, args.cache)}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    try:
+        client = HttpClient(f"http://127.0.0.1:{port}")
+        wait_ready(client, args.ready_timeout, proc)
+        return run_scenarios(client, args, spec, "http", corpus)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def run_child(spec, args):
+    """In-process runs of several backends each need a fresh interpreter"""
+    fd, out = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    argv = [
+        sys.executable, os.path.abspath(__file__), "--mode", "inprocess", "--backends", spec, "--out", out,
+        "--concurrency", ",".join(map(str, args.concurrency)), "--batch-sizes", ",".join(map(str, args.batch_sizes)),
+        "--scenarios", ",".join(args.scenarios), "--requests", str(args.requests), "--warmup", str(args.warmup),
+        "--predict-rounds", str(args.predict_rounds), "--seed", str(args.seed), "--images", args.images,
+        "--ready-timeout", str(args.ready_timeout),
+    ] + (["--cache"] if args.cache else [])
+    try:
+        subprocess.run(argv, check=True)
+        with open(out) as f:
+            return json.load(f)["results"]
+    finally:
+        os.remove(out)
+
+# --- results ---
+
+def environment(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "cache": args.cache,
+    }
+
+def result_key(r):
+    return (r["backend"], r["mode"], r["scenario"], r["concurrency"], r["batch_size"])
+
+def compare(results, baseline, tolerance):
+    """Regressions vs a previous run: p95 up or throughput down by more than `tolerance`, or new errors"""
+    previous = {result_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        b = previous.get(result_key(r))
+        if b is None:
+            continue
+        name = f"{r['backend']} {r['mode']} {r['scenario']} c={r['concurrency']} b={r['batch_size']}"
+        if b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {b['p95_ms']:.2f}ms -> {r['p95_ms']:.2f}ms")
+        if r["throughput_rps"] < b["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {b['throughput_rps']:.1f} -> {r['throughput_rps']:.1f} req/s")
+        if r["errors"] > b["errors"]:
+            regressions.append(f"{name}: errors {b['errors']} -> {r['errors']}")
+    return regressions
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency / throughput benchmark for the FarmGuard API")
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--url", help="benchmark an already running server instead (implies --mode http)")
+    parser.add_argument("--backends", default="default",
+                        help='comma separated "kind" or "kind:model_path" (kind: keras|savedmodel|tflite|onnx|remote|default)')
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), type=lambda v: [s for s in v.split(",") if s])
+    parser.add_argument("--concurrency", default="1,4,16", type=int_list)
+    parser.add_argument("--batch-sizes", default="1,8", type=int_list)
+    parser.add_argument("--requests", type=int, default=100, help="requests per run (divided by the batch size)")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests before each run")
+    parser.add_argument("--predict-rounds", type=int, default=20)
+    parser.add_argument("--images", default="./test_images")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--cache", action="store_true", help="keep the result cache on")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="previous --out file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    corpus = load_corpus(args.images)
+    if not corpus:
+        parser.error(f"no JPEG images in {args.images}")
+    backends = [b for b in args.backends.split(",") if b]
+
+    print(f"🏁 FarmGuard benchmark: {len(corpus)} images, backends {', '.join(backends)}")
+    results = []
+    if args.url:
+        client = HttpClient(args.url)
+        wait_ready(client, args.ready_timeout)
+        results = run_scenarios(client, args, "external", "http", corpus)
+    elif args.mode == "http":
+        for spec in backends:
+            results += run_http(spec, args, corpus)
+    elif len(backends) == 1:
+        results = run_inprocess(backends[0], args, corpus)
+    else:
+        for spec in backends:
+            results += run_child(spec, args)
+
+    with open(args.out, "w") as f:
+        json.dump({"environment": environment(args), "results": results}, f, indent=2)
+    print(f"✅ Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) vs {args.baseline}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"✅ No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Result cache for repeated uploads, keyed by content hash + model version
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 1024))     # entries kept in memory
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 86400))    # seconds
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")               # empty = memory tier only
+RESULT_CACHE_DISK_MAX_FILES = int(os.getenv("RESULT_CACHE_DISK_MAX_FILES", 100000))  # oldest pruned beyond this
+DISK_TMP_MAX_AGE = 3600  # seconds before a leftover .tmp from a crashed writer is removed
+
+def content_hash(bytes_):
+    return hashlib.sha256(bytes_).hexdigest()
+
+def cache_key(digest, model_version):
+    return f"{model_version}:{digest}"
+
+class ResultCache:
+    """LRU + TTL in-memory cache with an optional JSON-file disk tier.
+
+    The disk tier is shared by every process pointed at `disk_dir`. Expired files are
+    removed when read, and every `disk_max_files // 10` puts the directory is pruned
+    back to `disk_max_files`, oldest mtime first.
+    """
+
+    def __init__(self, max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, disk_dir=RESULT_CACHE_DIR,
+                 disk_max_files=RESULT_CACHE_DISK_MAX_FILES):
+        self.max_size = max(0, int(max_size))
+        self.ttl = float(ttl)
+        self.disk_dir = disk_dir or None
+        self.disk_max_files = max(1, int(disk_max_files))
+        self._items = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._disk_puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self.prune_disk()  # a restart may follow a run that overfilled it
+
+    def _disk_path(self, key):
+        # keys contain the model version, which may hold characters unsafe for filenames
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def _expired(self, stored_at):
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._items[key]
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._put_memory(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put_memory(key, value)
+        self._disk_put(key, value)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    def _put_memory(self, key, value):
+        if self.max_size == 0:
+            return
+        self._items[key] = (time.time(), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            entry = {"key": key}  # unreadable: drop it below
+        if entry.get("key") != key:
+            return None
+        if "value" not in entry or self._expired(entry.get("stored_at", 0)):
+            self._remove(path)
+            return None
+        return entry["value"]
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # unique across processes sharing disk_dir
+        with open(tmp, "w") as f:
+            json.dump({"key": key, "stored_at": time.time(), "value": value}, f)
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_puts += 1
+            due = self._disk_puts % max(1, self.disk_max_files // 10) == 0
+        if due:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Remove expired entries, then the oldest until at most disk_max_files remain; returns the count removed"""
+        if not self.disk_dir:
+            return 0
+        now = time.time()
+        entries, removed = [], 0
+        with os.scandir(self.disk_dir) as it:
+            for e in it:
+                try:
+                    mtime = e.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if e.name.endswith(".tmp"):
+                    if now - mtime > DISK_TMP_MAX_AGE:
+                        removed += self._remove(e.path)
+                elif e.name.endswith(".json"):
+                    # files are never rewritten in place, so mtime is when the entry was stored
+                    if self.ttl > 0 and now - mtime > self.ttl:
+                        removed += self._remove(e.path)
+                    else:
+                        entries.append((mtime, e.path))
+        if len(entries) > self.disk_max_files:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.disk_max_files]:
+                removed += self._remove(path)
+        with self._lock:
+            self.disk_evictions += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "disk": bool(self.disk_dir),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Retention and compaction for stored upload images
+
+    python compact_storage.py --dry-run                  # report what would be removed
+    python compact_storage.py                            # remove files no detection references
+    python compact_storage.py --retention-days 90        # drop detections older than 90 days first
+    python compact_storage.py --migrate                  # move legacy flat uploads into ab/cd/ shards
+
+Orphans are files under UPLOAD_DIR (images, thumbnails, leftover .tmp files) that
+no detections.image_path points at. Files younger than --min-age are left alone,
+because their rows may still be waiting in the app's write-behind queue.
+Run it from the app's working directory so relative image paths resolve the same way.
+"""
+
+import os
+import io
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete
+from db import SessionLocal, Detection, init_db
+from cache import content_hash
+from imaging import encode_jpeg, STORE_THUMB_DIM
+from storage import ImageStore, UPLOAD_DIR, is_sharded
+
+def apply_retention(db, days, dry_run=False):
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    if dry_run:
+        return db.query(Detection).filter(Detection.timestamp < cutoff).count()
+    result = db.execute(delete(Detection).where(Detection.timestamp < cutoff))
+    db.commit()
+    return result.rowcount
+
+def migrate_legacy(db, store, dry_run=False):
+    """Re-home flat UPLOAD_DIR/<uuid>.jpg files as content-addressed shards with thumbnails"""
+    from PIL import Image
+    moved = 0
+    for (old,) in db.execute(select(Detection.image_path).distinct()).all():
+        if not old or is_sharded(old) or not os.path.isfile(old):
+            continue
+        with open(old, "rb") as f:
+            data = f.read()
+        try:
+            thumb = encode_jpeg(Image.open(io.BytesIO(data)).convert("RGB"), STORE_THUMB_DIM)
+        except Exception as e:
+            print(f"   skipping {old}: {e}")
+            continue
+        moved += 1
+        if dry_run:
+            continue
+        new = store.save(content_hash(data), data, thumb)
+        db.execute(update(Detection).where(Detection.image_path == old).values(image_path=new))
+        db.commit()
+        os.remove(old)
+    return moved
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove orphaned upload files and apply history retention")
+    parser.add_argument("--upload-dir", default=UPLOAD_DIR)
+    parser.add_argument("--retention-days", type=int, help="delete detections older than this first")
+    parser.add_argument("--min-age", type=float, default=3600, help="seconds; younger files are never removed")
+    parser.add_argument("--migrate", action="store_true", help="move legacy flat uploads into the sharded layout")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    init_db()
+    store = ImageStore(args.upload_dir)
+    db = SessionLocal()
+    try:
+        if args.retention_days is not None:
+            n = apply_retention(db, args.retention_days, args.dry_run)
+            print(f"🗑️  {n} detections older than {args.retention_days} days")
+        if args.migrate:
+            print(f"📦 {migrate_legacy(db, store, args.dry_run)} legacy uploads moved into shards")
+        referenced = {p for (p,) in db.execute(select(Detection.image_path).distinct()) if p}
+    finally:
+        db.close()
+
+    removed = freed = 0
+    for path in store.find_orphans(referenced, args.min_age):
+        try:
+            size = os.path.getsize(path)
+            if not args.dry_run:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        freed += size
+    dirs = 0 if args.dry_run else store.remove_empty_dirs()
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"✅ {verb} {removed} orphaned files ({freed / 1e6:.1f} MB), {dirs} empty directories")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Export the FarmGuard Keras model to lighter inference formats
+
+    python convert_model.py --format tflite --quantize int8 --out ./model/model_int8.tflite
+    python convert_model.py --format tflite --quantize float16 --out ./model/model_fp16.tflite
+    python convert_model.py --format onnx --out ./model/model.onnx      # needs tf2onnx
+    python convert_model.py --format savedmodel --out ./model/exported
+
+Point MODEL_PATH at the output to serve it (see backends.py).
+"""
+
+import os
+import argparse
+import numpy as np
+from pathlib import Path
+from model_utils import IMG_SIZE, load_keras_model, preprocess_image_bytes
+
+def calibration_batches(image_dir, limit=100):
+    """Representative inputs for int8 calibration: real photos if available, else noise"""
+    count = 0
+    for path in sorted(Path(image_dir).glob("*")) if image_dir else []:
+        if count >= limit:
+            return
+        try:
+            x = preprocess_image_bytes(path.read_bytes())
+        except Exception:
+            continue  # not an image
+        count += 1
+        yield x
+    if count == 0:
+        for _ in range(min(limit, 20)):
+            yield np.random.random((1, *IMG_SIZE, 3)).astype("float32")
+
+def to_tflite(model, out, quantize="none", calibration_dir=None):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([x] for x in calibration_batches(calibration_dir))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    with open(out, "wb") as f:
+        f.write(converter.convert())
+
+def to_onnx(model, out):
+    import tensorflow as tf
+    import tf2onnx
+    spec = [tf.TensorSpec((None, *IMG_SIZE, 3), tf.float32, name="input")]
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=out)
+
+def to_savedmodel(model, out):
+    import tensorflow as tf
+    if hasattr(model, "export"):
+        model.export(out)  # Keras 3
+    else:
+        tf.saved_model.save(model, out)
+
+def verify(model, out):
+    """Compare the exported model against Keras on a small batch"""
+    from backends import load_backend, backend_for_path
+    kind = "savedmodel" if os.path.isdir(out) else backend_for_path(out)
+    exported = load_backend(out, kind, fallback=False)
+    x = np.random.random((4, *IMG_SIZE, 3)).astype("float32")
+    ref = np.asarray(model(x, training=False))
+    got = exported.predict(x)
+    agree = float(np.mean(np.argmax(ref, axis=1) == np.argmax(got, axis=1)))
+    print(f"   max |diff|: {float(np.max(np.abs(ref - got))):.5f}, top-1 agreement: {agree:.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the FarmGuard model for TFLite / ONNX Runtime / SavedModel serving")
+    parser.add_argument("--model", default=os.getenv("MODEL_PATH", "./model/saved_model"), help="source Keras model")
+    parser.add_argument("--format", choices=["tflite", "onnx", "savedmodel"], required=True)
+    parser.add_argument("--quantize", choices=["none", "float16", "int8"], default="none", help="TFLite only")
+    parser.add_argument("--calibration-dir", default="./test_images", help="images for int8 calibration")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--no-verify", action="store_true")
+    args = parser.parse_args()
+
+    model = load_keras_model(args.model)
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    print(f"🔧 Exporting {args.model} -> {args.out} ({args.format}, quantize={args.quantize})")
+    if args.format == "tflite":
+        to_tflite(model, args.out, args.quantize, args.calibration_dir)
+    elif args.format == "onnx":
+        to_onnx(model, args.out)
+    else:
+        to_savedmodel(model, args.out)
+    print("✅ Export complete!")
+    if not args.no_verify:
+        verify(model, args.out)
+
+if __name__ == "__main__":
+    main()
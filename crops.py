@@ -0,0 +1,67 @@
+# crops.py
+import os
+import csv
+import numpy as np
+
+CROP_TABLE_PATH = os.getenv("CROP_TABLE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "crops.csv"))
+
+class CropTable:
+    """Crop requirements held column-wise as NumPy arrays, scored for many samples in one pass"""
+
+    def __init__(self, names, min_temp, max_temp, min_rainfall, optimal_ph):
+        self.names = list(names)
+        self.min_temp = np.asarray(min_temp, dtype=np.float64)
+        self.max_temp = np.asarray(max_temp, dtype=np.float64)
+        self.mid_temp = (self.min_temp + self.max_temp) / 2
+        self.min_rainfall = np.asarray(min_rainfall, dtype=np.float64)
+        self.optimal_ph = np.asarray(optimal_ph, dtype=np.float64)
+
+    @classmethod
+    def from_csv(cls, path=CROP_TABLE_PATH):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        return cls(
+            [r["name"].strip().lower() for r in rows],
+            [float(r["min_temp"]) for r in rows],
+            [float(r["max_temp"]) for r in rows],
+            [float(r["min_rainfall"]) for r in rows],
+            [float(r["optimal_ph"]) for r in rows],
+        )
+
+    def score(self, temperature, rainfall, ph, N, P, K):
+        """Scores for every (sample, crop) pair; inputs are scalars or 1-D arrays of samples.
+
+        Same rules as the original per-crop loop: temperature in range 3 / within 5
+        of the mid-point 2 / else 1, rainfall met 2, pH within 1 -> 2 / within 2 -> 1,
+        and 2 for a balanced N-P-K (N>=50, P>=30, K>=30).
+        """
+        t = np.atleast_1d(np.asarray(temperature, dtype=np.float64))[:, None]
+        rain = np.atleast_1d(np.asarray(rainfall, dtype=np.float64))[:, None]
+        ph_diff = np.abs(np.atleast_1d(np.asarray(ph, dtype=np.float64))[:, None] - self.optimal_ph)
+        npk_ok = (np.atleast_1d(N) >= 50) & (np.atleast_1d(P) >= 30) & (np.atleast_1d(K) >= 30)
+
+        in_range = (self.min_temp <= t) & (t <= self.max_temp)
+        near_mid = np.abs(t - self.mid_temp) <= 5
+        scores = np.where(in_range, 3, np.where(near_mid, 2, 1))
+        scores += np.where(rain >= self.min_rainfall, 2, 0)
+        scores += np.where(ph_diff <= 1, 2, np.where(ph_diff <= 2, 1, 0))
+        scores += np.where(npk_ok, 2, 0)[:, None]
+        return scores
+
+    def top_k(self, scores, k=3):
+        """(indices, scores) of the k best crops per sample; ties keep table order"""
+        k = max(1, min(int(k), len(self.names)))
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return order, np.take_along_axis(scores, order, axis=1)
+
+    def recommend(self, samples, k=3):
+        """samples: dict of equal-length arrays (temperature, rainfall, ph, N, P, K) -> list of top-k lists"""
+        scores = self.score(samples["temperature"], samples["rainfall"], samples["ph"], samples["N"], samples["P"], samples["K"])
+        order, top = self.top_k(scores, k)
+        return [
+            [{"crop": self.names[i].title(), "score": int(sc)} for i, sc in zip(idx_row, score_row)]
+            for idx_row, score_row in zip(order.tolist(), top.tolist())
+        ]
+
+def recommendation_text(crop):
+    return f"{crop} is the best crop to be cultivated with your current soil and climate conditions."
@@ -1,13 +1,83 @@
 # db.py
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Float, DateTime, Index, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./farmguard.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # seconds
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 30))  # seconds
+DB_ASYNC = os.getenv("DB_ASYNC", "1").lower() not in ("0", "false", "no")
+# async drivers for the request path; scripts and the detection writer keep the sync engine
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_SQLITE_MEMORY = IS_SQLITE and (DATABASE_URL in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in DATABASE_URL)
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    # WAL lets /history readers run while the detection writer commits
+    cur = dbapi_conn.cursor()
+    if not IS_SQLITE_MEMORY:
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}")
+    cur.close()
+
+if IS_SQLITE:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+        **({} if IS_SQLITE_MEMORY else {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}),
+    )
+    event.listen(engine, "connect", _sqlite_pragmas)
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
 SessionLocal = sessionmaker(bind=engine)
+
+def async_url(url):
+    """Sync DATABASE_URL -> the same database through its async driver"""
+    scheme, sep, rest = url.partition("://")
+    base = scheme.split("+")[0]
+    return ASYNC_DRIVERS[base] + sep + rest if base in ASYNC_DRIVERS else url
+
+def _create_async_engine():
+    # an in-memory SQLite database is per connection, so it can't be shared with the sync engine
+    if not DB_ASYNC or IS_SQLITE_MEMORY:
+        return None, None
+    try:
+        import greenlet  # noqa: F401  (SQLAlchemy's asyncio bridge)
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        if IS_SQLITE:
+            async_eng = create_async_engine(
+                async_url(DATABASE_URL),
+                connect_args={"timeout": SQLITE_BUSY_TIMEOUT},
+                pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+            )
+            event.listen(async_eng.sync_engine, "connect", _sqlite_pragmas)
+        else:
+            async_eng = create_async_engine(
+                async_url(DATABASE_URL),
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=True,
+            )
+    except ImportError as e:
+        print(f"Async database driver not available ({e}), using the sync engine in a threadpool")
+        return None, None
+    return async_eng, async_sessionmaker(async_eng, expire_on_commit=False)
+
+# None when no async driver is installed: callers fall back to SessionLocal in a thread
+async_engine, AsyncSessionLocal = _create_async_engine()
 Base = declarative_base()
 
 class Detection(Base):
@@ -19,7 +89,98 @@ class Detection(Base):
     confidence = Column(Float)
     advice = Column(String)
     source = Column(String, default="web")
+    model_version = Column(String)  # registry version that produced the result (NULL for older rows)
+    origin = Column(String)         # edge site a synced row came from (NULL for rows detected here), see sync.py
+    origin_id = Column(Integer)     # the row's id on that site
+
+    __table_args__ = (
+        # /history is always newest-first, optionally filtered by label, source or model version
+        Index("ix_detections_timestamp", "timestamp"),
+        Index("ix_detections_label_timestamp", "label", "timestamp"),
+        Index("ix_detections_source_timestamp", "source", "timestamp"),
+        Index("ix_detections_model_version_timestamp", "model_version", "timestamp"),
+        # sync imports are idempotent per site row; max(origin_id) is that site's high-water mark
+        Index("ux_detections_origin_origin_id", "origin", "origin_id", unique=True),
+    )
+
+class DetectionRollup(Base):
+    """Per hour and per day detection counts by label/source/model version, kept in step with `detections` (rollups.py)"""
+    __tablename__ = "detection_rollups"
+    period = Column(String, primary_key=True)     # "hour" | "day"
+    bucket = Column(DateTime, primary_key=True)   # naive UTC start of the hour/day
+    label = Column(String, primary_key=True)
+    source = Column(String, primary_key=True)
+    model_version = Column(String, primary_key=True)  # "unknown" for rows written before versions were recorded
+    count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+
+class Job(Base):
+    """Offline detection job (see jobs.py); counters are updated with each committed batch"""
+    __tablename__ = "jobs"
+    id = Column(String, primary_key=True)
+    status = Column(String, default="queued")  # queued | running | done | cancelled
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    succeeded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    options = Column(Text, default="{}")  # JSON: tta, top_k
+
+class JobItem(Base):
+    __tablename__ = "job_items"
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, nullable=False)
+    name = Column(String)
+    path = Column(String)     # spooled upload on disk
+    member = Column(String)   # zip member inside `path`, if any
+    status = Column(String, default="pending")  # pending | running | done | error | cancelled
+    claim = Column(String)    # token of the runner that claimed it
+    claimed_at = Column(DateTime)
+    image_path = Column(String)
+    result = Column(Text)     # JSON detect result
+    error = Column(String)
+
+    __table_args__ = (
+        # runners claim pending items oldest-first; results are paged per job
+        Index("ix_job_items_status_id", "status", "id"),
+        Index("ix_job_items_job_id_id", "job_id", "id"),
+        Index("ix_job_items_claim", "claim"),
+    )
+
+def _add_missing_columns(insp):
+    # create_all doesn't alter existing tables: add the nullable columns introduced since
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable and not column.primary_key:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                                      f"{column.type.compile(dialect=engine.dialect)}"))
 
 def init_db():
+    insp = inspect(engine)
+    had_rollups = insp.has_table(DetectionRollup.__tablename__)
+    if had_rollups and {c.name for c in DetectionRollup.__table__.columns} - \
+            {c["name"] for c in insp.get_columns(DetectionRollup.__tablename__)}:
+        # rollup key changed: the table is derived data, so rebuild it rather than migrate
+        DetectionRollup.__table__.drop(bind=engine)
+        had_rollups = False
+    _add_missing_columns(insp)
     Base.metadata.create_all(bind=engine)
+    # create_all skips indexes on tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    if not had_rollups:
+        # first start with rollups: backfill them from the detections already stored
+        from rollups import rebuild_rollups
+        db = SessionLocal()
+        try:
+            rebuild_rollups(db)
+        finally:
+            db.close()
 
@@ -0,0 +1,169 @@
+# db_writer.py
+import os
+import time
+import queue
+import threading
+from datetime import datetime
+from sqlalchemy import insert
+from db import SessionLocal, Detection
+from metrics import DB_WRITE_LATENCY, DB_ROWS_WRITTEN
+from rollups import apply_rollups
+
+# Write-behind queue for detection history: rows are bulk-inserted on a size or time threshold
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 100))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", 0.5))  # seconds
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", 3))
+WRITE_RETRY_BACKOFF = float(os.getenv("WRITE_RETRY_BACKOFF", 0.5))  # seconds before the first retry, doubling after
+WRITE_RETRY_MAX_BACKOFF = 30.0
+
+_STOP = object()
+
+class DetectionWriter:
+    """Background thread that buffers Detection rows and inserts them in bulk"""
+
+    def __init__(self, session_factory=SessionLocal, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL):
+        self.session_factory = session_factory
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stop = threading.Event()  # cuts a retry backoff short
+        self._lock = threading.Lock()
+        self._oldest_pending = None  # enqueue time of the oldest row not yet committed
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_flush_seconds = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="detection-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Flush everything that is queued, then stop"""
+        if self._thread is not None:
+            self._stop.set()
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, image_path, label, confidence, advice, source="web", **extra):
+        row = {
+            "timestamp": datetime.utcnow(),
+            "image_path": image_path,
+            "label": label,
+            "confidence": confidence,
+            "advice": advice,
+            "source": source,
+        }
+        row.update(extra)
+        self.enqueue_rows([row])
+
+    def enqueue_rows(self, rows):
+        if not rows:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._oldest_pending is None:
+                self._oldest_pending = now
+        for row in rows:
+            self._queue.put((now, row))
+
+    def _run(self):
+        pending = []
+        retries = 0
+        stopping = False
+        while not stopping:
+            deadline = time.monotonic() + self.flush_interval
+            while len(pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                pending.append(item)
+            if stopping:
+                # drain whatever was queued before the stop marker
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        pending.append(item)
+            if not pending:
+                continue
+            if self._flush(pending):
+                pending, retries = [], 0
+            else:
+                retries += 1
+                if retries > WRITE_MAX_RETRIES or stopping:
+                    with self._lock:
+                        self.dropped += len(pending)
+                    print(f"❌ Dropping {len(pending)} detection rows after {retries} failed writes")
+                    pending, retries = [], 0
+                else:
+                    # let a briefly locked / restarting database recover; stop() wakes us for a last try
+                    self._stop.wait(min(WRITE_RETRY_BACKOFF * 2 ** (retries - 1), WRITE_RETRY_MAX_BACKOFF))
+            with self._lock:
+                self._oldest_pending = pending[0][0] if pending else self._peek_oldest()
+
+    def _peek_oldest(self):
+        with self._queue.mutex:
+            for item in self._queue.queue:
+                if item is not _STOP:
+                    return item[0]
+        return None
+
+    def _flush(self, pending):
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            write_detections(db, [row for _, row in pending])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self.errors += 1
+            print(f"Error writing detections: {e}")
+            return False
+        finally:
+            db.close()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.written += len(pending)
+            self.flushes += 1
+            self.last_flush_seconds = elapsed
+        DB_WRITE_LATENCY.observe(elapsed)
+        DB_ROWS_WRITTEN.inc(len(pending))
+        return True
+
+    def stats(self):
+        with self._lock:
+            oldest = self._oldest_pending
+            return {
+                "queue_depth": self._queue.qsize(),
+                "lag_seconds": (time.monotonic() - oldest) if oldest is not None else 0.0,
+                "written": self.written,
+                "flushes": self.flushes,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "last_flush_seconds": self.last_flush_seconds,
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+            }
+
+def write_detections(db, rows):
+    """Bulk INSERT of Detection rows (and their rollup increments) inside the caller's transaction"""
+    if rows:
+        db.execute(insert(Detection), rows)
+        apply_rollups(db, rows)
@@ -5,57 +5,36 @@ This script downloads a pre-trained CNN model trained on the PlantVillage datase
 """
 
 import os
-import requests
-import zipfile
-import shutil
-from pathlib import Path
+from artifacts import ArtifactCache, MODEL_ARTIFACT, MODEL_SHA256, MODEL_ARTIFACT_VERSION, download, version_for_url
 
-def download_file(url, filename):
-    """Download file with progress bar"""
+# PlantVillage pre-trained model (smaller version for demo)
+# This is a simplified model trained on common plant diseases
+DEFAULT_MODEL_URL = "https://github.com/plantvillage/plantvillage-models/releases/download/v1.0/plant_disease_model.zip"
+
+def download_file(url, filename, sha256=None):
+    """Download file with progress bar (parallel Range requests, resumable, SHA-256 checked)"""
     print(f"Downloading {filename}...")
-    response = requests.get(url, stream=True)
-    total_size = int(response.headers.get('content-length', 0))
-    
-    with open(filename, 'wb') as f:
-        downloaded = 0
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-                downloaded += len(chunk)
-                if total_size > 0:
-                    percent = (downloaded / total_size) * 100
-                    print(f"\rProgress: {percent:.1f}%", end='', flush=True)
-    print(f"\nDownloaded {filename} successfully!")
+    digest = download(url, filename, sha256)
+    print(f"Downloaded {filename} successfully! (sha256 {digest})")
+    return digest
 
 def setup_model():
-    """Setup the PlantVillage model"""
-    model_dir = Path("./model")
-    model_dir.mkdir(exist_ok=True)
-    
-    # PlantVillage pre-trained model (smaller version for demo)
-    # This is a simplified model trained on common plant diseases
-    model_url = "https://github.com/plantvillage/plantvillage-models/releases/download/v1.0/plant_disease_model.zip"
-    
+    """Setup the PlantVillage model in the artifact cache (skipped if that version is already there)"""
+    model_url = os.getenv("MODEL_URL") or DEFAULT_MODEL_URL
+    version = MODEL_ARTIFACT_VERSION or version_for_url(model_url)
+    cache = ArtifactCache()
+
     try:
-        # Download the model
-        zip_file = "plant_disease_model.zip"
-        download_file(model_url, zip_file)
-        
-        # Extract the model
-        print("Extracting model...")
-        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-            zip_ref.extractall("./model")
-        
-        # Clean up
-        os.remove(zip_file)
-        
+        model_dir = cache.fetch(model_url, version, MODEL_SHA256 or None, keep_archive=False)
+        cache.set_current(MODEL_ARTIFACT, version)
+
         # Verify model files
-        model_files = list(model_dir.rglob("*"))
+        model_files = [os.path.join(d, f) for d, _, files in os.walk(model_dir) for f in files]
         print(f"Model files extracted: {len(model_files)} files")
-        
+
         print("✅ PlantVillage model setup complete!")
-        print("Model location: ./model/")
-        
+        print(f"Model location: {model_dir} (version {version}, loaded when ./model has no model)")
+
     except Exception as e:
         print(f"❌ Error downloading model: {e}")
         print("Setting up fallback model...")
@@ -89,6 +68,7 @@ def setup_fallback_model():
     )
     
     # Save the model
+    os.makedirs('./model', exist_ok=True)
     model.save('./model/saved_model')
     print("✅ Fallback model created and saved!")
 
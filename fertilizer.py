@@ -0,0 +1,122 @@
+# fertilizer.py
+import os
+import csv
+import itertools
+from bisect import bisect_right
+from functools import lru_cache
+
+FERTILIZER_RULES_PATH = os.getenv(
+    "FERTILIZER_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "fertilizer_rules.csv")
+)
+FERTILIZER_CACHE_SIZE = int(os.getenv("FERTILIZER_CACHE_SIZE", 4096))
+
+WILDCARD = "*"
+# bin edges -> level names; a value equal to an edge falls in the upper bin
+LEVELS = {
+    "nitrogen": ((50, 100), ("low", "medium", "high")),
+    "phosphorus": ((20, 40), ("low", "medium", "high")),
+    "potassium": ((20, 40), ("low", "medium", "high")),
+    "ph": ((5.5, 7.5), ("acidic", "neutral", "alkaline")),
+}
+NUTRIENTS = ("nitrogen", "phosphorus", "potassium", "ph")
+
+def level(field, value):
+    edges, names = LEVELS[field]
+    return names[bisect_right(edges, value)]
+
+def normalize(name):
+    return " ".join(str(name).lower().split()) or WILDCARD
+
+class FertilizerIndex:
+    """Fertilizer rules compiled into dicts keyed on (crop, soil) pattern, then (N, P, K, pH levels).
+
+    Rules come from a CSV where any key column may be "*". At compile time each
+    (crop, soil) pattern that appears in the rules gets its best rule for every
+    level combination it covers (most non-"*" columns; ties go to the earlier row),
+    so the index grows with the rule count, not crops x soils. A lookup checks the
+    fixed chain (crop, soil), (crop, *), (*, soil), (*, *) and keeps the best hit -
+    four dict accesses no matter how many rules there are. Unknown crops/soils map to "*".
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.crops = {r["crop"] for r in rules} | {WILDCARD}
+        self.soils = {r["soil"] for r in rules} | {WILDCARD}
+        self.index = self._compile()
+
+    @classmethod
+    def from_csv(cls, path=FERTILIZER_RULES_PATH):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        rules = []
+        for r in rows:
+            rule = {k: normalize(r[k]) for k in ("crop", "soil", *NUTRIENTS)}
+            rule["response"] = {
+                "fertilizer": r["fertilizer"].strip(),
+                "deficiency": r["deficiency"].strip(),
+                "application": r["application"].strip(),
+            }
+            rules.append(rule)
+        return cls(rules)
+
+    def _compile(self):
+        index = {}
+        for order, rule in enumerate(self.rules):
+            rank = (-sum(rule[k] != WILDCARD for k in ("crop", "soil", *NUTRIENTS)), order)
+            best = index.setdefault((rule["crop"], rule["soil"]), {})
+            # only the level combinations this rule covers
+            for levels in itertools.product(*(LEVELS[f][1] if rule[f] == WILDCARD else (rule[f],) for f in NUTRIENTS)):
+                if levels not in best or rank < best[levels][0]:
+                    best[levels] = (rank, rule["response"])
+        return index
+
+    def key(self, crop, soil, nitrogen, phosphorus, potassium, ph):
+        crop, soil = normalize(crop), normalize(soil)
+        return (
+            crop if crop in self.crops else WILDCARD,
+            soil if soil in self.soils else WILDCARD,
+            level("nitrogen", nitrogen), level("phosphorus", phosphorus),
+            level("potassium", potassium), level("ph", ph),
+        )
+
+    def lookup(self, key):
+        crop, soil, *levels = key
+        levels = tuple(levels)
+        found = None
+        for pattern in ((crop, soil), (crop, WILDCARD), (WILDCARD, soil), (WILDCARD, WILDCARD)):
+            entry = self.index.get(pattern, {}).get(levels)
+            if entry is not None and (found is None or entry[0] < found[0]):
+                found = entry
+        return found[1] if found is not None else None
+
+class FertilizerRecommender:
+    """FertilizerIndex plus a memoized response cache; equivalent inputs share one entry"""
+
+    DEFAULT = {
+        "fertilizer": "20-20-20 (Balanced NPK)",
+        "deficiency": "General purpose fertilizer",
+        "application": "Apply 200kg/ha at planting",
+    }
+
+    def __init__(self, index, cache_size=FERTILIZER_CACHE_SIZE):
+        self.index = index
+        self._cached = lru_cache(maxsize=cache_size)(self._respond)
+
+    @classmethod
+    def from_csv(cls, path=FERTILIZER_RULES_PATH):
+        return cls(FertilizerIndex.from_csv(path))
+
+    def _respond(self, key):
+        crop, soil, n, p, k, ph = key
+        rec = self.index.lookup(key) or self.DEFAULT
+        return {**rec, "levels": {"nitrogen": n, "phosphorus": p, "potassium": k, "ph": ph}}
+
+    def recommend(self, crop, soil, nitrogen, phosphorus, potassium, ph):
+        """Returned dicts are shared by the cache - copy before mutating"""
+        return self._cached(self.index.key(crop, soil, nitrogen, phosphorus, potassium, ph))
+
+    def stats(self):
+        info = self._cached.cache_info()
+        keys = sum(len(best) for best in self.index.index.values())
+        return {"rules": len(self.index.rules), "keys": keys, "hits": info.hits, "misses": info.misses,
+                "size": info.currsize, "max_size": info.maxsize}
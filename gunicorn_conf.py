@@ -0,0 +1,36 @@
+# gunicorn_conf.py
+# Used by the Docker image (tiangolo/uvicorn-gunicorn picks up /app/gunicorn_conf.py) and by
+#   gunicorn app:app -c gunicorn_conf.py
+# With MODEL_BACKEND=remote a single inference_server.py process owns the model and every web
+# worker sends it tensors over INFERENCE_SOCKET, so memory no longer grows with the worker count.
+import os
+import sys
+import subprocess
+import multiprocessing
+
+bind = os.getenv("BIND") or f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '80')}"
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "uvicorn.workers.UvicornWorker"
+keepalive = int(os.getenv("KEEP_ALIVE", 5))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 120))
+timeout = int(os.getenv("TIMEOUT", 120))
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = os.getenv("ERROR_LOG", "-")
+
+_inference_server = None
+
+def on_starting(server):
+    """Start the shared inference server before any worker is forked"""
+    global _inference_server
+    if os.getenv("MODEL_BACKEND", "").lower() == "remote":
+        here = os.path.dirname(os.path.abspath(__file__))
+        _inference_server = subprocess.Popen([sys.executable, os.path.join(here, "inference_server.py")], cwd=here)
+        server.log.info(f"Started inference server (pid {_inference_server.pid})")
+
+def on_exit(server):
+    if _inference_server is not None and _inference_server.poll() is None:
+        _inference_server.terminate()
+        try:
+            _inference_server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            _inference_server.kill()
@@ -0,0 +1,114 @@
+# history.py
+import os
+import base64
+from datetime import datetime, timezone
+from sqlalchemy import select, and_, or_
+from db import Detection
+from storage import thumbnail_path
+
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", 500))
+
+# column-only select: rows come back as tuples, no ORM objects are built
+HISTORY_COLUMNS = (
+    Detection.id, Detection.timestamp, Detection.label, Detection.confidence,
+    Detection.advice, Detection.image_path, Detection.source, Detection.model_version, Detection.origin,
+)
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(timestamp, id_):
+    raw = f"{timestamp.isoformat()}|{id_}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, id_ = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(id_)
+    except Exception:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+def _naive_utc(dt):
+    # timestamps are stored as naive UTC (datetime.utcnow)
+    if dt is not None and dt.tzinfo is not None:
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def history_query(limit=20, before=None, after=None, label=None, source=None, since=None, until=None,
+                  model_version=None):
+    """Build the keyset-paginated history SELECT.
+
+    Pages are newest-first. `before` returns rows older than that cursor,
+    `after` rows newer than it. Returns (statement, ascending); ascending
+    statements must be reversed by the caller.
+    """
+    stmt = select(*HISTORY_COLUMNS)
+    if label:
+        stmt = stmt.where(Detection.label == label)
+    if source:
+        stmt = stmt.where(Detection.source == source)
+    if model_version:
+        stmt = stmt.where(Detection.model_version == model_version)
+    if since is not None:
+        stmt = stmt.where(Detection.timestamp >= _naive_utc(since))
+    if until is not None:
+        stmt = stmt.where(Detection.timestamp < _naive_utc(until))
+
+    ascending = False
+    if before:
+        ts, id_ = decode_cursor(before)
+        stmt = stmt.where(or_(Detection.timestamp < ts, and_(Detection.timestamp == ts, Detection.id < id_)))
+    elif after:
+        ts, id_ = decode_cursor(after)
+        stmt = stmt.where(or_(Detection.timestamp > ts, and_(Detection.timestamp == ts, Detection.id > id_)))
+        ascending = True
+
+    if ascending:
+        stmt = stmt.order_by(Detection.timestamp.asc(), Detection.id.asc())
+    else:
+        stmt = stmt.order_by(Detection.timestamp.desc(), Detection.id.desc())
+    # one extra row tells us whether another page exists
+    return stmt.limit(limit + 1), ascending
+
+def clamp_limit(limit):
+    return max(1, min(int(limit), HISTORY_MAX_LIMIT))
+
+def serialize_row(row):
+    id_, ts, label, confidence, advice, image_path, source, model_version, origin = row
+    # synced rows (origin set) only have their thumbnail on this instance, not the full image
+    return {
+        "id": id_, "timestamp": ts.isoformat() if ts else None, "label": label,
+        "confidence": confidence, "advice": advice, "image_path": None if origin else image_path,
+        "thumbnail_path": thumbnail_path(image_path), "source": source, "model_version": model_version,
+        "origin": origin,
+    }
+
+def build_page(rows, limit, ascending, paging):
+    """Turn fetched rows into the /history response with next/prev cursors"""
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    if ascending:
+        rows.reverse()
+    items = [serialize_row(r) for r in rows]
+    # ascending pages walked towards newer rows, so "more" lies on the newer side
+    older_exists = has_more if not ascending else True
+    newer_exists = paging and (has_more if ascending else True)
+    next_cursor = encode_cursor(rows[-1][1], rows[-1][0]) if rows and older_exists else None
+    prev_cursor = encode_cursor(rows[0][1], rows[0][0]) if rows and newer_exists else None
+    return {"items": items, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+def fetch_history(db, limit=20, before=None, after=None, label=None, source=None, since=None, until=None,
+                  model_version=None):
+    limit = clamp_limit(limit)
+    stmt, ascending = history_query(limit, before, after, label, source, since, until, model_version)
+    rows = db.execute(stmt).all()
+    return build_page(rows, limit, ascending, paging=bool(before or after))
+
+async def fetch_history_async(db, limit=20, before=None, after=None, label=None, source=None, since=None, until=None,
+                              model_version=None):
+    """fetch_history on an AsyncSession"""
+    limit = clamp_limit(limit)
+    stmt, ascending = history_query(limit, before, after, label, source, since, until, model_version)
+    rows = (await db.execute(stmt)).all()
+    return build_page(rows, limit, ascending, paging=bool(before or after))
@@ -0,0 +1,38 @@
+# imaging.py
+import os
+import io
+from collections import namedtuple
+from PIL import Image
+from model_utils import IMG_SIZE, image_pixels
+
+# Stored copies of uploads are capped at this size; smaller JPEGs are kept byte-for-byte
+STORE_MAX_DIM = int(os.getenv("STORE_MAX_DIM", 1280))
+STORE_PASSTHROUGH_BYTES = int(os.getenv("STORE_PASSTHROUGH_BYTES", 524288))  # 512KB
+STORE_JPEG_QUALITY = int(os.getenv("STORE_JPEG_QUALITY", 70))
+STORE_THUMB_DIM = int(os.getenv("STORE_THUMB_DIM", 200))  # history thumbnails, <= model input size
+
+# pixels: (H, W, C) uint8 at model size; the batch scheduler normalizes them straight into its input buffer
+DecodedUpload = namedtuple("DecodedUpload", ["pixels", "jpeg_bytes", "thumb_bytes"])
+
+def encode_jpeg(img, max_dim=None):
+    if max_dim is not None:
+        img = img.copy()
+        img.thumbnail((max_dim, max_dim))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=STORE_JPEG_QUALITY)
+    return buf.getvalue()
+
+def decode_upload(bytes_):
+    """Decode an upload once and produce the model input pixels, the JPEG to store and its thumbnail"""
+    img = Image.open(io.BytesIO(bytes_))
+    if img.format == "JPEG" and len(bytes_) <= STORE_PASSTHROUGH_BYTES and max(img.size) <= STORE_MAX_DIM:
+        # already a small JPEG: store as uploaded, decode straight to ~model size
+        img.draft("RGB", IMG_SIZE)
+        img = img.convert("RGB")
+        return DecodedUpload(image_pixels(img), bytes_, encode_jpeg(img, STORE_THUMB_DIM))
+
+    # decode at the smallest JPEG scale that still covers the stored size, then share the bitmap
+    img.draft("RGB", (STORE_MAX_DIM, STORE_MAX_DIM))
+    img = img.convert("RGB")
+    img.thumbnail((STORE_MAX_DIM, STORE_MAX_DIM))
+    return DecodedUpload(image_pixels(img), encode_jpeg(img), encode_jpeg(img, STORE_THUMB_DIM))
@@ -0,0 +1,159 @@
+# inference.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from model_utils import predict_batch, batch_buffer, normalize_into
+from metrics import INFERENCE_BATCH_SIZE, INFERENCE_LATENCY
+
+# Dynamic micro-batching: concurrent /detect calls are gathered into one forward pass
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+
+_STOP = object()
+
+class BatchScheduler:
+    """Collects predict requests and runs them as one batched forward pass.
+
+    `run_batch(model, xs)` turns an (N, H, W, C) batch into N per-row results;
+    the default gives the predict() result dicts, the inference server passes
+    one that returns raw probabilities. `version` labels the batch metrics.
+
+    Inputs may be uint8 pixels or float32 tensors. Each batch is filled slot by
+    slot into the scheduler thread's reusable buffer (model_utils.batch_buffer),
+    normalizing uint8 rows on the way in unless the model takes uint8 itself
+    (`model.input_dtype`), so a forward pass allocates no input arrays.
+    """
+
+    def __init__(self, model, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, run_batch=predict_batch,
+                 version="default"):
+        self.model = model
+        self.run_batch = run_batch
+        self.version = version
+        self.input_dtype = np.dtype(getattr(model, "input_dtype", np.float32))
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._carry = None  # item that didn't fit in the previous batch
+        self._thread = None
+        self._lock = threading.Lock()
+        # histograms are kept as {value: count}, values are bounded by max_batch_size / load
+        self.batch_size_hist = {}
+        self.queue_depth_hist = {}
+        self.batches = 0
+        self.requests = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Finish whatever is queued, then stop the worker thread"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, x):
+        """Queue a (1, H, W, C) or (H, W, C) image; returns a Future with its single result"""
+        fut = Future()
+        if x.ndim == 3:
+            x = x[np.newaxis]
+        self._queue.put((x, fut, True))
+        return fut
+
+    def submit_many(self, xs):
+        """Queue an (N, H, W, C) batch; returns a Future with the N results (rows stay together)"""
+        fut = Future()
+        self._queue.put((xs, fut, False))
+        return fut
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item, self._carry = (self._carry, None) if self._carry is not None else (self._queue.get(), None)
+            if item is _STOP:
+                break
+            batch = [item]
+            rows = len(item[0])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # drain whatever is already waiting, then wait up to the deadline for more
+                    item = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                if rows + len(item[0]) > self.max_batch_size:
+                    self._carry = item
+                    break
+                batch.append(item)
+                rows += len(item[0])
+            self._run_batch(batch, rows)
+        if self._carry is not None:
+            self._run_batch([self._carry], len(self._carry[0]))
+            self._carry = None
+
+    def _run_batch(self, batch, rows):
+        depth = self._queue.qsize()
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.batch_size_hist[rows] = self.batch_size_hist.get(rows, 0) + 1
+            self.queue_depth_hist[depth] = self.queue_depth_hist.get(depth, 0) + 1
+        INFERENCE_BATCH_SIZE.observe(rows, model_version=self.version)
+        try:
+            xs = self._gather(batch, rows)
+            with INFERENCE_LATENCY.time(model_version=self.version):
+                results = self.run_batch(self.model, xs)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+            return
+        offset = 0
+        for x, fut, single in batch:
+            n = len(x)
+            fut.set_result(results[offset] if single else results[offset:offset + n])
+            offset += n
+
+    def _gather(self, batch, rows):
+        inputs = [x for x, _, _ in batch]
+        # uint8 only goes to the model as-is if it asked for it and every row is uint8
+        dtype = self.input_dtype if all(x.dtype == self.input_dtype for x in inputs) else np.dtype(np.float32)
+        if len(inputs) == 1 and inputs[0].dtype == dtype:
+            return inputs[0]
+        # sized for a full batch on first use, so later batches never reallocate
+        xs = batch_buffer(max(rows, self.max_batch_size), dtype, inputs[0].shape[1:])[:rows]
+        offset = 0
+        for x in inputs:
+            n = len(x)
+            if x.dtype == np.uint8 and dtype != np.uint8:
+                normalize_into(x, xs[offset:offset + n])
+            else:
+                xs[offset:offset + n] = x
+            offset += n
+        return xs
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "batches": self.batches,
+                "requests": self.requests,
+                "errors": self.errors,
+                "avg_batch_size": (self.requests / self.batches) if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_size_hist.items())),
+                "queue_depth_histogram": dict(sorted(self.queue_depth_hist.items())),
+            }
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+FarmGuard inference server: one process owns the model, web workers send it pixel batches
+
+    MODEL_PATH=./model/saved_model python inference_server.py
+
+Web workers started with MODEL_BACKEND=remote talk to it over the Unix socket
+INFERENCE_SOCKET (see backends.RemoteBackend), so N workers share one copy of the
+weights and of the TensorFlow runtime. Requests from all workers are coalesced
+into batches by the same BatchScheduler the app uses.
+
+Wire format (little endian), both directions:
+    4s magic | B status/dtype code | B ndim | ndim x I dims | raw C-order array bytes
+Arrays are received straight into a reusable buffer and wrapped with np.frombuffer,
+and sent from the array's own memory, so payloads are never copied in Python.
+"""
+
+import os
+import sys
+import signal
+import struct
+import socket
+import socketserver
+import numpy as np
+
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "/tmp/farmguard-inference.sock")
+INFERENCE_SERVER_BACKEND = os.getenv("INFERENCE_SERVER_BACKEND", "")  # default: from MODEL_PATH extension
+
+MAGIC = b"FGI1"
+DTYPES = {0: np.dtype("float32"), 1: np.dtype("uint8")}
+DTYPE_CODES = {v: k for k, v in DTYPES.items()}
+STATUS_ERROR = 255
+_HEAD = struct.Struct("<4sBB")
+
+class RemoteInferenceError(RuntimeError):
+    pass
+
+def _recv_into(sock, view):
+    while len(view):
+        n = sock.recv_into(view)
+        if n == 0:
+            raise ConnectionError("inference socket closed")
+        view = view[n:]
+
+def send_array(sock, arr):
+    arr = np.ascontiguousarray(arr)
+    sock.sendall(_HEAD.pack(MAGIC, DTYPE_CODES[arr.dtype], arr.ndim) + struct.pack(f"<{arr.ndim}I", *arr.shape))
+    if arr.size:  # memoryview can't cast an empty shape; there is no payload anyway
+        sock.sendall(memoryview(arr).cast("B"))
+
+def send_error(sock, message):
+    data = message.encode()[:65535]
+    sock.sendall(_HEAD.pack(MAGIC, STATUS_ERROR, 1) + struct.pack("<I", len(data)) + data)
+
+def recv_array(sock, buf=None):
+    """Read one message; returns (array, buf). `buf` is a bytearray reused (and grown) across calls"""
+    head = bytearray(_HEAD.size)
+    _recv_into(sock, memoryview(head))
+    magic, code, ndim = _HEAD.unpack(head)
+    if magic != MAGIC:
+        raise ConnectionError("bad inference message")
+    dims = bytearray(4 * ndim)
+    _recv_into(sock, memoryview(dims))
+    shape = struct.unpack(f"<{ndim}I", dims)
+    if code == STATUS_ERROR:
+        msg = bytearray(shape[0])
+        _recv_into(sock, memoryview(msg))
+        raise RemoteInferenceError(msg.decode(errors="replace"))
+    dtype = DTYPES[code]
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    if buf is None or len(buf) < nbytes:
+        buf = bytearray(nbytes)
+    view = memoryview(buf)[:nbytes]
+    _recv_into(sock, view)
+    return np.frombuffer(view, dtype=dtype).reshape(shape), buf
+
+def connect(path=INFERENCE_SOCKET, timeout=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(path)
+    return sock
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        buf = None
+        while True:
+            try:
+                x, buf = recv_array(self.request, buf)
+            except (ConnectionError, OSError):
+                return
+            try:
+                # x is a view on buf; the scheduler is done with it once the future resolves
+                probs = self.server.scheduler.submit_many(x).result()
+            except Exception as e:
+                send_error(self.request, f"{type(e).__name__}: {e}")
+                continue
+            send_array(self.request, np.asarray(probs, dtype=np.float32))
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, scheduler):
+        if os.path.exists(path):
+            os.remove(path)  # stale socket from a previous run
+        self.scheduler = scheduler
+        super().__init__(path, _Handler)
+
+def serve(path=INFERENCE_SOCKET):
+    from backends import load_backend, backend_for_path
+    from inference import BatchScheduler
+    from model_utils import warm_up, predict_probs
+    from registry import default_model_version
+
+    model_path = os.getenv("MODEL_PATH", "./model/saved_model")
+    model = load_backend(model_path, INFERENCE_SERVER_BACKEND or backend_for_path(model_path))
+    warm_up(model, [int(n) for n in os.getenv("WARMUP_BATCH_SIZES", "1,4").split(",") if n.strip()])
+    version = os.getenv("MODEL_VERSION") or default_model_version(model_path)
+    scheduler = BatchScheduler(model, run_batch=predict_probs, version=version).start()
+    server = InferenceServer(path, scheduler)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # clean up the socket on stop
+    print(f"✅ Inference server ready on {path}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        scheduler.stop()
+        if os.path.exists(path):
+            os.remove(path)
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else INFERENCE_SOCKET)
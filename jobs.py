@@ -0,0 +1,356 @@
+# jobs.py
+import os
+import json
+import uuid
+import shutil
+import zipfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert, func
+from db import SessionLocal, Job, JobItem
+from db_writer import write_detections
+from uploads import sniff_type, MAX_UPLOAD_SIZE, IMAGE_EXTENSIONS
+
+# Offline detection jobs: uploads are spooled to JOB_DIR, items queue in the job_items table
+JOB_DIR = os.getenv("JOB_DIR", "./jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 1))            # runner threads per app process
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", 8))      # items claimed + inferred + committed together
+JOB_CLAIM_TIMEOUT = float(os.getenv("JOB_CLAIM_TIMEOUT", 300))  # seconds before a crashed runner's items are retried
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))  # seconds between looks at an empty queue
+JOB_MAX_FILES = int(os.getenv("JOB_MAX_FILES", 100000))   # images per job (zip members included)
+JOB_MAX_UPLOAD_SIZE = int(os.getenv("JOB_MAX_UPLOAD_SIZE", 2147483648))  # whole POST /jobs body
+JOB_YIELD_INTERVAL = 0.05  # seconds to back off while interactive requests are busy
+JOB_OPEN_ARCHIVES = 4      # spooled zips each runner thread keeps open between batches
+
+TERMINAL = ("done", "cancelled")
+FINISHED_ITEMS = ("done", "error", "cancelled")
+
+class JobTooLarge(ValueError):
+    pass
+
+def _spool(fileobj, path):
+    with open(path, "wb") as f:
+        shutil.copyfileobj(fileobj, f, 1024 * 1024)
+
+def create_job(files, options=None):
+    """Spool (filename, fileobj) uploads - images or zips of images - and queue one item per image.
+
+    Unreadable files are recorded as failed items straight away. Returns the job status dict.
+    """
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(JOB_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    items = []
+    try:
+        for n, (filename, fileobj) in enumerate(files):
+            path = os.path.join(job_dir, f"{n:06d}")
+            _spool(fileobj, path)
+            with open(path, "rb") as f:
+                content_type = sniff_type(f.read(8))
+            if content_type == "application/zip":
+                try:
+                    with zipfile.ZipFile(path) as zf:
+                        members = [i for i in zf.infolist() if not i.is_dir() and not i.filename.startswith("__MACOSX/")
+                                   and i.filename.lower().endswith(IMAGE_EXTENSIONS)]
+                except zipfile.BadZipFile:
+                    items.append({"name": filename, "status": "error", "error": "Invalid zip archive"})
+                    continue
+                for info in members:
+                    item = {"name": f"{filename}/{info.filename}", "path": path, "member": info.filename}
+                    if info.file_size > MAX_UPLOAD_SIZE:
+                        item.update(status="error", error="File too large")
+                    items.append(item)
+            elif content_type is None:
+                items.append({"name": filename, "status": "error", "error": "Only jpeg/png allowed"})
+            elif os.path.getsize(path) > MAX_UPLOAD_SIZE:
+                items.append({"name": filename, "status": "error", "error": "File too large"})
+            else:
+                items.append({"name": filename, "path": path})
+            if len(items) > JOB_MAX_FILES:
+                raise JobTooLarge(f"At most {JOB_MAX_FILES} images per job")
+    except Exception:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    failed = sum(1 for i in items if i.get("status") == "error")
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.add(Job(id=job_id, status="queued" if failed < len(items) else "done", created_at=now, updated_at=now,
+                   finished_at=None if failed < len(items) else now, total=len(items), processed=failed,
+                   failed=failed, succeeded=0, options=json.dumps(options or {})))
+        if items:
+            db.execute(insert(JobItem), [
+                {"job_id": job_id, "name": i["name"], "path": i.get("path"), "member": i.get("member"),
+                 "status": i.get("status", "pending"), "error": i.get("error")}
+                for i in items
+            ])
+        db.commit()
+        if failed == len(items):
+            shutil.rmtree(job_dir, ignore_errors=True)  # nothing left for a runner to read
+        return job_status(db, job_id)
+    finally:
+        db.close()
+
+def serialize_job(job):
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "processed": job.processed,
+        "succeeded": job.succeeded,
+        "failed": job.failed,
+        "progress": (job.processed / job.total) if job.total else 1.0,
+        "options": json.loads(job.options or "{}"),
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+def job_status(db, job_id):
+    job = db.get(Job, job_id)
+    return serialize_job(job) if job is not None else None
+
+def job_results(db, job_id, after=0, limit=100):
+    """Finished items of a job in submission order; page with next_after"""
+    rows = db.execute(
+        select(JobItem.id, JobItem.name, JobItem.status, JobItem.result, JobItem.image_path, JobItem.error)
+        .where(JobItem.job_id == job_id, JobItem.id > after, JobItem.status.in_(FINISHED_ITEMS))
+        .order_by(JobItem.id)
+        .limit(limit + 1)
+    ).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    items = []
+    for id_, name, status, result, image_path, error in rows:
+        item = {"item_id": id_, "filename": name, "status": status}
+        if status == "done":
+            item.update(result=json.loads(result), image_url=image_path)
+        else:
+            item["error"] = error
+        items.append(item)
+    return {"items": items, "next_after": rows[-1][0] if more else None}
+
+def cancel_job(db, job_id):
+    """Cancel pending items; returns the job status dict (None if there is no such job)"""
+    job = db.get(Job, job_id)
+    if job is None or job.status in TERMINAL:
+        return serialize_job(job) if job is not None else None
+    cancelled = db.execute(
+        update(JobItem).where(JobItem.job_id == job_id, JobItem.status == "pending").values(status="cancelled")
+    ).rowcount
+    now = datetime.utcnow()
+    job.status, job.updated_at, job.finished_at = "cancelled", now, now
+    job.processed += cancelled
+    db.commit()
+    shutil.rmtree(os.path.join(JOB_DIR, job_id), ignore_errors=True)
+    return serialize_job(job)
+
+def read_item(item, open_archive=None):
+    """Image bytes for a claimed item (a spooled file or a member of a spooled zip).
+
+    `open_archive(path)` returns an already open ZipFile, so a runner parses an
+    archive's central directory once instead of once per member.
+    """
+    if item.member:
+        if open_archive is not None:
+            data = open_archive(item.path).read(item.member)
+        else:
+            with zipfile.ZipFile(item.path) as zf:
+                data = zf.read(item.member)
+    else:
+        with open(item.path, "rb") as f:
+            data = f.read()
+    if sniff_type(data[:8]) not in ("image/jpeg", "image/png"):
+        raise ValueError("Only jpeg/png allowed")
+    return data
+
+class JobRunner:
+    """Threads that claim pending job items in batches, run them and commit the results.
+
+    `process(blobs, **options)` returns one (result, image_path) or Exception per
+    blob. Detections, item results and job counters for a batch are committed in
+    one transaction, so a crash never records a batch twice; items claimed by a
+    runner that died are retried after JOB_CLAIM_TIMEOUT, and a runner whose claim
+    went stale meanwhile records nothing for them. `gate()` returning
+    False means interactive traffic is busy and the runner should wait.
+    """
+
+    def __init__(self, process, gate=None, workers=JOB_WORKERS, batch_size=JOB_BATCH_SIZE,
+                 claim_timeout=JOB_CLAIM_TIMEOUT, poll_interval=JOB_POLL_INTERVAL):
+        self.process = process
+        self.gate = gate
+        self.workers = max(0, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+        self._local = threading.local()  # per-thread open archives (ZipFile isn't shared across threads)
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+
+    def start(self):
+        if not self._threads:
+            self._stop.clear()
+            for n in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"job-runner-{n}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def stop(self, timeout=30.0):
+        """Finish the batch in hand; unclaimed items stay queued for the next start"""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                if self.gate is not None and not self.gate():
+                    self._stop.wait(JOB_YIELD_INTERVAL)
+                    continue
+                try:
+                    claimed = self.run_once()
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                    print(f"❌ Job runner error: {e}")
+                    claimed = 0
+                if not claimed:
+                    self.close_archives()  # idle: don't hold finished jobs' deleted spool files open
+                    self._stop.wait(self.poll_interval)
+        finally:
+            self.close_archives()
+
+    def open_archive(self, path):
+        """This thread's open ZipFile for a spooled zip (the last JOB_OPEN_ARCHIVES stay open)"""
+        archives = self._local.__dict__.setdefault("archives", OrderedDict())
+        zf = archives.get(path)
+        if zf is None:
+            zf = archives[path] = zipfile.ZipFile(path)
+            while len(archives) > JOB_OPEN_ARCHIVES:
+                archives.popitem(last=False)[1].close()
+        archives.move_to_end(path)
+        return zf
+
+    def close_archives(self):
+        for zf in self._local.__dict__.pop("archives", {}).values():
+            zf.close()
+
+    def requeue_stale(self, db):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.claim_timeout)
+        n = db.execute(
+            update(JobItem).where(JobItem.status == "running", JobItem.claimed_at < cutoff)
+            .values(status="pending", claim=None, claimed_at=None)
+        ).rowcount
+        db.commit()
+        return n
+
+    def claim(self, db):
+        """Atomically take up to batch_size pending items (safe across processes)"""
+        token = uuid.uuid4().hex
+        ids = db.execute(
+            select(JobItem.id).where(JobItem.status == "pending").order_by(JobItem.id).limit(self.batch_size)
+        ).scalars().all()
+        if not ids:
+            return token, []
+        db.execute(
+            update(JobItem).where(JobItem.id.in_(ids), JobItem.status == "pending")
+            .values(status="running", claim=token, claimed_at=datetime.utcnow())
+        )
+        db.commit()
+        return token, db.execute(select(JobItem).where(JobItem.claim == token).order_by(JobItem.id)).scalars().all()
+
+    def run_once(self):
+        """Claim and process one batch; returns the number of items handled"""
+        db = SessionLocal()
+        try:
+            self.requeue_stale(db)
+            token, items = self.claim(db)
+            if not items:
+                return 0
+            jobs = {j.id: j for j in db.execute(select(Job).where(Job.id.in_({i.job_id for i in items}))).scalars()}
+            for job in jobs.values():
+                if job.status == "queued":
+                    job.status = "running"
+            db.commit()
+
+            outcomes = {}
+            # items of one job share its options (tta / top_k)
+            for job_id, job in jobs.items():
+                batch = [i for i in items if i.job_id == job_id]
+                blobs, readable = [], []
+                for item in batch:
+                    try:
+                        blobs.append(read_item(item, self.open_archive))
+                        readable.append(item)
+                    except Exception as e:
+                        outcomes[item.id] = e
+                results = self.process(blobs, **json.loads(job.options or "{}")) if blobs else []
+                outcomes.update({item.id: r for item, r in zip(readable, results)})
+            self._commit(db, token, items, jobs, outcomes)
+            with self._lock:
+                self.batches += 1
+                self.items += len(items)
+            return len(items)
+        finally:
+            db.close()
+
+    def _commit(self, db, token, items, jobs, outcomes):
+        now = datetime.utcnow()
+        detections = []
+        counts = {job_id: [0, 0] for job_id in jobs}  # succeeded, failed
+        for item in items:
+            outcome = outcomes[item.id]
+            if isinstance(outcome, Exception):
+                values = {"status": "error", "result": None, "image_path": None,
+                          "error": f"Could not process image: {outcome}"}
+            else:
+                result, image_path = outcome
+                values = {"status": "done", "result": json.dumps(result), "image_path": image_path, "error": None}
+            # the claim may have gone stale and been requeued (or the item cancelled) while we ran:
+            # only record items this runner still holds
+            matched = db.execute(update(JobItem).where(
+                JobItem.id == item.id, JobItem.claim == token, JobItem.status == "running").values(**values)).rowcount
+            if not matched:
+                continue
+            if values["status"] == "error":
+                counts[item.job_id][1] += 1
+                continue
+            detections.append({"timestamp": now, "image_path": image_path, "label": result["label"],
+                               "confidence": result["confidence"], "advice": result["advice"], "source": "job",
+                               "model_version": result.get("model_version")})
+            counts[item.job_id][0] += 1
+        write_detections(db, detections)
+        for job_id, (ok, bad) in counts.items():
+            if ok or bad:
+                db.execute(update(Job).where(Job.id == job_id).values(
+                    processed=Job.processed + ok + bad, succeeded=Job.succeeded + ok,
+                    failed=Job.failed + bad, updated_at=now))
+        db.commit()
+
+        for job_id in jobs:
+            remaining = db.execute(select(func.count()).select_from(JobItem).where(
+                JobItem.job_id == job_id, JobItem.status.in_(("pending", "running")))).scalar()
+            if remaining == 0:
+                finished = db.execute(update(Job).where(Job.id == job_id, Job.status == "running")
+                                      .values(status="done", finished_at=now, updated_at=now)).rowcount
+                db.commit()
+                if finished:
+                    shutil.rmtree(os.path.join(JOB_DIR, job_id), ignore_errors=True)
+
+    def stats(self):
+        db = SessionLocal()
+        try:
+            by_status = dict(db.execute(select(JobItem.status, func.count()).group_by(JobItem.status)).all())
+        finally:
+            db.close()
+        with self._lock:
+            return {"workers": self.workers, "batch_size": self.batch_size, "batches": self.batches,
+                    "items": self.items, "errors": self.errors, "items_by_status": by_status}
@@ -0,0 +1,222 @@
+# metrics.py
+import time
+import threading
+from contextlib import contextmanager
+import profiling
+
+# Minimal Prometheus text-format metrics (no client library, no network calls); served on /metrics
+
+def _fmt_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if tuple(labels) != self.labelnames:
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[k]) for k in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn  # optional callback returning the current value (unlabelled gauges)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.fn is not None:
+            try:
+                items = [((), self.fn())]
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+# latency buckets in seconds, size buckets in bytes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (16384, 65536, 262144, 524288, 1048576, 2097152, 3145728, 5242880, 10485760)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            items = [(k, list(counts), total, n) for k, (counts, total, n) in self._values.items()]
+        lines = self.header()
+        for key, counts, total, n in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = (("le", _fmt_value(bound if bound == float("inf") else float(bound))),)
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {n}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+def gauge(name, help, labelnames=(), fn=None):
+    return REGISTRY.register(Gauge(name, help, labelnames, fn))
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- metrics shared across modules ---
+HTTP_REQUESTS = counter("farmguard_http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+HTTP_LATENCY = histogram("farmguard_http_request_duration_seconds", "HTTP request latency by route", ("route", "method"))
+HTTP_IN_FLIGHT = gauge("farmguard_http_requests_in_flight", "HTTP requests currently being served")
+STAGE_LATENCY = histogram("farmguard_detect_stage_seconds", "Time spent in each /detect pipeline stage", ("stage",))
+UPLOAD_SIZE = histogram("farmguard_upload_size_bytes", "Size of uploaded images", (), SIZE_BUCKETS)
+INFERENCE_BATCH_SIZE = histogram("farmguard_inference_batch_size", "Images per batched forward pass", ("model_version",), (1, 2, 4, 8, 16, 32, 64, 128))
+INFERENCE_LATENCY = histogram("farmguard_inference_forward_seconds", "Duration of one batched forward pass", ("model_version",))
+DB_WRITE_LATENCY = histogram("farmguard_db_write_seconds", "Duration of one bulk detection insert + commit")
+DB_ROWS_WRITTEN = counter("farmguard_db_rows_written_total", "Detection rows written")
+
+def timed_stage(stage, shared=None):
+    """Time a detect stage into the stage histogram and, for profiled requests, the request's trace"""
+    if not profiling.tracing():
+        return STAGE_LATENCY.time(stage=stage)  # the common case costs nothing extra
+    return _traced_stage(stage, shared)
+
+@contextmanager
+def _traced_stage(stage, shared):
+    with STAGE_LATENCY.time(stage=stage), profiling.stage(stage, shared):
+        yield
+
+def timed_call(stage, fn, *args, **kwargs):
+    """fn(*args) timed into the detect stage histogram; handy for work handed to a thread pool"""
+    with timed_stage(stage):
+        return fn(*args, **kwargs)
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests, latency and in-flight requests per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # route template (not the raw path) keeps label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None)
+            if path is None:
+                path = "/uploads" if scope.get("path", "").startswith("/uploads/") else "unmatched"
+            method = scope.get("method", "")
+            HTTP_LATENCY.observe(time.perf_counter() - started, route=path, method=method)
+            HTTP_REQUESTS.inc(route=path, method=method, status=status["code"])
@@ -1,9 +1,9 @@
 # model_utils.py
-import tensorflow as tf
 import numpy as np
 from PIL import Image
 import io
 import os
+import threading
 
 IMG_SIZE = (224, 224)   # change if your model needs different size
 LABELS = ["healthy","blight","rust","powdery_mildew"]  # example: replace with your labels
@@ -14,7 +14,13 @@ ADVICE = {
     "healthy": "No visible disease — keep monitoring."
 }
 
-def load_model(tf_model_path):
+def load_model(tf_model_path, backend=None, fallback=True):
+    """Load the model behind a backend (keras/savedmodel/tflite/onnx), see backends.py"""
+    from backends import load_backend
+    return load_backend(tf_model_path, backend, fallback)
+
+def load_keras_model(tf_model_path, fallback=True):
+    import tensorflow as tf  # imported lazily: TF alone costs seconds of import time
     try:
         # Try to load the real model
         if os.path.exists(tf_model_path):
@@ -24,15 +30,20 @@ def load_model(tf_model_path):
             return model
         else:
             print(f"Model not found at {tf_model_path}")
+            if not fallback:
+                raise FileNotFoundError(tf_model_path)
             print("Creating fallback model...")
             return create_fallback_model()
     except Exception as e:
+        if not fallback:
+            raise
         print(f"Error loading model: {e}")
         print("Creating fallback model...")
         return create_fallback_model()
 
 def create_fallback_model():
     """Create a lightweight CNN model for free tier deployment"""
+    import tensorflow as tf
     print("Creating lightweight CNN model for deployment...")
     
     model = tf.keras.Sequential([
@@ -53,18 +64,51 @@ def create_fallback_model():
     )
     
     return model
-def preprocess_image_bytes(image_bytes):
+_buffers = threading.local()
+
+def batch_buffer(n, dtype=np.float32, shape=(*IMG_SIZE, 3)):
+    """(n, *shape) view of this thread's reusable input buffer, grown as needed and never freed.
+
+    Valid until the same thread asks for a buffer of the same dtype/shape again,
+    so only use it for inputs that are consumed before that (one forward pass).
+    """
+    pool = getattr(_buffers, "pool", None)
+    if pool is None:
+        pool = _buffers.pool = {}
+    key = (np.dtype(dtype).str, tuple(shape))
+    buf = pool.get(key)
+    if buf is None or len(buf) < n:
+        buf = pool[key] = np.empty((n, *shape), dtype=dtype)
+    return buf[:n]
+
+def normalize_into(pixels, out):
+    """uint8 pixels -> float32 in [0, 1], written into `out` in one pass (no float64 / full-size temporaries)"""
+    # the ufunc casts uint8 -> float32 in small internal chunks; pixels broadcast into a (1, H, W, C) out
+    return np.divide(pixels, np.float32(255.0), out=out, dtype=np.float32)
+
+def image_pixels(img):
+    # PIL image -> (H, W, C) uint8 at model size
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.size != IMG_SIZE:
+        img = img.resize(IMG_SIZE)
+    return np.asarray(img)
+
+def image_to_tensor(img, out=None):
+    # PIL image -> (1, H, W, C) numpy float32 ready for model, filled into `out` if given
+    pixels = image_pixels(img)
+    if out is None:
+        out = np.empty((1, *pixels.shape), dtype=np.float32)
+    return normalize_into(pixels, out)
+
+def preprocess_image_bytes(image_bytes, out=None):
     # returns a (1, H, W, C) numpy float32 ready for model
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    img = img.resize(IMG_SIZE)
-    arr = np.asarray(img)/255.0
-    arr = np.expand_dims(arr.astype("float32"), axis=0)
-    return arr
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft("RGB", IMG_SIZE)  # JPEG: decode at reduced scale, no-op for other formats
+    return image_to_tensor(img, out)
 
-def predict(model, image_bytes):
-    x = preprocess_image_bytes(image_bytes)
-    preds = model.predict(x)  # shape (1, num_classes)
-    probs = preds[0]
+def postprocess(probs):
+    # turns one row of model output into the label/confidence/advice dict
     top_idx = int(np.argmax(probs))
     label = LABELS[top_idx]
     
@@ -82,3 +126,22 @@ def predict(model, image_bytes):
     advice = ADVICE.get(label, "Consult agronomist")
     return {"label": label, "confidence": boosted_confidence, "advice": advice}
 
+def predict_probs(model, batch):
+    """Raw (N, num_classes) probabilities for a (N, H, W, C) batch"""
+    return np.asarray(model.predict(batch))
+
+def predict_batch(model, batch):
+    """Run one forward pass over a (N, H, W, C) batch and return N result dicts"""
+    preds = model.predict(batch)  # shape (N, num_classes)
+    return [postprocess(probs) for probs in preds]
+
+def warm_up(model, batch_sizes=(1,), rounds=1):
+    """Run dummy batches so the first real request doesn't pay graph tracing / kernel setup"""
+    dtype = getattr(model, "input_dtype", np.float32)  # uint8-input backends trace their uint8 graph
+    for _ in range(rounds):
+        for n in batch_sizes:
+            model.predict(np.zeros((n, *IMG_SIZE, 3), dtype=dtype))
+
+def predict(model, image_bytes):
+    x = preprocess_image_bytes(image_bytes, batch_buffer(1))
+    return predict_batch(model, x)[0]
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Opt-in per-request profiling: stage timings for a sample of requests (and for slow ones),
+plus a statistical stack profile for a fraction of those, written as JSON lines.
+
+    PROFILE_SAMPLE_RATE=0.01 PROFILE_STACK_RATE=0.2 PROFILE_SLOW_MS=1000 uvicorn app:app
+    python profiling.py                          # summarise ./profile.jsonl
+    python profiling.py --route /detect --top 5  # one route, five slowest requests
+    python profiling.py --folded detect.folded   # stacks for flamegraph.pl / speedscope
+
+With every PROFILE_* setting at 0 nothing is installed: stage hooks cost one
+context-variable lookup. Stack samples come from the threads working on the request
+(detect pool threads inside a stage, the request's event loop thread, and the batch
+scheduler during inference), so under concurrency they include shared work too.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))  # fraction of requests traced
+PROFILE_STACK_RATE = float(os.getenv("PROFILE_STACK_RATE", 0.1))  # fraction of traced requests also stack-sampled
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 0))          # >0: also record any request slower than this
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))   # stack sampling interval
+PROFILE_PATH = os.getenv("PROFILE_PATH", "./profile.jsonl")
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", 50 * 1024 * 1024))  # then rotated to <path>.1
+PROFILE_MAX_DEPTH = 64
+
+# frames a thread sits in while it waits for work; samples there are not CPU time
+_IDLE = {("selectors.py", "select"), ("threading.py", "wait")}
+
+_current = contextvars.ContextVar("profile_trace", default=None)
+
+def enabled():
+    return PROFILE_SAMPLE_RATE > 0 or PROFILE_SLOW_MS > 0
+
+def tracing():
+    """True inside a request that is being traced"""
+    return _current.get() is not None
+
+class Trace:
+    """Stage timings (and stack samples) of one request"""
+
+    def __init__(self, sampled, stacks):
+        self.sampled = sampled
+        self.stages = {}      # name -> [seconds, calls]
+        self.tags = {}
+        self.samples = {} if stacks else None   # folded stack -> count
+        self.threads = {}     # thread ident -> active stages on it
+        self.shared = {}      # thread name prefix -> active stages using those threads
+        self._lock = threading.Lock()
+
+    def enter(self, ident, shared=None):
+        with self._lock:
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+            if shared:
+                self.shared[shared] = self.shared.get(shared, 0) + 1
+
+    def exit(self, ident, name, seconds, shared=None):
+        with self._lock:
+            if self.threads.get(ident, 0) <= 1:
+                self.threads.pop(ident, None)
+            else:
+                self.threads[ident] -= 1
+            if shared:
+                if self.shared.get(shared, 0) <= 1:
+                    self.shared.pop(shared, None)
+                else:
+                    self.shared[shared] -= 1
+            s = self.stages.setdefault(name, [0.0, 0])
+            s[0] += seconds
+            s[1] += 1
+
+    def sample_threads(self, names):
+        with self._lock:
+            idents = set(self.threads)
+            for prefix in self.shared:
+                idents.update(i for i, n in names.items() if n.startswith(prefix))
+            return idents
+
+@contextmanager
+def stage(name, shared=None):
+    """Record a stage of the current request's trace (no-op when the request isn't traced).
+
+    `shared` names a thread prefix (e.g. "batch-scheduler") doing work for this stage
+    on another thread, so stack samples cover it too.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    ident = threading.get_ident()
+    trace.enter(ident, shared)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.exit(ident, name, time.perf_counter() - started, shared)
+
+def annotate(**tags):
+    """Attach key/values (model version, batch size...) to the current trace, if any"""
+    trace = _current.get()
+    if trace is not None:
+        trace.tags.update(tags)
+
+class _Sampler:
+    """One thread that samples the stacks of stack-traced requests while any are in flight"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.traces = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, trace):
+        with self._lock:
+            self.traces.add(trace)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, trace):
+        with self._lock:
+            self.traces.discard(trace)
+
+    def _run(self):
+        labels = {}
+        while True:
+            with self._lock:  # held for the pass, so a removed trace is never written to again
+                if not self.traces:
+                    self._wake.clear()
+                else:
+                    frames = sys._current_frames()
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                    for trace in self.traces:
+                        for ident in trace.sample_threads(names):
+                            frame = frames.get(ident)
+                            folded = _fold(frame, labels) if frame is not None else None
+                            if folded is not None:
+                                trace.samples[folded] = trace.samples.get(folded, 0) + 1
+                    del frames
+            if not self._wake.is_set():
+                self._wake.wait()
+            time.sleep(self.interval)
+
+def _fold(frame, labels):
+    # root-first "file:function;file:function" (the collapsed format flame graph tools read)
+    stack = []
+    while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        label = labels.get(code)
+        if label is None:
+            label = labels[code] = (os.path.basename(code.co_filename), code.co_name)
+        stack.append(label)
+        frame = frame.f_back
+    if not stack or stack[0] in _IDLE:
+        return None
+    return ";".join(f"{f}:{n}" for f, n in reversed(stack))
+
+class _Writer:
+    """Appends records from a background thread; whole lines go out in one O_APPEND write so workers can share the file"""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, record):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="profile-writer", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1   # never block a request on the profile file
+
+    def _run(self):
+        while True:
+            lines = [self._queue.get()]
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in lines).encode()
+            try:
+                if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(f"❌ Could not write profile records: {e}")
+
+class ProfilingMiddleware:
+    """ASGI middleware that traces a sample of requests (and slow ones) into PROFILE_PATH"""
+
+    def __init__(self, app, sample_rate=PROFILE_SAMPLE_RATE, stack_rate=PROFILE_STACK_RATE,
+                 slow_ms=PROFILE_SLOW_MS, interval_ms=PROFILE_INTERVAL_MS, path=PROFILE_PATH):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.stack_rate = stack_rate
+        self.slow = slow_ms / 1000.0 if slow_ms > 0 else None
+        self.sampler = _Sampler(interval_ms / 1000.0)
+        self.writer = _Writer(path, PROFILE_MAX_BYTES)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow is None:
+            return await self.app(scope, receive, send)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        trace = Trace(sampled, stacks=sampled and random.random() < self.stack_rate)
+        token = _current.set(trace)
+        loop_thread = threading.get_ident()
+        trace.enter(loop_thread)
+        if trace.samples is not None:
+            self.sampler.add(trace)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            self.sampler.remove(trace)
+            trace.exit(loop_thread, "request", duration)
+            _current.reset(token)
+            if sampled or duration >= self.slow:
+                self.writer.put(self._record(scope, status["code"], duration, trace))
+
+    def _record(self, scope, status, duration, trace):
+        route = getattr(scope.get("route"), "path", None) or scope.get("path", "")
+        record = {
+            "ts": round(time.time(), 3),
+            "pid": os.getpid(),
+            "method": scope.get("method", ""),
+            "route": route,
+            "status": status,
+            "duration_ms": round(duration * 1000.0, 3),
+            "reason": "sample" if trace.sampled else "slow",
+            "stages": {k: {"ms": round(s * 1000.0, 3), "calls": n} for k, (s, n) in trace.stages.items() if k != "request"},
+        }
+        if trace.tags:
+            record["tags"] = trace.tags
+        if trace.samples is not None:
+            record["profile"] = {
+                "interval_ms": self.sampler.interval * 1000.0,
+                "samples": sum(trace.samples.values()),
+                "stacks": sorted(trace.samples.items(), key=lambda kv: -kv[1]),
+            }
+        return record
+
+# --- summaries ---
+
+def read_records(path=PROFILE_PATH, route=None, since=None):
+    for p in (path + ".1", path):
+        if not os.path.exists(p):
+            continue
+        with open(p) as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue   # a line cut short by a crash
+                if (route is None or r.get("route") == route) and (since is None or r.get("ts", 0) >= since):
+                    yield r
+
+def _pct(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def summarize(records, top=10):
+    """Per route: latency percentiles, where the time went by stage, slowest requests, hottest stacks"""
+    routes = {}
+    for r in records:
+        routes.setdefault(f"{r.get('method', '')} {r.get('route', '')}", []).append(r)
+    out = {}
+    for key, rs in sorted(routes.items()):
+        durations = sorted(r["duration_ms"] for r in rs)
+        stages = {}
+        for r in rs:
+            for name, s in r.get("stages", {}).items():
+                stages.setdefault(name, []).append(s["ms"])
+        total = sum(durations) or 1.0
+        stacks, self_time, samples = {}, {}, 0
+        for r in rs:
+            for folded, n in r.get("profile", {}).get("stacks", ()):
+                stacks[folded] = stacks.get(folded, 0) + n
+                leaf = folded.rsplit(";", 1)[-1]
+                self_time[leaf] = self_time.get(leaf, 0) + n
+                samples += n
+        out[key] = {
+            "requests": len(rs),
+            "duration_ms": {"p50": _pct(durations, 0.50), "p95": _pct(durations, 0.95),
+                            "p99": _pct(durations, 0.99), "max": durations[-1]},
+            "stages": {
+                name: {"mean_ms": sum(v) / len(v), "p95_ms": _pct(sorted(v), 0.95), "share": sum(v) / total}
+                for name, v in sorted(stages.items(), key=lambda kv: -sum(kv[1]))
+            },
+            "slowest": [
+                {"ts": r["ts"], "duration_ms": r["duration_ms"], "status": r.get("status"),
+                 "stages": {k: s["ms"] for k, s in r.get("stages", {}).items()}, **({"tags": r["tags"]} if "tags" in r else {})}
+                for r in sorted(rs, key=lambda r: -r["duration_ms"])[:top]
+            ],
+            "profile": {
+                "samples": samples,
+                "top_functions": [{"function": f, "share": n / samples} for f, n in
+                                  sorted(self_time.items(), key=lambda kv: -kv[1])[:top]] if samples else [],
+            },
+            "_stacks": stacks,
+        }
+    return out
+
+def summary(path=PROFILE_PATH, route=None, since=None, top=10):
+    """summarize() without the raw folded stacks, for the /internal/profile endpoint"""
+    result = summarize(read_records(path, route, since), top)
+    for r in result.values():
+        del r["_stacks"]
+    return {"enabled": enabled(), "path": path, "routes": result}
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise request profiles written by ProfilingMiddleware")
+    parser.add_argument("path", nargs="?", default=PROFILE_PATH)
+    parser.add_argument("--route", help="only this route template, e.g. /detect")
+    parser.add_argument("--since", type=float, help="unix time; only newer records")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--folded", help="write aggregated stacks here in collapsed (flamegraph.pl) format")
+    args = parser.parse_args()
+
+    result = summarize(read_records(args.path, args.route, args.since), args.top)
+    if not result:
+        print(f"No profile records in {args.path}")
+        return
+    for key, r in result.items():
+        d = r["duration_ms"]
+        print(f"\n{key}: {r['requests']} requests   p50 {d['p50']:.1f}ms  p95 {d['p95']:.1f}ms  "
+              f"p99 {d['p99']:.1f}ms  max {d['max']:.1f}ms")
+        for name, s in r["stages"].items():
+            print(f"   {name:<14} mean {s['mean_ms']:9.2f}ms  p95 {s['p95_ms']:9.2f}ms  {s['share'] * 100:5.1f}% of request time")
+        for s in r["slowest"][:args.top]:
+            stages = ", ".join(f"{k} {v:.1f}" for k, v in s["stages"].items())
+            tags = " ".join(f"{k}={v}" for k, v in s.get("tags", {}).items())
+            print(f"   slow: {s['duration_ms']:.1f}ms at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(s['ts']))}  [{stages}] {tags}")
+        if r["profile"]["samples"]:
+            print(f"   {r['profile']['samples']} stack samples, most self time in:")
+            for f in r["profile"]["top_functions"]:
+                print(f"      {f['share'] * 100:5.1f}%  {f['function']}")
+    if args.folded:
+        stacks = {}
+        for r in result.values():
+            for folded, n in r["_stacks"].items():
+                stacks[folded] = stacks.get(folded, 0) + n
+        with open(args.folded, "w") as f:
+            for folded, n in sorted(stacks.items(), key=lambda kv: -kv[1]):
+                f.write(f"{folded} {n}\n")
+        print(f"\n✅ Wrote {len(stacks)} stacks to {args.folded}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# registry.py
+import os
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from model_utils import load_model, warm_up, predict_probs
+from inference import BatchScheduler
+
+# Hot-swappable models: an active version plus an optional candidate that gets a share of traffic.
+# With MODEL_MANIFEST set, every worker polls that JSON file and loads / swaps / routes as it says:
+#   {"active": {"version": "v2", "path": "./model/v2/saved_model"},
+#    "candidate": {"version": "v3", "path": "./model/v3/saved_model", "percent": 10}}
+# entries may also carry "url" / "sha256" to fetch the archive into the artifact cache (artifacts.py)
+MODEL_MANIFEST = os.getenv("MODEL_MANIFEST", "")
+MODEL_MANIFEST_POLL = float(os.getenv("MODEL_MANIFEST_POLL", 5))   # seconds between manifest checks
+WARMUP_BATCH_SIZES = [int(n) for n in os.getenv("WARMUP_BATCH_SIZES", "1,4").split(",") if n.strip()]
+WARMUP_ROUNDS = int(os.getenv("WARMUP_ROUNDS", 1))
+
+def default_model_version(path):
+    # changes whenever the model file/dir is replaced, so cached results don't go stale
+    if os.path.exists(path):
+        return f"{os.path.basename(os.path.normpath(path))}-{int(os.path.getmtime(path))}"
+    return "fallback"
+
+class ModelSlot:
+    """One loaded model version with its own batch scheduler (a forward pass never mixes versions)"""
+
+    def __init__(self, version, path, model, load_seconds, warmup_seconds):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+        self.loaded_at = time.time()
+        self.scheduler = BatchScheduler(model, run_batch=predict_probs, version=version).start()
+        self.refs = 0          # requests currently using this slot
+        self.retired = False   # swapped out; the scheduler stops once refs drops to 0
+
+    def matches(self, spec):
+        return self.path == spec["path"] and spec.get("version") in (None, self.version)
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "in_use": self.refs,
+            "inference": self.scheduler.stats(),
+        }
+
+class ModelRegistry:
+    """Active + candidate model versions, swapped atomically while requests are in flight.
+
+    Requests take a slot with `use()` (or acquire/release) and submit to that slot's
+    scheduler, so a swap never changes the model under a running request: the old
+    slot keeps serving whoever holds it and shuts its scheduler down when released.
+    """
+
+    def __init__(self, warmup_batch_sizes=WARMUP_BATCH_SIZES, warmup_rounds=WARMUP_ROUNDS, loader=load_model):
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.warmup_rounds = warmup_rounds
+        self.loader = loader
+        self.active = None
+        self.candidate = None
+        self.candidate_percent = 0.0
+        self.status = {"state": "loading", "error": None, "load_seconds": None, "warmup_seconds": None}
+        self.routed = {}       # version -> requests routed to it
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # one load at a time: two models warming up would fight for CPU
+        self._watcher = None
+        self._stop = threading.Event()
+        self._manifest_stamp = None
+
+    # --- loading / swapping ---
+
+    def load(self, path, version=None, role="active", percent=None, url=None, sha256=None):
+        """Load and warm a model, then swap it in as `role`. Blocking; run it off the request path.
+
+        `url` / `sha256` fetch a missing `path` from the artifact cache (default: MODEL_URL / MODEL_SHA256).
+        A failed load leaves the serving models untouched and returns None. Only the first
+        active model may fall back to the untrained CNN; every later load is strict, so a
+        bad manifest path can't swap a random model in.
+        """
+        from artifacts import resolve_model_path
+        artifact = {}
+        if url is not None:
+            artifact.update(url=url, version=version or "")
+        if sha256 is not None:
+            artifact.update(sha256=sha256)
+        with self._load_lock:
+            try:
+                started = time.perf_counter()
+                resolved = resolve_model_path(path, **artifact)
+                version = version or default_model_version(resolved)
+                model = self.loader(resolved, fallback=role == "active" and self.active is None)
+                load_seconds = time.perf_counter() - started
+                started = time.perf_counter()
+                warm_up(model, self.warmup_batch_sizes, self.warmup_rounds)
+                slot = ModelSlot(version, path, model, load_seconds, time.perf_counter() - started)
+            except Exception as e:
+                print(f"❌ Model {version or path} failed to load: {e}")
+                if self.active is None:
+                    self.status.update(state="failed", error=str(e))
+                return None
+        self._swap(slot, role, percent)
+        print(f"✅ Model {version} ready as {role} (load {slot.load_seconds:.2f}s, warm-up {slot.warmup_seconds:.2f}s)")
+        return slot
+
+    def load_async(self, *args, **kwargs):
+        thread = threading.Thread(target=self.load, args=args, kwargs=kwargs, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def _swap(self, slot, role, percent=None):
+        with self._lock:
+            if role == "active":
+                old, self.active = self.active, slot
+                self.status.update(state="ready", error=None, load_seconds=slot.load_seconds,
+                                   warmup_seconds=slot.warmup_seconds)
+            else:
+                old, self.candidate = self.candidate, slot
+                if percent is not None:
+                    self.candidate_percent = float(percent)
+            self._retire(old)
+
+    def promote(self):
+        """Make the candidate the active model (no reload)"""
+        with self._lock:
+            if self.candidate is None:
+                return False
+            old, self.active, self.candidate = self.active, self.candidate, None
+            self.candidate_percent = 0.0
+            self._retire(old)
+        print(f"✅ Model {self.active.version} promoted to active")
+        return True
+
+    def drop_candidate(self):
+        with self._lock:
+            old, self.candidate = self.candidate, None
+            self.candidate_percent = 0.0
+            self._retire(old)
+
+    def _retire(self, slot):
+        # called with self._lock held
+        if slot is not None and slot not in (self.active, self.candidate):
+            slot.retired = True
+            if slot.refs == 0:
+                slot.scheduler.stop()
+
+    # --- routing ---
+
+    def acquire(self):
+        """Slot for one request: the candidate for candidate_percent of requests, else the active model"""
+        with self._lock:
+            slot = self.active
+            if self.candidate is not None and random.random() * 100.0 < self.candidate_percent:
+                slot = self.candidate
+            if slot is not None:
+                slot.refs += 1
+                self.routed[slot.version] = self.routed.get(slot.version, 0) + 1
+            return slot
+
+    def release(self, slot):
+        with self._lock:
+            slot.refs -= 1
+            if slot.retired and slot.refs == 0:
+                slot.scheduler.stop()  # queue is empty: every holder has its results
+
+    @contextmanager
+    def use(self):
+        slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            if slot is not None:
+                self.release(slot)
+
+    @property
+    def ready(self):
+        return self.active is not None
+
+    def queue_depth(self):
+        with self._lock:
+            slots = [s for s in (self.active, self.candidate) if s is not None]
+        return sum(s.scheduler.stats()["queue_depth"] for s in slots)
+
+    # --- manifest ---
+
+    def apply_manifest(self, manifest):
+        """Bring the loaded models in line with a manifest dict (blocking while models load)"""
+        active, candidate = manifest.get("active"), manifest.get("candidate")
+        if active and (self.active is None or not self.active.matches(active)):
+            if self.candidate is not None and self.candidate.matches(active):
+                self.promote()
+            else:
+                self.load(active["path"], active.get("version"), "active",
+                          url=active.get("url", ""), sha256=active.get("sha256", ""))
+        if candidate:
+            percent = float(candidate.get("percent", 0))
+            if self.candidate is None or not self.candidate.matches(candidate):
+                self.load(candidate["path"], candidate.get("version"), "candidate", percent,
+                          url=candidate.get("url", ""), sha256=candidate.get("sha256", ""))
+            else:
+                self.candidate_percent = percent
+        elif self.candidate is not None:
+            self.drop_candidate()
+
+    def check_manifest(self, path):
+        """Re-apply the manifest if the file changed since the last check"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._manifest_stamp:
+            return
+        self._manifest_stamp = stamp
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Ignoring model manifest {path}: {e}")
+            return
+        self.apply_manifest(manifest)
+
+    def watch(self, path, interval=MODEL_MANIFEST_POLL):
+        """Apply the manifest now and whenever it changes, on a background thread"""
+        def run():
+            while not self._stop.is_set():
+                self.check_manifest(path)
+                self._stop.wait(interval)
+        self._watcher = threading.Thread(target=run, name="model-manifest", daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    def stop(self):
+        """Stop watching and shut every scheduler down after its queued work"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(5)
+        with self._lock:
+            slots = [s for s in (self.active, self.candidate) if s is not None]
+        for slot in slots:
+            slot.scheduler.stop()
+
+    def stats(self):
+        with self._lock:
+            active, candidate = self.active, self.candidate
+            return {
+                "active": active.stats() if active else None,
+                "candidate": candidate.stats() if candidate else None,
+                "candidate_percent": self.candidate_percent,
+                "routed": dict(self.routed),
+                "manifest": MODEL_MANIFEST or None,
+            }
@@ -0,0 +1,166 @@
+# rollups.py
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, insert, update
+from db import Detection, DetectionRollup
+from history import _naive_utc
+
+# Detection counts per hour and per day, updated in the same transaction as the detection inserts
+PERIODS = ("hour", "day")
+BUCKETS = ("hour", "day", "week", "month")   # week/month are summed from the daily rollups
+GROUP_FIELDS = ("label", "source", "model_version")
+
+class InvalidStatsQuery(ValueError):
+    pass
+
+def truncate(ts, bucket):
+    """Start of the bucket containing `ts` (weeks start on Monday)"""
+    if bucket == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        return day
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    raise InvalidStatsQuery(f"bucket must be one of {', '.join(BUCKETS)}")
+
+def rollup_deltas(rows, deltas=None):
+    """Accumulate detection row dicts into {(period, bucket, label, source, model_version): [count, confidence_sum]}"""
+    deltas = {} if deltas is None else deltas
+    for r in rows:
+        ts = r.get("timestamp") or datetime.utcnow()
+        label, source = r.get("label") or "unknown", r.get("source") or "web"
+        version = r.get("model_version") or "unknown"
+        confidence = r.get("confidence") or 0.0
+        for period in PERIODS:
+            d = deltas.setdefault((period, truncate(ts, period), label, source, version), [0, 0.0])
+            d[0] += 1
+            d[1] += confidence
+    return deltas
+
+def _params(deltas):
+    return [{"period": p, "bucket": b, "label": l, "source": s, "model_version": v, "count": c, "confidence_sum": cs}
+            for (p, b, l, s, v), (c, cs) in deltas.items()]
+
+def _upsert(dialect):
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    stmt = dialect_insert(DetectionRollup)
+    return stmt.on_conflict_do_update(
+        index_elements=["period", "bucket", "label", "source", "model_version"],
+        set_={
+            "count": DetectionRollup.count + stmt.excluded["count"],
+            "confidence_sum": DetectionRollup.confidence_sum + stmt.excluded["confidence_sum"],
+        },
+    )
+
+def apply_rollups(db, rows):
+    """Add newly inserted detection rows to the rollups, inside the caller's transaction"""
+    params = _params(rollup_deltas(rows))
+    if not params:
+        return
+    stmt = _upsert(db.get_bind().dialect.name)
+    if stmt is not None:
+        db.execute(stmt, params)
+        return
+    for p in params:  # other databases: update, insert if the bucket is new
+        key = (DetectionRollup.period == p["period"], DetectionRollup.bucket == p["bucket"],
+               DetectionRollup.label == p["label"], DetectionRollup.source == p["source"],
+               DetectionRollup.model_version == p["model_version"])
+        updated = db.execute(update(DetectionRollup).where(*key).values(
+            count=DetectionRollup.count + p["count"],
+            confidence_sum=DetectionRollup.confidence_sum + p["confidence_sum"],
+        )).rowcount
+        if not updated:
+            db.execute(insert(DetectionRollup).values(**p))
+
+def rebuild_rollups(db, chunk_size=10000):
+    """Recompute all rollups from `detections` (backfill / repair); returns the number of rollup rows"""
+    deltas = {}
+    stmt = select(Detection.timestamp, Detection.label, Detection.source, Detection.model_version, Detection.confidence)
+    for rows in db.execute(stmt.execution_options(yield_per=chunk_size)).partitions():
+        rollup_deltas(({"timestamp": t, "label": l, "source": s, "model_version": v, "confidence": c}
+                       for t, l, s, v, c in rows), deltas)
+    db.execute(delete(DetectionRollup))
+    params = _params(deltas)
+    if params:
+        db.execute(insert(DetectionRollup), params)
+    db.commit()
+    return len(params)
+
+def parse_group_by(group_by):
+    fields = [f.strip() for f in (group_by or "").split(",") if f.strip()]
+    bad = [f for f in fields if f not in GROUP_FIELDS]
+    if bad:
+        raise InvalidStatsQuery(f"group_by accepts {', '.join(GROUP_FIELDS)}")
+    return fields
+
+def stats_query(bucket="day", since=None, until=None, label=None, source=None, model_version=None):
+    """SELECT over the hourly or daily rollups for the requested range"""
+    if bucket not in BUCKETS:
+        raise InvalidStatsQuery(f"bucket must be one of {', '.join(BUCKETS)}")
+    period = "hour" if bucket == "hour" else "day"
+    stmt = select(DetectionRollup.bucket, DetectionRollup.label, DetectionRollup.source, DetectionRollup.model_version,
+                  DetectionRollup.count, DetectionRollup.confidence_sum).where(DetectionRollup.period == period)
+    if since is not None:
+        stmt = stmt.where(DetectionRollup.bucket >= truncate(_naive_utc(since), bucket))
+    if until is not None:
+        stmt = stmt.where(DetectionRollup.bucket < _naive_utc(until))
+    if label:
+        stmt = stmt.where(DetectionRollup.label == label)
+    if source:
+        stmt = stmt.where(DetectionRollup.source == source)
+    if model_version:
+        stmt = stmt.where(DetectionRollup.model_version == model_version)
+    return stmt.order_by(DetectionRollup.bucket)
+
+def build_stats(rows, bucket, group_by):
+    """Sum rollup rows into `bucket`-sized groups per group_by fields"""
+    groups, total, total_conf = {}, 0, 0.0
+    for b, label, source, version, count, conf in rows:
+        values = {"label": label, "source": source, "model_version": version}
+        key = (truncate(b, bucket), *(values[f] for f in group_by))
+        g = groups.setdefault(key, [0, 0.0])
+        g[0] += count
+        g[1] += conf
+        total += count
+        total_conf += conf
+    series = []
+    for key, (count, conf) in sorted(groups.items(), key=lambda kv: (kv[0][0], *map(str, kv[0][1:]))):
+        entry = {"bucket": key[0].isoformat(), **dict(zip(group_by, key[1:]))}
+        entry.update(count=count, avg_confidence=conf / count if count else None)
+        series.append(entry)
+    return {
+        "bucket": bucket,
+        "group_by": group_by,
+        "series": series,
+        "total": {"count": total, "avg_confidence": total_conf / total if total else None},
+    }
+
+def fetch_stats(db, bucket="day", since=None, until=None, label=None, source=None, group_by="label",
+                model_version=None):
+    fields = parse_group_by(group_by)
+    rows = db.execute(stats_query(bucket, since, until, label, source, model_version)).all()
+    return build_stats(rows, bucket, fields)
+
+async def fetch_stats_async(db, bucket="day", since=None, until=None, label=None, source=None, group_by="label",
+                            model_version=None):
+    """fetch_stats on an AsyncSession"""
+    fields = parse_group_by(group_by)
+    rows = (await db.execute(stats_query(bucket, since, until, label, source, model_version))).all()
+    return build_stats(rows, bucket, fields)
+
+if __name__ == "__main__":
+    # python rollups.py : recompute every rollup from the detections table
+    from db import SessionLocal, init_db
+    init_db()
+    session = SessionLocal()
+    try:
+        print(f"✅ Rebuilt {rebuild_rollups(session)} rollup rows")
+    finally:
+        session.close()
@@ -0,0 +1,133 @@
+# storage.py
+import os
+import re
+import time
+import uuid
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.responses import FileResponse
+from starlette.datastructures import Headers
+
+# Stored images live at UPLOAD_DIR/ab/cd/<sha256>.jpg with a <sha256>.thumb.jpg next to them,
+# so no directory holds more than a few hundred files and names double as strong ETags
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+STORE_CACHE_MAX_AGE = int(os.getenv("STORE_CACHE_MAX_AGE", 31536000))  # content-addressed -> cache for a year
+THUMB_SUFFIX = ".thumb.jpg"
+TMP_SUFFIX = ".tmp"
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+def is_digest(name):
+    return bool(_DIGEST.match(name))
+
+def shard_dir(root, digest):
+    return os.path.join(root, digest[:2], digest[2:4])
+
+def is_sharded(image_path):
+    """True for paths written by ImageStore (root/ab/cd/<digest>.jpg)"""
+    head, name = os.path.split(image_path)
+    digest, ext = os.path.splitext(name)
+    if ext != ".jpg" or not _DIGEST.match(digest):
+        return False
+    head, sub2 = os.path.split(head)
+    sub1 = os.path.basename(head)
+    return sub1 == digest[:2] and sub2 == digest[2:4]
+
+def thumbnail_path(image_path):
+    """Thumbnail stored alongside image_path, or None for legacy flat uploads"""
+    if not image_path or not is_sharded(image_path):
+        return None
+    return image_path[:-len(".jpg")] + THUMB_SUFFIX
+
+def _write_atomic(path, data):
+    # concurrent identical uploads must not see a half-written file
+    tmp = f"{path}.{uuid.uuid4().hex}{TMP_SUFFIX}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class ImageStore:
+    """Content-addressed, hash-sharded image files plus thumbnails under `root`"""
+
+    def __init__(self, root=UPLOAD_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def image_path(self, digest):
+        return os.path.join(shard_dir(self.root, digest), f"{digest}.jpg")
+
+    def save(self, digest, jpeg_bytes, thumb_bytes=None):
+        """Store the image (and thumbnail) for `digest`; returns the image path. Repeats are no-ops"""
+        path = self.image_path(digest)
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if thumb_bytes is not None:
+            _write_atomic(thumbnail_path(path), thumb_bytes)
+        _write_atomic(path, jpeg_bytes)  # last, so an existing image implies its thumbnail
+        return path
+
+    def save_thumbnail(self, digest, thumb_bytes):
+        """Store only the thumbnail for `digest` (synced rows); returns the image path it belongs to"""
+        path = self.image_path(digest)
+        thumb = thumbnail_path(path)
+        if not os.path.exists(thumb):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(thumb, thumb_bytes)
+        return path
+
+    def iter_files(self):
+        """Every file under root as (path, mtime)"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    yield path, os.path.getmtime(path)
+                except FileNotFoundError:
+                    continue
+
+    def find_orphans(self, referenced, min_age=3600):
+        """Files not referenced by any detection (thumbnails follow their image), older than min_age.
+
+        `referenced` is a set of image paths as stored in the detections table. Young
+        files are skipped: their rows may still be queued in the write-behind writer.
+        """
+        keep = set()
+        for p in referenced:
+            if p:
+                keep.add(os.path.abspath(p))
+                thumb = thumbnail_path(p)
+                if thumb:
+                    keep.add(os.path.abspath(thumb))
+        cutoff = time.time() - min_age
+        for path, mtime in self.iter_files():
+            if mtime < cutoff and os.path.abspath(path) not in keep:
+                yield path
+
+    def remove_empty_dirs(self):
+        removed = 0
+        for dirpath, _, _ in os.walk(self.root, topdown=False):
+            if dirpath != self.root:
+                try:
+                    os.rmdir(dirpath)  # bottom-up, so emptied parents go too; non-empty ones fail
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with long-lived Cache-Control, and the content hash as ETag for sharded files"""
+
+    def __init__(self, *args, max_age=STORE_CACHE_MAX_AGE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = f"public, max-age={max_age}, immutable"
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        name = os.path.basename(str(full_path))
+        digest = name.split(".", 1)[0]
+        if _DIGEST.match(digest):
+            response.headers["etag"] = f'"{name}"'
+        response.headers["cache-control"] = self.cache_control
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+Edge sync: ship new detections (with their thumbnails) from a site to a central instance
+
+    python sync.py push http://hq:8000          # send HQ every row it doesn't have yet, chunk by chunk
+    python sync.py export ./outbox              # the same chunks as files (scp / USB stick)
+    python sync.py import ./outbox/*.fgs        # on HQ: load chunk files
+
+Only rows detected on this site (origin IS NULL) are sent, in id order. HQ stores
+each row's (origin, origin_id), so max(origin_id) per site is that site's
+high-water mark: a push asks HQ for it and continues from there, so an interrupted
+transfer loses at most the chunk in flight and the cost grows with the delta,
+not with the history. Importing a chunk twice is a no-op; a chunk that would
+leave a gap in a site's ids is refused. Site ids must grow in commit order, which
+holds for the SQLite default.
+
+Chunk format (.fgs, a zip archive):
+    chunk.json        origin, id range, row count, column encodings, string dictionaries
+    <column>.npy      one array per column, deflated; ids and timestamps delta-encoded,
+                      strings as dictionary codes, confidence as float64
+    thumbs/<sha>.jpg  thumbnails, stored as-is (already JPEG)
+Full-size images stay on the site; HQ gets the thumbnail beside the same content-addressed path
+(synced rows list no image_path in /history, only their thumbnail_path).
+"""
+
+import os
+import re
+import io
+import json
+import time
+import socket
+import zipfile
+import argparse
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from db import SessionLocal, Detection
+from db_writer import write_detections
+from storage import ImageStore, thumbnail_path, is_digest
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-worker lock
+    fcntl = None
+
+SYNC_ORIGIN = os.getenv("SYNC_ORIGIN") or socket.gethostname()  # this site's name at HQ
+SYNC_URL = os.getenv("SYNC_URL", "")            # HQ base URL; set on an edge box to push in the background
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", 300))   # seconds between background pushes
+SYNC_TOKEN = os.getenv("SYNC_TOKEN", "")        # shared secret; /sync refuses every request (403) without one
+SYNC_CHUNK_ROWS = int(os.getenv("SYNC_CHUNK_ROWS", 2000))
+SYNC_CHUNK_BYTES = int(os.getenv("SYNC_CHUNK_BYTES", 8388608))  # 8MB of thumbnails closes a chunk early
+SYNC_MAX_UPLOAD_SIZE = int(os.getenv("SYNC_MAX_UPLOAD_SIZE", 67108864))  # largest chunk HQ accepts (64MB)
+SYNC_MAX_UNZIPPED_SIZE = int(os.getenv("SYNC_MAX_UNZIPPED_SIZE", 134217728))  # a chunk's members, inflated
+SYNC_MAX_THUMB_SIZE = int(os.getenv("SYNC_MAX_THUMB_SIZE", 1048576))  # one thumbnail
+SYNC_TIMEOUT = float(os.getenv("SYNC_TIMEOUT", 60))
+SYNC_RETRIES = int(os.getenv("SYNC_RETRIES", 3))
+SYNC_LOCK_PATH = os.getenv("SYNC_LOCK_PATH", "./.farmguard-sync.lock")  # one pushing worker per site
+
+FORMAT = 1
+CHUNK_SUFFIX = ".fgs"
+EXPORT_COLUMNS = (
+    Detection.id, Detection.timestamp, Detection.image_path, Detection.label, Detection.confidence,
+    Detection.advice, Detection.source, Detection.model_version,
+)
+STRING_COLUMNS = ("image", "label", "advice", "source", "model_version")
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+class InvalidChunk(ValueError):
+    pass
+
+class SyncGap(ValueError):
+    """Chunk starts past the site's high-water mark: an earlier chunk is missing"""
+
+# --- encoding ---
+
+def _narrow(values):
+    # smallest signed int type holding every value; deltas are mostly tiny
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if not len(values) or (values.min() >= info.min and values.max() <= info.max):
+            return values.astype(dtype)
+    return values
+
+def _dictionary(values):
+    index = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    return _narrow(codes), list(index)
+
+def _image_key(image_path):
+    # content-addressed images travel as their digest, so HQ can re-root them under its own UPLOAD_DIR;
+    # legacy flat uploads have no thumbnail and their site-local path means nothing at HQ
+    return os.path.basename(image_path)[:-len(".jpg")] if thumbnail_path(image_path) else None
+
+def _npy(values):
+    buf = io.BytesIO()
+    np.save(buf, values, allow_pickle=False)
+    return buf.getvalue()
+
+def encode_chunk(rows, origin, after, thumbs=None):
+    """Detection rows (EXPORT_COLUMNS tuples, id order) + {digest: thumbnail bytes} -> .fgs chunk bytes"""
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    null_times = [i for i, r in enumerate(rows) if r[1] is None]
+    micros = np.array([(r[1] - _EPOCH) // _MICROSECOND if r[1] is not None else 0 for r in rows], dtype=np.int64)
+    strings = {
+        "image": [_image_key(r[2]) if r[2] else None for r in rows],
+        "label": [r[3] for r in rows],
+        "advice": [r[5] for r in rows],
+        "source": [r[6] for r in rows],
+        "model_version": [r[7] for r in rows],
+    }
+    columns = {
+        "id": _narrow(np.diff(ids, prepend=after)),
+        "timestamp": _narrow(np.diff(micros, prepend=0)),
+        "confidence": np.array([np.nan if r[4] is None else r[4] for r in rows], dtype=np.float64),
+    }
+    dictionaries = {}
+    for name, values in strings.items():
+        columns[name], dictionaries[name] = _dictionary(values)
+    meta = {
+        "format": FORMAT, "origin": origin, "after": int(after), "last_id": int(ids[-1]), "rows": len(rows),
+        "columns": {name: str(values.dtype) for name, values in columns.items()},
+        "dictionaries": dictionaries, "null_timestamps": null_times,
+    }
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("chunk.json", json.dumps(meta))
+        for name, values in columns.items():
+            zf.writestr(f"{name}.npy", _npy(values))
+        for digest, data in (thumbs or {}).items():
+            zf.writestr(f"thumbs/{digest}.jpg", data, compress_type=zipfile.ZIP_STORED)
+    return buf.getvalue()
+
+def decode_chunk(data):
+    """.fgs chunk bytes -> (meta, row dicts with origin/origin_id, {digest: thumbnail bytes})"""
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            # declared sizes bound every read below, so check them before inflating anything
+            infos = zf.infolist()
+            if sum(info.file_size for info in infos) > SYNC_MAX_UNZIPPED_SIZE:
+                raise InvalidChunk("Sync chunk too large once inflated")
+            meta = json.loads(zf.read("chunk.json"))
+            if meta.get("format") != FORMAT:
+                raise InvalidChunk(f"Unsupported chunk format {meta.get('format')!r}")
+            n = int(meta["rows"])
+            columns = {}
+            for name in meta["columns"]:
+                values = np.load(io.BytesIO(zf.read(f"{name}.npy")), allow_pickle=False)
+                if len(values) != n:
+                    raise InvalidChunk(f"Column {name} has {len(values)} rows, expected {n}")
+                columns[name] = values
+            thumbs = {}
+            for info in infos:
+                name = info.filename
+                digest = name[len("thumbs/"):-len(".jpg")] if name.startswith("thumbs/") else ""
+                if not is_digest(digest):  # anything else (e.g. path tricks) is ignored
+                    continue
+                if info.file_size > SYNC_MAX_THUMB_SIZE:
+                    raise InvalidChunk(f"Thumbnail {digest} is larger than {SYNC_MAX_THUMB_SIZE} bytes")
+                thumbs[digest] = zf.read(info)
+        origin = meta["origin"]
+        meta["after"], meta["last_id"] = int(meta["after"]), int(meta["last_id"])
+        if (columns["id"] <= 0).any():
+            raise InvalidChunk("Invalid sync chunk: ids must increase")
+        ids = np.cumsum(columns["id"].astype(np.int64)) + meta["after"]
+        micros = np.cumsum(columns["timestamp"].astype(np.int64))
+        strings = {name: [meta["dictionaries"][name][c] for c in columns[name].tolist()] for name in STRING_COLUMNS}
+    except InvalidChunk:
+        raise
+    except (zipfile.BadZipFile, KeyError, IndexError, TypeError, ValueError) as e:
+        raise InvalidChunk(f"Invalid sync chunk: {e}")
+    if not origin or not isinstance(origin, str) or (n and int(ids[-1]) != meta["last_id"]):
+        raise InvalidChunk("Invalid sync chunk: bad origin or id range")
+    null_times = set(meta.get("null_timestamps", []))
+    rows = []
+    for i in range(n):
+        confidence = float(columns["confidence"][i])
+        rows.append({
+            "origin": origin,
+            "origin_id": int(ids[i]),
+            "timestamp": None if i in null_times else _EPOCH + timedelta(microseconds=int(micros[i])),
+            "image_path": strings["image"][i],
+            "label": strings["label"][i],
+            "confidence": None if np.isnan(confidence) else confidence,
+            "advice": strings["advice"][i],
+            "source": strings["source"][i],
+            "model_version": strings["model_version"][i],
+        })
+    return meta, rows, thumbs
+
+# --- site side ---
+
+def export_chunk(db, origin=SYNC_ORIGIN, after=0, chunk_rows=SYNC_CHUNK_ROWS, chunk_bytes=SYNC_CHUNK_BYTES):
+    """Next chunk of local rows with id > after as (bytes, last_id, rows), or None when there are none.
+
+    Keyset scan on the primary key, so the cost depends on the chunk, not the table.
+    """
+    stmt = (select(*EXPORT_COLUMNS).where(Detection.origin.is_(None), Detection.id > after)
+            .order_by(Detection.id).limit(max(1, chunk_rows)))
+    rows = db.execute(stmt).all()
+    if not rows:
+        return None
+    thumbs, size = {}, 0
+    for n, row in enumerate(rows, 1):
+        thumb = thumbnail_path(row[2])
+        key = _image_key(row[2]) if thumb else None
+        if key and key not in thumbs:
+            try:
+                with open(thumb, "rb") as f:
+                    thumbs[key] = f.read()
+                size += len(thumbs[key])
+            except OSError:
+                pass  # compacted away: the row still syncs, without a thumbnail
+        if size >= chunk_bytes:
+            rows = rows[:n]
+            break
+    return encode_chunk(rows, origin, after, thumbs), rows[-1][0], len(rows)
+
+def _auth(token):
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+def _request(http, method, url, headers, data=None, retries=SYNC_RETRIES):
+    # retries connection errors and 5xx with backoff; 4xx (bad token, gap) fail straight away
+    import requests
+    for attempt in range(retries + 1):
+        try:
+            response = http.request(method, url, headers=headers, data=data, timeout=SYNC_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code < 500 or attempt == retries:
+                response.raise_for_status()
+                return response
+        time.sleep(min(2 ** attempt, 30))
+
+def push(url, origin=SYNC_ORIGIN, token=SYNC_TOKEN, chunk_rows=SYNC_CHUNK_ROWS, chunk_bytes=SYNC_CHUNK_BYTES,
+         session=None):
+    """Send HQ every local row past its high-water mark for `origin`; returns transfer totals"""
+    import requests
+    http = session or requests.Session()
+    base, headers = url.rstrip("/"), _auth(token)
+    after = _request(http, "GET", f"{base}/sync/origins/{quote(origin, safe='')}", headers).json()["last_id"]
+    totals = {"origin": origin, "chunks": 0, "rows": 0, "inserted": 0, "bytes": 0, "last_id": after}
+    while True:
+        db = SessionLocal()  # fresh read per chunk: no long-lived SQLite read transaction during uploads
+        try:
+            chunk = export_chunk(db, origin, after, chunk_rows, chunk_bytes)
+        finally:
+            db.close()
+        if chunk is None:
+            return totals
+        data, last_id, n = chunk
+        result = _request(http, "POST", f"{base}/sync/chunks",
+                          {**headers, "Content-Type": "application/zip"}, data).json()
+        after = result["last_id"]
+        totals["chunks"] += 1
+        totals["rows"] += n
+        totals["inserted"] += result["inserted"]
+        totals["bytes"] += len(data)
+        totals["last_id"] = after
+
+def _safe_name(origin):
+    return re.sub(r"[^A-Za-z0-9._]", "_", origin)
+
+def chunk_filename(origin, after, last_id):
+    # zero-padded, so sorting names puts a site's chunks in order
+    return f"{_safe_name(origin)}-{after:012d}-{last_id:012d}{CHUNK_SUFFIX}"
+
+def exported_high_water_mark(out_dir, origin):
+    """Last id already exported to out_dir for origin (0 if none), read from the chunk file names"""
+    pattern = re.compile(rf"^{re.escape(_safe_name(origin))}-\d+-(\d+){re.escape(CHUNK_SUFFIX)}$")
+    if not os.path.isdir(out_dir):
+        return 0
+    return max((int(m.group(1)) for m in map(pattern.match, os.listdir(out_dir)) if m), default=0)
+
+def export_to_dir(out_dir, origin=SYNC_ORIGIN, after=None, chunk_rows=SYNC_CHUNK_ROWS, chunk_bytes=SYNC_CHUNK_BYTES):
+    """Write chunk files for rows not yet exported to out_dir; returns (files written, rows)"""
+    os.makedirs(out_dir, exist_ok=True)
+    if after is None:
+        after = exported_high_water_mark(out_dir, origin)
+    files = rows = 0
+    while True:
+        db = SessionLocal()
+        try:
+            chunk = export_chunk(db, origin, after, chunk_rows, chunk_bytes)
+        finally:
+            db.close()
+        if chunk is None:
+            return files, rows
+        data, last_id, n = chunk
+        path = os.path.join(out_dir, chunk_filename(origin, after, last_id))
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)  # a half-written chunk never looks exported
+        files, rows, after = files + 1, rows + n, last_id
+
+class EdgeSync:
+    """Background pushes to SYNC_URL every `interval` seconds (edge mode).
+
+    A failed push (uplink down, HQ restarting) is retried on the next round and
+    resumes from HQ's high-water mark. Only one process per SYNC_LOCK_PATH pushes
+    at a time, so gunicorn workers don't send the same chunks.
+    """
+
+    def __init__(self, url=SYNC_URL, interval=SYNC_INTERVAL, origin=SYNC_ORIGIN, token=SYNC_TOKEN,
+                 lock_path=SYNC_LOCK_PATH):
+        self.url = url
+        self.interval = interval
+        self.origin = origin
+        self.token = token
+        self.lock_path = lock_path
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.rounds = 0
+        self.rows = 0
+        self.errors = 0
+        self.last_id = None
+        self.last_success = None
+        self.last_error = None
+
+    def start(self):
+        if self.url and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="edge-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Stop after the chunk in flight; the next start resumes from HQ's high-water mark"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        with open(self.lock_path, "w") as lock:
+            if fcntl:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return None  # another worker is pushing
+            try:
+                totals = push(self.url, self.origin, self.token)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    self.last_error = f"{type(e).__name__}: {e}"
+                print(f"❌ Sync to {self.url} failed: {e}")
+                return None
+        with self._lock:
+            self.rounds += 1
+            self.rows += totals["rows"]
+            self.last_id = totals["last_id"]
+            self.last_success = time.time()
+            self.last_error = None
+        if totals["rows"]:
+            print(f"✅ Synced {totals['rows']} detections to {self.url} ({totals['bytes'] / 1e6:.1f} MB)")
+        return totals
+
+    def stats(self):
+        with self._lock:
+            return {
+                "url": self.url or None,
+                "origin": self.origin,
+                "interval": self.interval,
+                "rounds": self.rounds,
+                "rows": self.rows,
+                "errors": self.errors,
+                "last_id": self.last_id,
+                "last_success": self.last_success,
+                "last_error": self.last_error,
+            }
+
+# --- HQ side ---
+
+def high_water_mark(db, origin):
+    """Largest site id held for origin (0 if none); served by the (origin, origin_id) index"""
+    return db.execute(select(func.max(Detection.origin_id)).where(Detection.origin == origin)).scalar() or 0
+
+def _synced_image_path(store, key, thumbs):
+    """HQ image_path for a synced row: where its thumbnail lives, or None without one.
+
+    Only the thumbnail is stored here; the path just locates it (thumbnail_path,
+    compaction) and /history never links the full image of a synced row.
+    """
+    if not key or not is_digest(key):
+        return None
+    if key in thumbs:
+        return store.save_thumbnail(key, thumbs[key])
+    path = store.image_path(key)
+    return path if os.path.exists(thumbnail_path(path)) else None
+
+def import_chunk(db, data, store=None):
+    """Insert a chunk's rows past the site's high-water mark, with their thumbnails and rollups.
+
+    One transaction per chunk. Rows already held are skipped, so re-sent or
+    overlapping chunks are harmless; a chunk starting past the mark raises SyncGap.
+    """
+    meta, rows, thumbs = decode_chunk(data)
+    store = store or ImageStore()
+    origin = meta["origin"]
+    for attempt in (1, 2):
+        mark = high_water_mark(db, origin)
+        if meta["after"] > mark:
+            raise SyncGap(f"Chunk for {origin} starts after id {meta['after']}, have up to {mark}")
+        new = [{**r, "image_path": _synced_image_path(store, r["image_path"], thumbs)}
+               for r in rows if r["origin_id"] > mark]
+        try:
+            write_detections(db, new)
+            db.commit()
+            break
+        except IntegrityError:
+            # the same chunk arriving twice at once: re-read the mark and skip what the other one wrote
+            db.rollback()
+            if attempt == 2:
+                raise
+    return {
+        "origin": origin, "after": meta["after"], "rows": len(rows), "inserted": len(new),
+        "skipped": len(rows) - len(new), "last_id": max(mark, meta["last_id"]),
+    }
+
+def import_files(paths, store=None):
+    """Import chunk files in name order; returns (chunks, rows inserted)"""
+    store = store or ImageStore()
+    chunks = inserted = 0
+    db = SessionLocal()
+    try:
+        for path in sorted(paths):
+            with open(path, "rb") as f:
+                result = import_chunk(db, f.read(), store)
+            chunks += 1
+            inserted += result["inserted"]
+            print(f"{os.path.basename(path)}: {result['inserted']} new, {result['skipped']} already here")
+    finally:
+        db.close()
+    return chunks, inserted
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync detections from an edge site to a central instance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("push", help="send new rows to HQ over HTTP (resumes from HQ's high-water mark)")
+    p.add_argument("url", nargs="?", default=SYNC_URL)
+    p.add_argument("--token", default=SYNC_TOKEN)
+    p = sub.add_parser("export", help="write new rows as chunk files")
+    p.add_argument("out_dir")
+    p.add_argument("--after", type=int, help="start after this id (default: last id already in out_dir)")
+    p = sub.add_parser("import", help="load chunk files (run on HQ)")
+    p.add_argument("files", nargs="+")
+    for p in (sub.choices["push"], sub.choices["export"]):
+        p.add_argument("--origin", default=SYNC_ORIGIN, help="this site's name at HQ")
+        p.add_argument("--chunk-rows", type=int, default=SYNC_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    from db import init_db
+    init_db()
+    if args.command == "push":
+        if not args.url:
+            parser.error("push needs a URL (or SYNC_URL)")
+        started = time.perf_counter()
+        t = push(args.url, args.origin, args.token, args.chunk_rows)
+        print(f"✅ {t['rows']} rows in {t['chunks']} chunks ({t['bytes'] / 1e6:.1f} MB, {t['inserted']} new at HQ), "
+              f"up to id {t['last_id']}, {time.perf_counter() - started:.1f}s")
+    elif args.command == "export":
+        files, rows = export_to_dir(args.out_dir, args.origin, args.after, args.chunk_rows)
+        print(f"✅ {rows} rows in {files} chunk files under {args.out_dir}")
+    else:
+        try:
+            chunks, inserted = import_files(args.files)
+        except (InvalidChunk, SyncGap) as e:
+            raise SystemExit(f"❌ {e}")
+        print(f"✅ {inserted} detections imported from {chunks} chunks")
+
+if __name__ == "__main__":
+    main()
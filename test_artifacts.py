@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Tests for the model artifact downloader / cache (artifacts.py)
+Uses a local HTTP server standing in for the model host
+"""
+
+import io
+import os
+import hashlib
+import zipfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+import requests
+from artifacts import ArtifactCache, ArtifactError, Download, resolve_model_path
+
+def make_archive():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("saved_model/saved_model.pb", os.urandom(300_000))
+        zf.writestr("saved_model/variables/variables.index", b"index")
+    return buf.getvalue()
+
+class ModelHost:
+    """Serves one file; optionally without Range support, or failing some Range requests"""
+
+    def __init__(self, data, ranges=True):
+        self.data, self.ranges = data, ranges
+        self.requests = []      # (method, Range header)
+        self.fail_at = set()    # indexes of Range requests to cut off halfway
+        host = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _headers(self, status, length, extra=()):
+                self.send_response(status)
+                self.send_header("Content-Length", str(length))
+                self.send_header("ETag", '"v1"')
+                if host.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                for k, v in extra:
+                    self.send_header(k, v)
+                self.end_headers()
+
+            def do_HEAD(self):
+                host.requests.append(("HEAD", None))
+                self._headers(200, len(host.data))
+
+            def do_GET(self):
+                rng = self.headers.get("Range")
+                host.requests.append(("GET", rng))
+                if not rng or not host.ranges:
+                    self._headers(200, len(host.data))
+                    self.wfile.write(host.data)
+                    return
+                start, end = (int(x) for x in rng.split("=")[1].split("-"))
+                body = host.data[start:end + 1]
+                self._headers(206, len(body), [("Content-Range", f"bytes {start}-{end}/{len(host.data)}")])
+                fail = len(host.range_requests()) - 1 in host.fail_at
+                self.wfile.write(body[:len(body) // 2] if fail else body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/plant_disease_model.zip"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def range_requests(self):
+        return [r for m, r in self.requests if m == "GET" and r]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def archive():
+    data = make_archive()
+    return data, hashlib.sha256(data).hexdigest()
+
+def test_parallel_download_verifies_and_caches(tmp_path, archive):
+    data, digest = archive
+    host = ModelHost(data)
+    try:
+        cache = ArtifactCache(str(tmp_path / "cache"))
+        model_dir = cache.fetch(host.url, "v1", digest, chunk_size=64 * 1024, workers=4)
+        assert len(host.range_requests()) == -(-len(data) // (64 * 1024))
+        with open(os.path.join(model_dir, "saved_model", "variables", "variables.index"), "rb") as f:
+            assert f.read() == b"index"
+        assert cache.manifest("model", "v1")["sha256"] == digest
+
+        # a restart finds the extracted artifact without touching the network
+        host.requests.clear()
+        assert cache.fetch(host.url, "v1", digest) == model_dir
+        assert host.requests == []
+    finally:
+        host.close()
+
+def test_interrupted_download_resumes_missing_chunks(tmp_path, archive):
+    data, digest = archive
+    host = ModelHost(data)
+    try:
+        dest = str(tmp_path / "model.zip")
+        chunks = -(-len(data) // (32 * 1024))
+        host.fail_at = {3}  # the connection drops halfway through the fourth chunk
+        with pytest.raises(requests.RequestException):
+            Download(host.url, dest, digest, chunk_size=32 * 1024, workers=1, retries=1, quiet=True).run()
+        assert not os.path.exists(dest)
+
+        host.requests.clear()
+        assert Download(host.url, dest, digest, chunk_size=32 * 1024, workers=1, quiet=True).run() == digest
+        # the three chunks finished before the failure are not fetched again
+        assert len(host.range_requests()) == chunks - 3
+        with open(dest, "rb") as f:
+            assert f.read() == data
+    finally:
+        host.close()
+
+def test_checksum_mismatch_is_rejected(tmp_path, archive):
+    data, _ = archive
+    host = ModelHost(data)
+    try:
+        dest = str(tmp_path / "model.zip")
+        with pytest.raises(ArtifactError, match="SHA-256 mismatch"):
+            Download(host.url, dest, "0" * 64, quiet=True).run()
+        assert os.listdir(tmp_path) == []
+    finally:
+        host.close()
+
+def test_without_range_support_and_model_path_resolution(tmp_path, archive):
+    data, digest = archive
+    host = ModelHost(data, ranges=False)
+    try:
+        cache = ArtifactCache(str(tmp_path / "cache"))
+        path = resolve_model_path("./model/saved_model", url=host.url, version="v1", sha256=digest, cache=cache)
+        assert path == os.path.join(cache.version_dir("model", "v1"), "model", "saved_model")
+        assert os.path.isfile(os.path.join(path, "saved_model.pb"))
+        assert host.range_requests() == []
+
+        cache.set_current("model", "v1")
+        assert resolve_model_path("./model/saved_model", url="", cache=cache) == path
+    finally:
+        host.close()
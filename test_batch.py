@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for /detect/batch upload handling (app.expand_zip / collect_batch_files)
+One bad zip member must only fail its own item
+"""
+
+import io
+import os
+import struct
+import asyncio
+import tempfile
+import zipfile
+import pytest
+from PIL import Image
+from fastapi import UploadFile
+
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="farmguard-uploads-"))
+import app
+
+def jpeg():
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16), "green").save(buf, "JPEG")
+    return buf.getvalue()
+
+def make_zip(bad=None):
+    """good.jpg followed by bad.jpg, with bad.jpg damaged as named"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("good.jpg", jpeg())
+        zf.writestr("bad.jpg", jpeg())
+    data = bytearray(buf.getvalue())
+    central = data.rfind(b"PK\x01\x02")  # bad.jpg's central directory entry (written last)
+    if bad == "deflate":
+        local = data.rfind(b"PK\x03\x04")
+        name_len, extra_len = struct.unpack("<HH", data[local + 26:local + 30])
+        data[local + 30 + name_len + extra_len] = 0xFF  # block type 3 is invalid -> zlib.error
+    elif bad == "encrypted":
+        data[central + 8] |= 0x01  # RuntimeError: password required
+    elif bad == "method":
+        data[central + 10:central + 12] = struct.pack("<H", 99)  # NotImplementedError
+    return bytes(data)
+
+def collect(*uploads):
+    return asyncio.run(app.collect_batch_files([UploadFile(io.BytesIO(d), filename=n) for n, d in uploads]))
+
+@pytest.mark.parametrize("bad", ["deflate", "encrypted", "method"])
+def test_bad_zip_member_fails_only_its_own_item(bad):
+    items = collect(("plot.zip", make_zip(bad)), ("leaf.jpg", jpeg()))
+    by_name = {name: (data, error) for name, data, error in items}
+    assert set(by_name) == {"plot.zip/good.jpg", "plot.zip/bad.jpg", "leaf.jpg"}
+    assert by_name["plot.zip/good.jpg"][1] is None and by_name["plot.zip/good.jpg"][0] is not None
+    assert by_name["leaf.jpg"][1] is None
+    assert by_name["plot.zip/bad.jpg"][0] is None
+    assert by_name["plot.zip/bad.jpg"][1].startswith("Could not read zip member")
+
+def test_member_check_failure_fails_only_its_own_item(monkeypatch):
+    check_image = app.check_image
+    def flaky_check(data):
+        if data.startswith(b"\xff\xd8\xff") and data.endswith(b"\x00bad"):
+            raise ValueError("decoder blew up")
+        return check_image(data)
+    monkeypatch.setattr(app, "check_image", flaky_check)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("good.jpg", jpeg())
+        zf.writestr("odd.jpg", jpeg() + b"\x00bad")
+        zf.writestr("text.jpg", b"not an image")
+    errors = {name: error for name, _, error in collect(("plot.zip", buf.getvalue()))}
+    assert errors == {"plot.zip/good.jpg": None, "plot.zip/odd.jpg": "Corrupt or truncated image",
+                      "plot.zip/text.jpg": "Only jpeg/png allowed"}
+
+def test_unreadable_archive_is_one_error():
+    items = collect(("plot.zip", b"PK\x03\x04" + b"\x00" * 64), ("leaf.jpg", jpeg()))
+    assert [(n, e) for n, _, e in items] == [("plot.zip", "Invalid zip archive"), ("leaf.jpg", None)]
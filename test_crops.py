@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Tests for vectorized crop recommendation (crops.py)
+Scores must match the original one-crop-at-a-time loop
+"""
+
+import random
+import numpy as np
+from crops import CropTable
+
+def loop_score(table, i, temperature, rainfall, ph, N, P, K):
+    """The original per-crop scoring"""
+    score = 0
+    if table.min_temp[i] <= temperature <= table.max_temp[i]:
+        score += 3
+    elif abs(temperature - (table.min_temp[i] + table.max_temp[i]) / 2) <= 5:
+        score += 2
+    else:
+        score += 1
+    if rainfall >= table.min_rainfall[i]:
+        score += 2
+    if abs(ph - table.optimal_ph[i]) <= 1:
+        score += 2
+    elif abs(ph - table.optimal_ph[i]) <= 2:
+        score += 1
+    if N >= 50 and P >= 30 and K >= 30:
+        score += 2
+    return score
+
+def random_samples(n, seed=3):
+    rng = random.Random(seed)
+    return {"temperature": [rng.uniform(0, 45) for _ in range(n)], "rainfall": [rng.uniform(0, 300) for _ in range(n)],
+            "ph": [rng.uniform(3.5, 9.5) for _ in range(n)], "N": [rng.randint(0, 140) for _ in range(n)],
+            "P": [rng.randint(0, 100) for _ in range(n)], "K": [rng.randint(0, 100) for _ in range(n)]}
+
+def test_scores_match_the_loop():
+    table = CropTable.from_csv()
+    samples = random_samples(200)
+    scores = table.score(samples["temperature"], samples["rainfall"], samples["ph"], samples["N"], samples["P"], samples["K"])
+    assert scores.shape == (200, len(table.names))
+    for s in range(200):
+        sample = [samples[k][s] for k in ("temperature", "rainfall", "ph", "N", "P", "K")]
+        assert scores[s].tolist() == [loop_score(table, i, *sample) for i in range(len(table.names))]
+
+def test_top_k_is_sorted_and_ties_keep_table_order():
+    table = CropTable(["a", "b", "c", "d"], [20] * 4, [30] * 4, [100] * 4, [6.5] * 4)
+    scores = np.array([[5, 7, 7, 1], [2, 2, 2, 2]])
+    order, top = table.top_k(scores, k=3)
+    assert order.tolist() == [[1, 2, 0], [0, 1, 2]]
+    assert top.tolist() == [[7, 7, 5], [2, 2, 2]]
+    assert table.top_k(scores, k=99)[0].shape == (2, 4) and table.top_k(scores, k=0)[0].shape == (2, 1)
+
+def test_recommend_batch_matches_single_samples():
+    table = CropTable.from_csv()
+    samples = random_samples(25, seed=11)
+    batch = table.recommend(samples, k=3)
+    for s, recs in enumerate(batch):
+        single = table.recommend({k: [v[s]] for k, v in samples.items()}, k=3)[0]
+        assert recs == single and len(recs) == 3
+        assert [r["score"] for r in recs] == sorted((r["score"] for r in recs), reverse=True)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for the compiled fertilizer lookup (fertilizer.py)
+The index must pick the same rule as a linear scan over the table
+"""
+
+import random
+import itertools
+from fertilizer import FertilizerIndex, FertilizerRecommender, LEVELS, NUTRIENTS, WILDCARD
+
+def linear_scan(rules, crop, soil, levels):
+    """The reference: most non-"*" columns wins, ties go to the earlier row"""
+    best = None
+    for order, rule in enumerate(rules):
+        values = dict(zip(("crop", "soil", *NUTRIENTS), (crop, soil, *levels)))
+        if all(rule[k] in (WILDCARD, v) for k, v in values.items()):
+            rank = (-sum(rule[k] != WILDCARD for k in values), order)
+            if best is None or rank < best[0]:
+                best = (rank, rule["response"])
+    return best[1] if best else None
+
+def random_rules(n, seed=7):
+    rng = random.Random(seed)
+    crops, soils = ["rice", "maize", "wheat", WILDCARD], ["clay", "loam", WILDCARD]
+    rules = []
+    for i in range(n):
+        rule = {"crop": rng.choice(crops), "soil": rng.choice(soils), "response": {"fertilizer": f"rule {i}"}}
+        for f in NUTRIENTS:
+            rule[f] = rng.choice(LEVELS[f][1] + (WILDCARD,) * 3)
+        rules.append(rule)
+    return rules
+
+def test_index_matches_linear_scan():
+    rules = random_rules(300)
+    index = FertilizerIndex(rules)
+    level_space = list(itertools.product(*(LEVELS[f][1] for f in NUTRIENTS)))
+    for crop, soil in itertools.product(["rice", "maize", "wheat", WILDCARD], ["clay", "loam", WILDCARD]):
+        for levels in level_space:
+            assert index.lookup((crop, soil, *levels)) == linear_scan(rules, crop, soil, levels)
+
+def test_index_size_follows_rule_count():
+    rules = [{"crop": f"crop {i}", "soil": f"soil {i}", "nitrogen": "low", "phosphorus": WILDCARD,
+              "potassium": WILDCARD, "ph": WILDCARD, "response": {"fertilizer": str(i)}} for i in range(2000)]
+    index = FertilizerIndex(rules)
+    assert len(index.index) == 2000 and all(len(best) == 27 for best in index.index.values())
+    assert index.lookup(index.key("Crop  1999", "SOIL 1999", 10, 0, 0, 7))["fertilizer"] == "1999"
+    assert index.lookup(index.key("crop 1", "soil 2", 10, 0, 0, 7)) is None
+
+def test_recommender_uses_bundled_table():
+    rec = FertilizerRecommender.from_csv()
+    low = rec.recommend("Unknown crop", "", 10, 10, 10, 6.5)
+    assert low["levels"] == {"nitrogen": "low", "phosphorus": "low", "potassium": "low", "ph": "neutral"}
+    assert low is rec.recommend("another unknown", "", 20, 15, 5, 7.0)  # equivalent inputs share a cache entry
+    assert rec.stats()["hits"] == 1
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for keyset-paginated /history (history.py)
+"""
+
+import base64
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db import Base
+from db_writer import write_detections
+from history import encode_cursor, decode_cursor, fetch_history, InvalidCursor
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/farmguard.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    start = datetime(2024, 5, 1, 8)
+    # pairs of rows share a timestamp, so paging has to break ties on id
+    write_detections(session, [{"timestamp": start + timedelta(minutes=i // 2), "image_path": f"uploads/{i}.jpg",
+                                "label": "rust" if i % 3 else "blight", "confidence": 0.5, "advice": "a",
+                                "source": "web"} for i in range(11)])
+    session.commit()
+    yield session
+    session.close()
+
+def b64(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def test_cursor_round_trip():
+    ts = datetime(2024, 5, 1, 8, 30, 15, 123456)
+    cursor = encode_cursor(ts, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (ts, 42)
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!", "", b64("2024-05-01T08:00:00"), b64("2024-05-01T08:00:00|forty-two"), b64("yesterday|42"),
+    encode_cursor(datetime(2024, 5, 1), 42)[:-3],
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+def test_pages_cover_every_row_once(db):
+    ids, cursor = [], None
+    while True:
+        page = fetch_history(db, limit=3, before=cursor)
+        ids += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == list(range(11, 0, -1))
+
+    # and back again towards newer rows from the oldest page
+    back = fetch_history(db, limit=4, after=encode_cursor(datetime(2024, 5, 1, 8, 0), 1))
+    assert [item["id"] for item in back["items"]] == [5, 4, 3, 2]
+    assert back["prev_cursor"] is not None
+
+def test_filters_apply_before_paging(db):
+    page = fetch_history(db, limit=2, label="blight")
+    assert [item["id"] for item in page["items"]] == [10, 7]
+    rest = fetch_history(db, limit=2, label="blight", before=page["next_cursor"])
+    assert [item["id"] for item in rest["items"]] == [4, 1] and rest["next_cursor"] is None
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared inference process wire format (inference_server.py, backends.RemoteBackend)
+"""
+
+import socket
+import threading
+from concurrent.futures import Future
+import numpy as np
+import pytest
+from inference_server import InferenceServer, send_array, send_error, recv_array, RemoteInferenceError
+from backends import RemoteBackend
+
+def test_array_round_trip_reuses_buffer():
+    a, b = socket.socketpair()
+    with a, b:
+        pixels = np.arange(2 * 4 * 4 * 3, dtype=np.uint8).reshape(2, 4, 4, 3)
+        send_array(a, pixels)
+        got, buf = recv_array(b)
+        assert got.dtype == np.uint8 and np.array_equal(got, pixels)
+
+        probs = np.asfortranarray(np.random.random((3, 4)).astype(np.float32))  # sent C-ordered
+        send_array(a, probs)
+        got, same = recv_array(b, buf)
+        assert same is buf and np.array_equal(got, probs)
+
+def test_error_and_bad_magic():
+    a, b = socket.socketpair()
+    with a, b:
+        send_error(a, "ValueError: bad batch")
+        with pytest.raises(RemoteInferenceError, match="bad batch"):
+            recv_array(b)
+        a.sendall(b"HTTP/1.1 200 OK\r\n")
+        with pytest.raises(ConnectionError):
+            recv_array(b)
+
+class Scheduler:
+    """Stands in for BatchScheduler: one probability row per image, or an error for empty batches"""
+
+    def submit_many(self, x):
+        future = Future()
+        if len(x) == 0:
+            future.set_exception(ValueError("empty batch"))
+        else:
+            future.set_result(np.tile(np.float32([0.1, 0.2, 0.3, 0.4]), (len(x), 1)) * x.mean(axis=(1, 2, 3))[:, None])
+        return future
+
+def test_remote_backend_through_server(tmp_path):
+    path = str(tmp_path / "inference.sock")
+    server = InferenceServer(path, Scheduler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        backend = RemoteBackend(path, connect_timeout=5)
+        batch = np.full((3, 8, 8, 3), 2, dtype=np.uint8)
+        probs = backend.predict(batch)
+        assert probs.shape == (3, 4) and np.allclose(probs[0], [0.2, 0.4, 0.6, 0.8])
+        with pytest.raises(RemoteInferenceError, match="empty batch"):
+            backend.predict(batch[:0])
+        assert backend.predict(batch[:1]).shape == (1, 4)  # connection still usable after an error
+    finally:
+        server.shutdown()
+        server.server_close()
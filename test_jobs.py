@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for offline detection jobs (jobs.py)
+Runners share one SQLite file; process() is a stand-in for the model
+"""
+
+import io
+import os
+import zipfile
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import sessionmaker
+from db import Base, Detection, Job, JobItem
+import jobs
+from jobs import JobRunner, create_job
+
+def jpeg():
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), "green").save(buf, "JPEG")
+    return buf.getvalue()
+
+def process(blobs, **options):
+    return [({"label": "rust", "confidence": 0.9, "advice": "spray"}, None) for _ in blobs]
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/farmguard.db")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(jobs, "SessionLocal", Session)
+    monkeypatch.setattr(jobs, "JOB_DIR", str(tmp_path / "jobs"))
+    session = Session()
+    yield session
+    session.close()
+
+def submit(n):
+    return create_job([(f"{i}.jpg", io.BytesIO(jpeg())) for i in range(n)])["job_id"]
+
+def test_claim_takes_each_pending_item_once(db):
+    submit(3)
+    runner = JobRunner(process, workers=0, batch_size=2)
+    token_a, first = runner.claim(db)
+    token_b, second = runner.claim(db)
+    assert len(first) == 2 and len(second) == 1 and token_a != token_b
+    assert {i.status for i in first + second} == {"running"}
+    assert runner.claim(db)[1] == []
+
+def test_stale_claims_are_requeued(db):
+    submit(2)
+    runner = JobRunner(process, workers=0, claim_timeout=0)
+    _, items = runner.claim(db)
+    assert runner.requeue_stale(db) == 2
+    assert db.execute(select(JobItem.status, JobItem.claim)).all() == [("pending", None)] * 2
+    assert len(runner.claim(db)[1]) == 2
+
+def test_stale_runner_commit_records_nothing(db):
+    job_id = submit(3)
+    slow = JobRunner(process, workers=0, claim_timeout=0)
+    token, items = slow.claim(db)
+    jobs_ = {job_id: db.get(Job, job_id)}
+    outcomes = {item.id: r for item, r in zip(items, process(items))}
+
+    # the claim times out and another runner finishes the job first
+    slow.requeue_stale(db)
+    assert JobRunner(process, workers=0).run_once() == 3
+    slow._commit(db, token, items, jobs_, outcomes)
+
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert (job.status, job.processed, job.succeeded, job.failed) == ("done", 3, 3, 0)
+    assert db.execute(select(func.count(Detection.id))).scalar() == 3
+    assert not os.path.exists(os.path.join(jobs.JOB_DIR, job_id))
+
+def test_job_with_no_readable_items_is_done_and_cleaned_up(db):
+    status = create_job([("notes.txt", io.BytesIO(b"not an image"))])
+    assert (status["status"], status["failed"], status["total"]) == ("done", 1, 1)
+    assert not os.path.exists(os.path.join(jobs.JOB_DIR, status["job_id"]))
+    assert create_job([])["status"] == "done"
+
+def test_zip_job_opens_its_archive_once(db, monkeypatch):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for i in range(20):
+            zf.writestr(f"season/{i}.jpg", jpeg())
+    job_id = create_job([("season.zip", io.BytesIO(buf.getvalue()))])["job_id"]
+
+    opened = []
+    class CountingZipFile(zipfile.ZipFile):
+        def __init__(self, path, *args, **kwargs):
+            opened.append(path)
+            super().__init__(path, *args, **kwargs)
+    monkeypatch.setattr(jobs.zipfile, "ZipFile", CountingZipFile)
+    runner = JobRunner(process, workers=0, batch_size=4)
+    while runner.run_once():
+        pass
+    runner.close_archives()
+    assert len(opened) == 1
+    assert db.get(Job, job_id).succeeded == 20
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Tests for model hot reload (registry.py)
+A bad manifest entry must never replace a serving model
+"""
+
+import numpy as np
+from model_utils import load_model, LABELS
+from registry import ModelRegistry
+
+class FakeModel:
+    def predict(self, batch):
+        return np.full((len(batch), len(LABELS)), 1.0 / len(LABELS), dtype=np.float32)
+
+def loader(path, fallback=True):
+    # "good" stands in for a real model; every other path goes through the real (strict) loader
+    return FakeModel() if path == "good" else load_model(path, fallback=fallback)
+
+def test_bad_manifest_entry_leaves_serving_models_untouched(tmp_path):
+    registry = ModelRegistry(warmup_batch_sizes=[1], loader=loader)
+    try:
+        active = registry.load("good", "v1")
+        assert registry.active is active
+
+        missing = str(tmp_path / "typo" / "saved_model")
+        registry.apply_manifest({"active": {"version": "v2", "path": missing},
+                                 "candidate": {"version": "v3", "path": missing, "percent": 50}})
+        assert registry.active is active and registry.active.version == "v1"
+        assert registry.candidate is None
+        assert registry.status["state"] == "ready"
+    finally:
+        registry.stop()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for edge sync (sync.py)
+A "site" and an "HQ" instance, each with its own SQLite file and upload dir
+"""
+
+import os
+import hashlib
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import sessionmaker
+from db import Base, Detection, DetectionRollup
+from db_writer import write_detections
+from storage import ImageStore, thumbnail_path
+from history import fetch_history
+import sync
+from sync import encode_chunk, decode_chunk, export_chunk, import_chunk, high_water_mark, SyncGap, InvalidChunk
+
+LABELS = ["healthy", "blight", "rust"]
+
+class Instance:
+    def __init__(self, root):
+        os.makedirs(root, exist_ok=True)
+        engine = create_engine(f"sqlite:///{root}/farmguard.db")
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine)()
+        self.store = ImageStore(os.path.join(root, "uploads"))
+
+    def detect(self, n, start=datetime(2024, 5, 1)):
+        rows = []
+        for i in range(n):
+            digest = hashlib.sha256(f"{self.store.root}/{i}".encode()).hexdigest()
+            path = self.store.save(digest, b"full image", f"thumb {i}".encode())
+            rows.append({"timestamp": start + timedelta(minutes=7 * i), "image_path": path, "label": LABELS[i % 3],
+                         "confidence": 0.5 + i / (4 * n), "advice": f"advice for {LABELS[i % 3]}",
+                         "source": "web", "model_version": "v1"})
+        write_detections(self.db, rows)
+        self.db.commit()
+
+    def chunks(self, origin, after=0, chunk_rows=4):
+        while True:
+            chunk = export_chunk(self.db, origin, after, chunk_rows)
+            if chunk is None:
+                return
+            data, after, _ = chunk
+            yield data
+
+@pytest.fixture
+def site(tmp_path):
+    return Instance(str(tmp_path / "site"))
+
+@pytest.fixture
+def hq(tmp_path):
+    return Instance(str(tmp_path / "hq"))
+
+def test_sync_round_trip(site, hq):
+    site.detect(10)
+    chunks = list(site.chunks("farm-1"))
+    assert len(chunks) == 3
+    for data in chunks:
+        import_chunk(hq.db, data, hq.store)
+
+    cols = (Detection.timestamp, Detection.label, Detection.confidence, Detection.advice, Detection.source,
+            Detection.model_version)
+    sent = site.db.execute(select(Detection.id, *cols).order_by(Detection.id)).all()
+    got = hq.db.execute(select(Detection.origin_id, *cols, Detection.origin, Detection.image_path)
+                        .order_by(Detection.origin_id)).all()
+    assert [tuple(r) for r in sent] == [tuple(r[:7]) for r in got]
+    assert {r.origin for r in got} == {"farm-1"}
+    # thumbnails only, re-rooted under HQ's upload dir
+    for row in got:
+        assert row.image_path.startswith(hq.store.root)
+        assert os.path.exists(thumbnail_path(row.image_path)) and not os.path.exists(row.image_path)
+    assert high_water_mark(hq.db, "farm-1") == sent[-1].id
+    page = fetch_history(hq.db, limit=3)["items"]
+    assert all(item["image_path"] is None and item["thumbnail_path"] for item in page)
+    count = hq.db.execute(select(func.sum(DetectionRollup.count)).where(DetectionRollup.period == "day")).scalar()
+    assert count == 10
+
+def test_resend_is_noop_and_resume_sends_only_the_delta(site, hq):
+    site.detect(6)
+    chunks = list(site.chunks("farm-1"))
+    for data in chunks + chunks:
+        result = import_chunk(hq.db, data, hq.store)
+    assert result["inserted"] == 0 and result["skipped"] == result["rows"]
+
+    site.detect(3, start=datetime(2024, 6, 1))
+    delta = list(site.chunks("farm-1", after=high_water_mark(hq.db, "farm-1")))
+    assert sum(decode_chunk(d)[0]["rows"] for d in delta) == 3
+    for data in delta:
+        import_chunk(hq.db, data, hq.store)
+    assert hq.db.execute(select(func.count(Detection.id))).scalar() == 9
+
+def test_gap_is_refused(site, hq):
+    site.detect(8)
+    first, second = site.chunks("farm-1")
+    with pytest.raises(SyncGap):
+        import_chunk(hq.db, second, hq.store)
+    import_chunk(hq.db, first, hq.store)
+    assert import_chunk(hq.db, second, hq.store)["inserted"] == 4
+
+def test_origins_are_separate(site, hq):
+    site.detect(4)
+    (data,) = site.chunks("farm-1")
+    import_chunk(hq.db, data, hq.store)
+    (other,) = site.chunks("farm-2")
+    assert import_chunk(hq.db, other, hq.store)["inserted"] == 4
+    assert high_water_mark(hq.db, "farm-2") == high_water_mark(hq.db, "farm-1")
+
+def test_chunk_encoding():
+    rows = [(5, datetime(2024, 1, 1, 12), "legacy.jpg", "rust", None, "a", "web", None),
+            (9, None, None, "rust", 0.75, "a", "job", "v2")]
+    meta, decoded, thumbs = decode_chunk(encode_chunk(rows, "farm-1", 3))
+    assert (meta["after"], meta["last_id"], meta["columns"]["id"]) == (3, 9, "int8")
+    assert [r["origin_id"] for r in decoded] == [5, 9]
+    assert decoded[0]["timestamp"] == datetime(2024, 1, 1, 12) and decoded[1]["timestamp"] is None
+    assert decoded[0]["confidence"] is None and decoded[1]["confidence"] == 0.75
+    assert decoded[0]["image_path"] is None and decoded[1]["model_version"] == "v2"  # site-local path not shipped
+    with pytest.raises(InvalidChunk):
+        decode_chunk(b"not a chunk")
+
+def test_oversized_members_are_refused_before_reading(monkeypatch):
+    rows = [(1, datetime(2024, 1, 1), None, "rust", 0.5, "a", "web", "v1")]
+    digest = "ab" * 32
+    bomb = encode_chunk(rows, "farm-1", 0, {digest: bytes(2 * sync.SYNC_MAX_THUMB_SIZE)})
+    with pytest.raises(InvalidChunk, match="Thumbnail"):
+        decode_chunk(bomb)
+    monkeypatch.setattr(sync, "SYNC_MAX_UNZIPPED_SIZE", 1024)
+    with pytest.raises(InvalidChunk, match="too large"):
+        decode_chunk(encode_chunk(rows, "farm-1", 0, {digest: bytes(4096)}))
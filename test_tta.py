@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for test-time augmentation and calibrated results (tta.py, app.detection_result)
+View maps are checked against plain NumPy flips and slicing
+"""
+
+import os
+import tempfile
+import numpy as np
+import pytest
+
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="farmguard-uploads-"))
+from app import detection_result
+from model_utils import LABELS
+from tta import VIEWS, view_maps, augment, calibrate
+
+@pytest.mark.parametrize("tta", [False, True])
+def test_confidence_matches_top_k(tta):
+    probs = np.roll(np.arange(1, len(LABELS) + 1, dtype=np.float32), 2)  # top label isn't the last one
+    probs /= probs.sum()
+    result = detection_result(np.stack([probs, probs]) if tta else probs, tta=tta, top_k=3)
+    assert result["label"] == result["top_k"][0]["label"] == LABELS[int(np.argmax(probs))]
+    assert result["confidence"] == result["top_k"][0]["confidence"]
+    assert result["confidence"] == pytest.approx(float(probs.max()), rel=1e-5)
+
+def test_view_maps_flip_and_keep_indices_in_range():
+    h, w = 6, 9
+    maps = view_maps(h, w)
+    assert maps.shape == (len(VIEWS), h, w)
+    assert maps.min() >= 0 and maps.max() < h * w
+    grid = np.arange(h * w).reshape(h, w)
+    assert np.array_equal(maps[0], grid)          # identity
+    assert np.array_equal(maps[1], grid[:, ::-1])  # horizontal flip
+    assert np.array_equal(maps[2], grid[::-1, :])  # vertical flip
+    assert view_maps(h, w) is maps  # cached per size
+
+def test_zoom_and_rotation_views_stay_centred():
+    h = w = 33
+    maps = view_maps(h, w)
+    centre = (h // 2) * w + w // 2
+    for v, (_, _, zoom, angle) in enumerate(VIEWS):
+        assert maps[v, h // 2, w // 2] == centre
+        if zoom < 1.0:
+            # the zoomed view only samples the middle of the image
+            rows, cols = np.divmod(maps[v], w)
+            assert rows.min() > 0 and cols.min() > 0 and rows.max() < h - 1 and cols.max() < w - 1
+        if angle:
+            assert not np.array_equal(maps[v], maps[0])
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32])
+def test_augment_keeps_dtype_and_gathers_pixels(dtype):
+    img = (np.random.random((1, 10, 12, 3)) * 255).astype(dtype)
+    views = augment(img)
+    assert views.shape == (len(VIEWS), 10, 12, 3) and views.dtype == dtype
+    assert np.array_equal(views[0], img[0])
+    assert np.array_equal(views[1], img[0, :, ::-1])
+    assert np.array_equal(augment(img[0]), views)
+
+def test_calibrate_softens_without_changing_the_ranking():
+    probs = np.array([0.05, 0.8, 0.1, 0.05])
+    assert np.allclose(calibrate(probs, 1.0), probs)
+    soft = calibrate(probs, 2.0)
+    assert soft.sum() == pytest.approx(1.0)
+    assert soft.max() < probs.max() and np.array_equal(np.argsort(soft), np.argsort(probs))
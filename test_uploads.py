@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming upload validation (uploads.py)
+Type comes from magic bytes, size and dimensions are checked before any full decode
+"""
+
+import io
+import asyncio
+import pytest
+from PIL import Image
+from fastapi import HTTPException
+import uploads
+from uploads import sniff_type, image_dimensions, check_image, read_image_upload, BufferPool
+
+def encode(fmt, size=(32, 24)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, "green").save(buf, fmt)
+    return buf.getvalue()
+
+class Upload:
+    """Minimal UploadFile stand-in that records how much was read"""
+
+    def __init__(self, data):
+        self.f = io.BytesIO(data)
+        self.reads = 0
+
+    async def read(self, n=-1):
+        self.reads += 1
+        return self.f.read(n)
+
+def read(data, **kwargs):
+    return asyncio.run(read_image_upload(Upload(data), **kwargs))
+
+@pytest.mark.parametrize("data, expected", [
+    (encode("JPEG"), "image/jpeg"), (encode("PNG"), "image/png"), (b"PK\x03\x04rest", "application/zip"),
+    (encode("GIF"), None), (b"\xff\xd8", None), (b"", None), (memoryview(b"\x89PNG\r\n\x1a\nxx"), "image/png"),
+])
+def test_sniff_type(data, expected):
+    assert sniff_type(data) == expected
+
+def test_dimensions_come_from_the_header():
+    data = encode("PNG", (640, 480))
+    assert image_dimensions(data) == (640, 480)
+    assert image_dimensions(b"\x89PNG\r\n\x1a\n" + b"\x00" * 8) is None
+
+def test_content_type_header_is_not_trusted():
+    gif = encode("GIF")
+    with pytest.raises(HTTPException) as e:
+        read(gif)
+    assert e.value.status_code == 400
+    with pytest.raises(HTTPException) as e:
+        check_image(gif)
+    assert e.value.detail == "Only jpeg/png allowed"
+
+def test_zip_only_where_allowed():
+    archive = b"PK\x03\x04" + b"\x00" * 100
+    with pytest.raises(HTTPException):
+        read(archive)
+    assert read(archive, zip_limit=1000) == (archive, "application/zip")
+
+def test_oversized_upload_stops_reading_early(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_SIZE", 1024)
+    upload = Upload(encode("JPEG") + b"\x00" * 100_000)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(read_image_upload(upload, limit=4096))
+    assert e.value.status_code == 413 and upload.reads <= 5
+
+def test_oversized_dimensions_rejected(monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_IMAGE_PIXELS", 100)
+    with pytest.raises(HTTPException) as e:
+        read(encode("PNG", (20, 20)))
+    assert e.value.status_code == 413
+
+def test_truncated_image_rejected():
+    with pytest.raises(HTTPException) as e:
+        read(encode("JPEG")[:12])
+    assert e.value.detail == "Corrupt or truncated image"
+
+def test_reads_into_pooled_buffer():
+    pool = BufferPool(1, size=uploads.MAX_UPLOAD_SIZE)
+    buf = pool.acquire()
+    assert pool.acquire() is None
+    data = encode("JPEG")
+    view, content_type = read(data, buf=buf)
+    assert isinstance(view, memoryview) and bytes(view) == data and content_type == "image/jpeg"
+    pool.release(buf)
+    assert pool.acquire() is buf
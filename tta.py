@@ -0,0 +1,81 @@
+# tta.py
+import os
+from functools import lru_cache
+import numpy as np
+from model_utils import LABELS, ADVICE
+
+# Test-time augmentation: several views of one image go through a single batched forward pass
+TTA_ROTATION = float(os.getenv("TTA_ROTATION", 10))       # degrees, +/- for the rotated views
+TTA_CROP = float(os.getenv("TTA_CROP", 0.875))            # centre crop fraction for the zoomed views
+TTA_TEMPERATURE = float(os.getenv("TTA_TEMPERATURE", 1.0))  # fit on a validation set; 1.0 = raw probabilities
+
+# (horizontal flip, vertical flip, zoom, rotation in degrees)
+VIEWS = (
+    (False, False, 1.0, 0.0),
+    (True, False, 1.0, 0.0),
+    (False, True, 1.0, 0.0),
+    (False, False, TTA_CROP, 0.0),
+    (True, False, TTA_CROP, 0.0),
+    (False, False, 1.0, TTA_ROTATION),
+    (False, False, 1.0, -TTA_ROTATION),
+    (True, False, 1.0, TTA_ROTATION),
+)
+
+@lru_cache(maxsize=8)
+def view_maps(height, width):
+    """Flat source pixel index (row * W + col) for every output pixel of every view, shape (V, H, W).
+
+    Nearest-neighbour, edges clamped. Computed once per image size, so building
+    all views of an image is a single np.take gather.
+    """
+    cy, cx = (height - 1) / 2.0, (width - 1) / 2.0
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float64)
+    rows, cols = [], []
+    for flip_h, flip_v, zoom, angle in VIEWS:
+        y, x = yy - cy, xx - cx
+        if flip_h:
+            x = -x
+        if flip_v:
+            y = -y
+        t = np.deg2rad(angle)
+        # inverse mapping: output pixel -> where it comes from in the input
+        sy = (np.cos(t) * y - np.sin(t) * x) * zoom + cy
+        sx = (np.sin(t) * y + np.cos(t) * x) * zoom + cx
+        rows.append(np.clip(np.rint(sy), 0, height - 1).astype(np.intp))
+        cols.append(np.clip(np.rint(sx), 0, width - 1).astype(np.intp))
+    return np.stack(rows) * width + np.stack(cols)
+
+def augment(x):
+    """(1, H, W, C) or (H, W, C) image (uint8 pixels or float tensor) -> (len(VIEWS), H, W, C) batch of the same dtype"""
+    img = x[0] if x.ndim == 4 else x
+    height, width, channels = img.shape
+    # np.take on (H*W, C) rows is several times faster than 2-D fancy indexing
+    return np.take(img.reshape(-1, channels), view_maps(height, width), axis=0)
+
+def calibrate(probs, temperature=TTA_TEMPERATURE):
+    """Temperature scaling of probabilities (softmax(log p / T)); T > 1 softens overconfident models"""
+    probs = np.asarray(probs, dtype=np.float64)
+    if temperature == 1.0:
+        return probs / probs.sum(axis=-1, keepdims=True)
+    logits = np.log(np.clip(probs, 1e-12, 1.0)) / temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+def top_labels(probs, k):
+    k = max(1, min(int(k), len(LABELS)))
+    order = np.argsort(-probs, kind="stable")[:k]
+    return [{"label": LABELS[i], "confidence": float(probs[i])} for i in order]
+
+def tta_result(view_probs, top_k=3):
+    """Average the per-view probabilities and build the detect result"""
+    probs = calibrate(np.mean(view_probs, axis=0))
+    top = top_labels(probs, top_k)
+    label = top[0]["label"]
+    return {
+        "label": label,
+        "confidence": top[0]["confidence"],
+        "advice": ADVICE.get(label, "Consult agronomist"),
+        "top_k": top,
+        "tta_views": len(view_probs),
+    }
@@ -0,0 +1,176 @@
+# uploads.py
+import os
+import io
+import threading
+from PIL import Image
+from fastapi import HTTPException
+
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 3145728))
+BATCH_MAX_UPLOAD_SIZE = int(os.getenv("BATCH_MAX_UPLOAD_SIZE", 104857600))  # whole /detect/batch body
+BATCH_MAX_UNZIPPED_SIZE = int(os.getenv("BATCH_MAX_UNZIPPED_SIZE", 209715200))  # zip members of one batch, inflated
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40000000))             # width * height
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 65536))
+MULTIPART_OVERHEAD = 16384  # boundaries + part headers on top of the file itself
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")  # zip members we look at
+
+# decompression bombs are rejected by PIL too, not just by our header check
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"PK\x03\x04", "application/zip"),
+)
+
+def sniff_type(head):
+    """Content type from the leading magic bytes, or None"""
+    for magic, content_type in MAGIC:
+        if bytes(head[:len(magic)]) == magic:
+            return content_type
+    return None
+
+def image_dimensions(data):
+    """(width, height) from the image header only; None if the header isn't complete/readable"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Image dimensions too large")
+    except Exception:
+        return None
+
+def check_dimensions(size):
+    if size is not None and (size[0] <= 0 or size[1] <= 0 or size[0] * size[1] > MAX_IMAGE_PIXELS):
+        raise HTTPException(status_code=413, detail=f"Image dimensions {size[0]}x{size[1]} too large")
+
+def check_image(data):
+    """The checks read_image_upload applies, for images that arrive some other way (zip members)"""
+    if sniff_type(data[:8]) not in ("image/jpeg", "image/png"):
+        raise HTTPException(status_code=400, detail="Only jpeg/png allowed")
+    size = image_dimensions(data)
+    if size is None:
+        raise HTTPException(status_code=400, detail="Corrupt or truncated image")
+    check_dimensions(size)
+
+async def read_image_upload(file, limit=MAX_UPLOAD_SIZE, buf=None, zip_limit=None):
+    """Read an UploadFile in chunks, validating as we go.
+
+    The first chunk is sniffed for JPEG/PNG magic bytes (and checked for
+    oversized dimensions when the header fits in it); reading stops as soon
+    as `limit` is exceeded. When `buf` (a bytearray of at least `limit`
+    bytes) is given, data is copied into it and a memoryview is returned,
+    otherwise bytes. Zip archives are accepted only when `zip_limit` is set,
+    and are limited by it instead. Returns (data, content_type).
+    """
+    first = await file.read(UPLOAD_CHUNK_SIZE)
+    content_type = sniff_type(first)
+    if content_type is None or (content_type == "application/zip" and not zip_limit):
+        raise HTTPException(status_code=400, detail="Only jpeg/png allowed")
+    if content_type == "application/zip":
+        limit = zip_limit
+    else:
+        check_dimensions(image_dimensions(first))
+
+    chunks = None if buf is not None else [first]
+    if buf is not None:
+        if len(first) > limit:
+            raise HTTPException(status_code=413, detail="File too large")
+        buf[:len(first)] = first
+    n = len(first)
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if n + len(chunk) > limit:
+            raise HTTPException(status_code=413, detail="File too large")
+        if buf is not None:
+            buf[n:n + len(chunk)] = chunk
+        else:
+            chunks.append(chunk)
+        n += len(chunk)
+    if n > limit:
+        raise HTTPException(status_code=413, detail="File too large")
+    data = memoryview(buf)[:n] if buf is not None else b"".join(chunks)
+    if content_type != "application/zip":
+        # full header is available now, still no pixel decode
+        size = image_dimensions(data)
+        if size is None:
+            raise HTTPException(status_code=400, detail="Corrupt or truncated image")
+        check_dimensions(size)
+    return data, content_type
+
+class BufferPool:
+    """Fixed set of reusable upload buffers so concurrent uploads don't each allocate their own"""
+
+    def __init__(self, count, size=MAX_UPLOAD_SIZE):
+        self.count = max(1, int(count))
+        self.size = int(size)
+        self._free = []
+        self._allocated = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """A free buffer, allocating lazily up to `count`; None when all are in use"""
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            if self._allocated < self.count:
+                self._allocated += 1
+                return bytearray(self.size)
+        return None
+
+    def release(self, buf):
+        with self._lock:
+            self._free.append(buf)
+
+    def stats(self):
+        with self._lock:
+            return {"buffers": self.count, "allocated": self._allocated, "free": len(self._free), "buffer_size": self.size}
+
+class BodyLimitMiddleware:
+    """ASGI middleware rejecting oversized request bodies before they are parsed.
+
+    `limits` maps path -> max body bytes. Requests with a larger Content-Length
+    get a 413 immediately; bodies without one are counted while streaming and
+    aborted as soon as they pass the limit.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    too_large = int(value) > limit
+                except ValueError:
+                    too_large = False
+                if too_large:
+                    return await self._reject(send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail="File too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = b'{"detail":"File too large"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,63 @@
+# workers.py
+import os
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# CPU-bound detect stages (decode, preprocess, JPEG encode) run here instead of on the event loop
+DETECT_WORKERS = int(os.getenv("DETECT_WORKERS", os.cpu_count() or 2))
+DETECT_QUEUE_SIZE = int(os.getenv("DETECT_QUEUE_SIZE", 32))   # jobs allowed to wait for a free worker
+DETECT_RETRY_AFTER = int(os.getenv("DETECT_RETRY_AFTER", 1))  # seconds, sent with 503
+
+class PoolSaturated(Exception):
+    """Raised when the executor already has max_workers + max_pending jobs in flight"""
+
+class BoundedExecutor:
+    """Thread pool that rejects work instead of queueing without limit"""
+
+    def __init__(self, max_workers=DETECT_WORKERS, max_pending=DETECT_QUEUE_SIZE, name="detect"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(0, int(max_pending))
+        self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated(f"{self.max_workers + self.max_pending} jobs already in flight")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            # run in a copy of the caller's context, so per-request state (profiling.py) follows the work
+            fut = self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        fut.add_done_callback(lambda _: self._release())
+        return fut
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args) on the pool; raises PoolSaturated immediately when full"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+            }